@@ -0,0 +1,276 @@
+import asyncio
+import importlib
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+from jose import JWTError
+
+from .config import settings
+from .tokens import tokens
+
+# Admission control, in front of every route.
+#
+# Rate limits: each caller has a token bucket, refilled at RATE_LIMIT_PER_SECOND
+# up to RATE_LIMIT_BURST. Callers are users when the request carries a valid
+# access token, client IPs otherwise. A request takes its route's cost out of
+# the bucket (RATE_LIMIT_COSTS, 1 by default), so a login, which spends tens
+# of milliseconds in pbkdf2, is worth many searches. An empty bucket is a 429
+# with Retry-After set to when the bucket will have enough again.
+#
+# Concurrency: at most ADMISSION_MAX_CONCURRENT requests run at once per
+# worker, a little under the 40 threads Starlette runs sync handlers on, so
+# overload turns into quick 503s instead of every request queueing for a
+# thread. A short queue absorbs bursts; past it, or after waiting
+# ADMISSION_QUEUE_TIMEOUT_SECONDS, the request is shed.
+#
+# Buckets live in a BucketStore; the default one is per process, so with N
+# workers a caller gets N times the rate. A shared store (e.g. Redis) can be
+# plugged in through RATE_LIMIT_STORE.
+
+# Never limited: health checks and the metrics scrape
+EXEMPT_PATHS = {"/health", "/ready", "/metrics"}
+# Long-lived responses that would hold a concurrency slot for their lifetime
+UNBOUNDED_PATHS = {"/notifications/stream"}
+
+
+class BucketStore:
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        """Take cost tokens from key's bucket: 0 if it had them, else seconds until it will (nothing is taken)."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryBucketStore(BucketStore):
+    """
+    Buckets in an LRU. A bucket that falls off the end was idle the longest
+    and has most likely refilled anyway, so dropping it costs nothing.
+    """
+
+    def __init__(self, max_keys: int = settings.RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            level, updated = self._buckets.get(key, (burst, now))
+            level = min(burst, level + (now - updated) * rate)
+            wait = 0.0
+            if level >= cost:
+                level -= cost
+            else:
+                wait = (cost - level) / rate if rate > 0 else math.inf
+            self._buckets[key] = (level, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"buckets": len(self._buckets), "max_buckets": self.max_keys}
+
+
+def load_store(name: str) -> BucketStore:
+    """ "memory", or "package.module:ClassName" for a custom store."""
+    if name == "memory":
+        return MemoryBucketStore()
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)()
+
+
+class ConcurrencyLimiter:
+    """
+    Slots for requests in flight, with a bounded FIFO of waiters. Only ever
+    touched from the event loop, so no locking; a freed slot goes straight
+    to the first waiter.
+    """
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.peak = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self._admit()
+            return True
+        if len(self._waiters) >= self.max_queue or timeout <= 0:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            # The slot may have been handed over just as the timeout hit
+            return waiter.done() and not waiter.cancelled()
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _admit(self):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+
+    def release(self):
+        self.in_flight -= 1
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._admit()
+                waiter.set_result(None)
+                return
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+
+class AdmissionControl:
+    def __init__(self, store: BucketStore, config=settings):
+        self.store = store
+        self.config = config
+        self.limiter = ConcurrencyLimiter(config.ADMISSION_MAX_CONCURRENT, config.ADMISSION_MAX_QUEUE)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rate_limited: Dict[str, int] = {}
+        self.shed = 0
+
+    def cost(self, method: str, path: str) -> float:
+        return self.config.RATE_LIMIT_COSTS.get(f"{method} {path}", 1.0)
+
+    def check_rate(self, caller: str, method: str, path: str) -> float:
+        """Seconds to wait before retrying, 0 if the request may go ahead."""
+        if not self.config.RATE_LIMIT_ENABLED:
+            return 0.0
+        # A cost above the burst could never be paid
+        cost = min(self.cost(method, path), self.config.RATE_LIMIT_BURST)
+        wait = self.store.take(caller, cost, self.config.RATE_LIMIT_PER_SECOND, self.config.RATE_LIMIT_BURST)
+        if wait:
+            with self._lock:
+                route = f"{method} {path}"
+                self.rate_limited[route] = self.rate_limited.get(route, 0) + 1
+        return wait
+
+    def record_shed(self):
+        with self._lock:
+            self.shed += 1
+
+    def record_admitted(self):
+        with self._lock:
+            self.admitted += 1
+
+    def reset(self):
+        self.store.clear()
+        with self._lock:
+            self.admitted = self.shed = 0
+            self.rate_limited = {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "admitted": self.admitted,
+                "rate_limited": sum(self.rate_limited.values()),
+                "shed": self.shed,
+                "in_flight": self.limiter.in_flight,
+                "peak_in_flight": self.limiter.peak,
+                "queued": self.limiter.queued,
+                "max_concurrent": self.limiter.limit,
+                "rate_limited_by_route": dict(self.rate_limited),
+            }
+        stats.update(self.store.stats())
+        return stats
+
+
+admission = AdmissionControl(load_store(settings.RATE_LIMIT_STORE))
+
+
+def caller_key(scope) -> str:
+    """user:<id> for a valid access token, else ip:<client address>."""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                user = _token_user(token)
+                if user is not None:
+                    return f"user:{user}"
+            break
+    # Behind a proxy this is the real client only if uvicorn trusts the
+    # proxy's X-Forwarded-For (--forwarded-allow-ips, see render.yaml)
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def _token_user(token: str) -> Optional[str]:
+    try:
+        # Verified (and remembered) the same way get_current_user does it, so
+        # a made-up token can't spend someone else's bucket
+        claims = tokens.decode(token)
+    except (JWTError, ValueError):
+        return None
+    user = claims.get("uid") or claims.get("sub")
+    return str(user) if user is not None else None
+
+
+def _reject(status_code: int, detail: str, retry_after: float):
+    body = ('{"detail":"%s"}' % detail).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]
+
+    async def respond(send):
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    return respond
+
+
+class AdmissionMiddleware:
+    """Rate limits and load shedding (see above). Plain ASGI, like InstrumentationMiddleware."""
+
+    def __init__(self, app, control: AdmissionControl = admission):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        wait = self.control.check_rate(caller_key(scope), scope["method"], scope["path"])
+        if wait:
+            return await _reject(429, "Too many requests, slow down", wait)(send)
+
+        if scope["path"] in UNBOUNDED_PATHS:
+            self.control.record_admitted()
+            return await self.app(scope, receive, send)
+
+        if not await self.control.limiter.acquire(self.control.config.ADMISSION_QUEUE_TIMEOUT_SECONDS):
+            self.control.record_shed()
+            return await _reject(503, "Server busy, please retry", 1)(send)
+        self.control.record_admitted()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.limiter.release()
@@ -0,0 +1,70 @@
+import re
+from typing import Optional, Tuple
+
+# Capacities are stored as a number in a base unit per dimension so they can be
+# compared and decremented. Everything a user types is converted on the way in.
+# unit alias -> (base unit, factor to base unit)
+UNITS = {
+    "kg": ("kg", 1.0),
+    "kgs": ("kg", 1.0),
+    "kilogram": ("kg", 1.0),
+    "kilograms": ("kg", 1.0),
+    "quintal": ("kg", 100.0),
+    "quintals": ("kg", 100.0),
+    "t": ("kg", 1000.0),
+    "ton": ("kg", 1000.0),
+    "tons": ("kg", 1000.0),
+    "tonne": ("kg", 1000.0),
+    "tonnes": ("kg", 1000.0),
+    "lb": ("kg", 0.45359237),
+    "lbs": ("kg", 0.45359237),
+    "sqft": ("sqft", 1.0),
+    "sq ft": ("sqft", 1.0),
+    "sq. ft": ("sqft", 1.0),
+    "sq. ft.": ("sqft", 1.0),
+    "square feet": ("sqft", 1.0),
+    "sqm": ("sqft", 10.7639),
+    "sq m": ("sqft", 10.7639),
+    "m3": ("m3", 1.0),
+    "cbm": ("m3", 1.0),
+    "cubic meters": ("m3", 1.0),
+    "cft": ("m3", 0.0283168),
+    "cubic feet": ("m3", 0.0283168),
+    "pallet": ("pallet", 1.0),
+    "pallets": ("pallet", 1.0),
+}
+
+# A bare number ("10") is read as tons, the unit the app uses everywhere else
+DEFAULT_UNIT = "tons"
+
+_CAPACITY_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(.*?)\s*$")
+
+
+def parse_capacity(text: Optional[str]) -> Optional[Tuple[float, str]]:
+    """
+    Parse strings like "10 tons", "500 sq ft" or "2.5t" into (value, base_unit).
+    Returns None if the text can't be understood.
+    """
+    if not text:
+        return None
+    match = _CAPACITY_RE.match(text.lower())
+    if not match:
+        return None
+    number, unit = match.groups()
+    unit = unit or DEFAULT_UNIT
+    if unit not in UNITS:
+        return None
+    base_unit, factor = UNITS[unit]
+    return float(number) * factor, base_unit
+
+
+def normalize_location(text: Optional[str]) -> str:
+    """
+    Key used for indexed origin/destination matching: the city part of the
+    location ("Pune, Maharashtra" -> "pune"), lowercased, punctuation removed.
+    """
+    if not text:
+        return ""
+    city = text.split(",")[0].lower()
+    city = re.sub(r"[^\w\s]", " ", city)
+    return " ".join(city.split())
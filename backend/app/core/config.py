@@ -1,18 +1,150 @@
+from typing import Dict, List, Optional
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Smart Transport Load-Matching System"
     DATABASE_URL: str = "sqlite:///./transport_v4.db" # Default to SQLite for easy dev
+    DATABASE_REPLICA_URLS: List[str] = [] # Read replicas for search, listings and dashboards (see core/replicas.py); JSON in the environment
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0 # A caller's reads stay on the primary this long after their own write; cover replica lag
+
+    # Engine tuning (see core/database.py)
+    DB_ASYNC: bool = False # Async routers on aiosqlite/asyncpg instead of the sync engine
+    DB_ECHO: bool = False # Log every SQL statement
+    DB_LOG_SAMPLE_RATE: float = 0.0 # Or log only this fraction of statements
+    DB_POOL_SIZE: int = 5 # Server databases only
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    SQLITE_WAL: bool = True
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_AUTO_VACUUM: str = "INCREMENTAL" # Only applies to a new database file (or after VACUUM)
+
+    # Startup (see core/migrations.py and core/warmup.py)
+    DB_MIGRATE_ON_STARTUP: bool = True # Dev convenience; deployments run migrate.py first (render.yaml turns this off)
+    BACKGROUND_TASK_DELAY_SECONDS: float = 30.0 # Maintenance jobs (reconcile, lifecycle, retention) first run this long after startup
+
     SECRET_KEY: str = "your-super-secret-key-change-this" # TODO: Change in production
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Token keys and verification (see core/tokens.py)
+    JWT_KEYS: Dict[str, str] = {} # kid -> HMAC secret, or EC key PEM (or .pem path) for ES256; JSON in the environment
+    JWT_SIGNING_KID: str = "" # Key new tokens are signed with; default the first of JWT_KEYS, else SECRET_KEY
+    JWT_VERIFY_CACHE_SIZE: int = 10000 # Recently verified tokens; 0 disables
+    JWT_VERIFY_CACHE_TTL_SECONDS: float = 60.0
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 14
+    REFRESH_TOKEN_PURGE_INTERVAL_SECONDS: float = 3600.0 # Ids of used refresh tokens are dropped once the tokens expire
+
+    # Password hashing (pbkdf2_sha256), see core/security.py
+    PASSWORD_HASH_ROUNDS: int = 29000 # Changing this rehashes passwords on next login
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32
+    PASSWORD_HASH_POOL: str = "thread" # or "process"
+
+    # Admission control (see core/admission.py)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_STORE: str = "memory" # or "package.module:Class"
+    RATE_LIMIT_PER_SECOND: float = 10.0 # Tokens refilled per second, per user (per IP when not logged in)
+    RATE_LIMIT_BURST: float = 60.0 # Bucket size
+    RATE_LIMIT_COSTS: Dict[str, float] = { # "METHOD /path" -> tokens taken; anything else costs 1
+        "POST /auth/token": 5.0,
+        "POST /auth/signup": 5.0,
+        "POST /auth/refresh": 2.0,
+        "GET /trips/": 2.0,
+    }
+    RATE_LIMIT_MAX_KEYS: int = 100000 # Buckets kept in memory
+    ADMISSION_MAX_CONCURRENT: int = 32 # Requests in flight per worker; Starlette's threadpool has 40 threads
+    ADMISSION_MAX_QUEUE: int = 64 # Requests waiting for a slot; more are shed with a 503
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0
+
+    # Authenticated user cache used by get_current_user
+    PRINCIPAL_CACHE_SIZE: int = 10000 # 0 disables the cache
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 5.0 # Invalidation is per process: other workers keep a deleted or changed user this long
+
+    # Request instrumentation (see core/instrumentation.py)
+    METRICS_ENABLED: bool = True # Prometheus-style /metrics
+    SERVER_TIMING: bool = True # Server-Timing header with DB time and query count
+    PROFILE_SAMPLE_RATE: float = 0.0 # Fraction of requests profiled; 0 disables
+    PROFILE_SLOW_MS: float = 500.0 # Profiles of faster requests are discarded
+    PROFILE_DIR: str = "./profiles"
+    PROFILER: str = "cprofile" # or "pyinstrument" (if installed)
+
+    # List endpoints (keyset pagination, see core/pagination.py)
+    PAGE_SIZE_DEFAULT: int = 100
+    PAGE_SIZE_MAX: int = 1000
+
+    # Coordinate search over trips (see core/geo_index.py)
+    GEO_POINT_CELL_DEG: float = 0.1 # ~11 km grid for pickup/drop points
+    GEO_ROUTE_CELL_DEG: float = 1.0 # coarser grid for whole routes (corridor search)
+    GEO_DEFAULT_RADIUS_KM: float = 20.0
+    GEO_MAX_CANDIDATES: int = 5000 # nearest trips handed to the database per search
+    GEO_INDEX_REFRESH_SECONDS: float = 30.0 # picks up trips created by other workers
+
+    # Location autocomplete, typo tolerance and free-text trip search (see core/location_search.py)
+    LOCATION_INDEX_REFRESH_SECONDS: float = 60.0 # picks up locations of trips created by other workers
+    LOCATION_FUZZY_MAX_MATCHES: int = 5 # Known locations an unknown one is widened to
+    LOCATION_FUZZY_MIN_SIMILARITY: float = 0.45 # Trigram similarity that counts as a match, besides 1-2 typos
+    LOCATION_SUGGEST_MAX: int = 20
+    TEXT_SEARCH_MAX_TERMS: int = 8 # Words of ?q= used
+
+    # Trip search result cache (see core/search_cache.py)
+    SEARCH_CACHE_BACKEND: str = "memory" # or "package.module:Class"
+    SEARCH_CACHE_SIZE: int = 2000 # pages; 0 disables caching (ETags still work)
+    SEARCH_CACHE_TTL_SECONDS: float = 60.0 # bounds staleness across workers with the memory backend
     
     # Email Settings (for free Gmail/Outlook SMTP)
     SMTP_SERVER: str = "smtp.gmail.com"
     SMTP_PORT: int = 587
     SMTP_USERNAME: str = "" # Enter your email
     SMTP_PASSWORD: str = "" # Enter your App Password
-    EMAILS_ENABLED: bool = True
+    EMAILS_ENABLED: Optional[bool] = None # Unset: only once SMTP_USERNAME and SMTP_PASSWORD are; true sends without them (e.g. to a local stub server)
+    SMTP_USE_TLS: bool = True # STARTTLS; disable for a local stub SMTP server
+    SMTP_AUTH: bool = True # LOGIN when SMTP_USERNAME and SMTP_PASSWORD are set; disable for servers without AUTH
+    SMTP_FROM: str = "" # Sender address; defaults to SMTP_USERNAME
+    SMTP_TIMEOUT: float = 10.0
+
+    # Pending bookings hold their cargo's capacity on the trip for this long
+    BOOKING_HOLD_MINUTES: int = 60
+    BOOKING_HOLD_SWEEP_SECONDS: float = 60.0
+
+    # Idempotency-Key on POST /bookings/ (see core/idempotency.py)
+    IDEMPOTENCY_TTL_HOURS: float = 24.0 # Retries with the same key within this long get the first response back
+    IDEMPOTENCY_CACHE_SIZE: int = 10000 # In-memory front of the table; 0 disables
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS: float = 3600.0
+
+    # Trip lifecycle scheduler (see core/trip_lifecycle.py)
+    TRIP_LIFECYCLE_INTERVAL_SECONDS: float = 300.0
+    TRIP_EXPIRE_GRACE_MINUTES: int = 60 # Trips close this long after their departure time
+    ARCHIVE_AFTER_DAYS: int = 90 # Closed trips (with their bookings) and read notifications older than this are archived
+    LIFECYCLE_BATCH_SIZE: int = 500 # Rows per transaction
+
+    # Notification push stream (SSE)
+    NOTIFICATION_STREAM_MAX_PENDING: int = 100 # Slow clients are disconnected past this
+    NOTIFICATION_STREAM_HEARTBEAT_SECONDS: float = 15.0
+    NOTIFICATION_STREAM_BACKFILL: int = 100 # Missed notifications replayed on resume are read this many at a time
+    NOTIFICATION_STREAM_TOKEN_SECONDS: int = 60 # Lifetime of the ?stream_token= browsers open the stream with
+
+    # Notification storage (see core/notification_storage.py)
+    NOTIFICATION_RETENTION_DAYS: int = 365 # Older notifications are deleted, read or not, archived or not
+    NOTIFICATION_DELETE_BATCH_SIZE: int = 5000
+    NOTIFICATION_MAINTENANCE_INTERVAL_SECONDS: float = 3600.0 # Retention, partitions and unread counter checks
+    NOTIFICATION_PARTITIONS_AHEAD: int = 2 # Postgres: monthly partitions created in advance
+
+    # Admin dashboard counters are checked against COUNT(*) this often
+    STATS_RECONCILE_INTERVAL_SECONDS: float = 3600.0
+
+    # Background email dispatch (see core/email_dispatcher.py)
+    EMAIL_QUEUE_SIZE: int = 1000
+    EMAIL_WORKERS: int = 2
+    EMAIL_BATCH_SIZE: int = 20
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_BACKOFF_SECONDS: float = 30.0
+    EMAIL_SWEEP_INTERVAL_SECONDS: float = 15.0
+    EMAIL_SEND_LEASE_SECONDS: float = 300.0 # A claimed email is retried by any dispatcher if not recorded sent by then (e.g. after a crash)
+    EMAIL_OUTBOX_RETENTION_DAYS: int = 7 # Sent outbox rows are deleted with the expired notifications
 
     class Config:
         env_file = ".env"
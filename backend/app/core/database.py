@@ -1,12 +1,253 @@
-from sqlmodel import SQLModel, create_engine, Session
-from .config import settings
-from ..models import user, vehicle, trip, booking # Import models to register them
+import logging
+import random
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import CursorResult, make_url
+from sqlalchemy.exc import MultipleResultsFound, NoResultFound
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from .config import settings, Settings
+from .instrumentation import instrument_engine
+from ..models import user, vehicle, trip, booking, notification, stats, archive, idempotency, refresh_token # Import models to register them
+from . import stats_service # Registers the counter maintenance hook
+from . import search_cache # Registers the search cache invalidation hooks
+from . import notification_storage # Unread counter hook and Postgres partitioning DDL
+from . import location_search # Full-text index DDL for trips
+from .replicas import read_router
 
-engine = create_engine(settings.DATABASE_URL, echo=True)
+sql_logger = logging.getLogger("sql")
+
+def _engine_kwargs(config: Settings, is_sqlite: bool) -> dict:
+    kwargs = {"echo": config.DB_ECHO}
+    if is_sqlite:
+        # FastAPI runs sync handlers on a threadpool, so connections move between threads
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        kwargs.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+            pool_recycle=config.DB_POOL_RECYCLE_SECONDS,
+        )
+    return kwargs
+
+def _configure_engine(db_engine, config: Settings, url):
+    if url.get_backend_name() == "sqlite":
+        in_memory = url.database in (None, "", ":memory:")
+
+        @event.listens_for(db_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            # Lets notification retention give deleted space back (see
+            # core/notification_storage.py); has to come first on a new file
+            cursor.execute(f"PRAGMA auto_vacuum={config.SQLITE_AUTO_VACUUM}")
+            if config.SQLITE_WAL and not in_memory:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+            cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+            cursor.close()
+
+    if not config.DB_ECHO and config.DB_LOG_SAMPLE_RATE > 0:
+        rate = config.DB_LOG_SAMPLE_RATE
+
+        @event.listens_for(db_engine, "before_cursor_execute")
+        def log_sampled_statement(conn, cursor, statement, parameters, context, executemany):
+            if random.random() < rate:
+                sql_logger.info(statement)
+
+    # Per-request SQL count/time for /metrics and Server-Timing
+    instrument_engine(db_engine)
+
+def create_db_engine(config: Settings = settings, database_url: str = None):
+    """
+    Build the engine from settings: pool tuning for server databases, WAL and
+    friends for SQLite, and SQL logging that is off unless asked for.
+    database_url defaults to DATABASE_URL (e.g. a replica's instead).
+    """
+    url = make_url(database_url or config.DATABASE_URL)
+    db_engine = create_engine(url, **_engine_kwargs(config, url.get_backend_name() == "sqlite"))
+    _configure_engine(db_engine, config, url)
+    return db_engine
+
+# Async drivers for the sync URLs we are configured with
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+
+def create_async_db_engine(config: Settings = settings, database_url: str = None):
+    """Same database and tuning as create_db_engine, through aiosqlite/asyncpg."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(database_url or config.DATABASE_URL)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    kwargs = _engine_kwargs(config, backend == "sqlite")
+    if backend == "sqlite":
+        # aiosqlite already runs each connection on its own thread
+        kwargs["connect_args"].pop("check_same_thread")
+    db_engine = create_async_engine(url, **kwargs)
+    _configure_engine(db_engine.sync_engine, config, url)
+    return db_engine
+
+engine = create_db_engine(settings)
+
+# Read-only routes only, see core/replicas.py
+replica_engines = [create_db_engine(settings, url) for url in settings.DATABASE_REPLICA_URLS]
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    # Schema changes go through core/migrations.py (python migrate.py)
+    from .migrations import migrate
+    migrate(engine)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+def read_replica(request: Request) -> Optional[int]:
+    # Picked once per request, so its session and a stream of it agree
+    if not hasattr(request.state, "db_replica"):
+        request.state.db_replica = read_router.route(request.scope)
+    return request.state.db_replica
+
+def reading_own_writes(request: Request) -> bool:
+    """True when there are replicas but this caller just wrote, so reads went to the primary."""
+    return bool(read_router.replicas) and read_replica(request) is None
+
+def read_engine(request: Request):
+    """Engine for a read-only request: a replica, or the primary (no replicas, or the caller just wrote)."""
+    replica = read_replica(request)
+    return engine if replica is None else replica_engines[replica]
+
+def get_read_session(request: Request):
+    # For routes that only read; never commit on it
+    with Session(read_engine(request)) as session:
+        yield session
+
+_async_engine = None
+_async_replica_engines: Dict[int, object] = {}
+
+def get_async_engine(replica: Optional[int] = None):
+    global _async_engine
+    if replica is not None:
+        if replica not in _async_replica_engines:
+            _async_replica_engines[replica] = create_async_db_engine(settings, settings.DATABASE_REPLICA_URLS[replica])
+        return _async_replica_engines[replica]
+    if _async_engine is None:
+        _async_engine = create_async_db_engine(settings)
+    return _async_engine
+
+class _BufferedResult:
+    """Rows fetched on the worker thread, so reading them never does IO."""
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return list(self._rows)
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def one(self):
+        if len(self._rows) != 1:
+            raise NoResultFound() if not self._rows else MultipleResultsFound()
+        return self._rows[0]
+
+    def one_or_none(self):
+        if len(self._rows) > 1:
+            raise MultipleResultsFound()
+        return self._rows[0] if self._rows else None
+
+    def __iter__(self):
+        return iter(self._rows)
+
+class ThreadedSession:
+    """
+    The sync Session behind the async session interface: every call that can
+    touch the database runs on the threadpool. Lets async handlers run on the
+    sync engine (DB_ASYNC=false) without a second code path.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def exec(self, statement, **kwargs):
+        return await run_in_threadpool(lambda: _BufferedResult(self.sync_session.exec(statement, **kwargs).all()))
+
+    async def execute(self, statement, params=None, **kwargs):
+        def run():
+            result = self.sync_session.execute(statement, params, **kwargs)
+            # Buffer rows (incl. RETURNING) here; UPDATE/DELETE keep their rowcount.
+            # ORM selects (entities or their columns) always return rows.
+            if isinstance(result, CursorResult) and not result.returns_rows:
+                return result
+            return result.freeze()()
+        return await run_in_threadpool(run)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(lambda: _BufferedResult(self.sync_session.scalars(statement, params, **kwargs).all()))
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def merge(self, instance, **kwargs):
+        return await run_in_threadpool(self.sync_session.merge, instance, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance, **kwargs):
+        await run_in_threadpool(self.sync_session.refresh, instance, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+@asynccontextmanager
+async def async_session(replica: Optional[int] = None):
+    """The session get_async_session yields, for code that needs one outside a request's dependencies."""
+    if settings.DB_ASYNC:
+        async with AsyncSession(get_async_engine(replica), expire_on_commit=False) as session:
+            yield session
+    else:
+        session = Session(engine if replica is None else replica_engines[replica], expire_on_commit=False)
+        try:
+            yield ThreadedSession(session)
+        finally:
+            await run_in_threadpool(session.close)
+
+async def get_async_session():
+    """
+    Session dependency for async handlers. DB_ASYNC picks a real AsyncSession
+    on aiosqlite/asyncpg, otherwise the sync engine on the threadpool.
+    Objects are not expired on commit: attribute access after a commit must
+    not trigger IO on the event loop.
+    """
+    async with async_session() as session:
+        yield session
+
+async def get_async_read_session(request: Request):
+    """get_async_session for routes that only read: on a replica, unless the caller just wrote."""
+    async with async_session(read_replica(request)) as session:
+        yield session
@@ -0,0 +1,63 @@
+from fastapi import Depends, HTTPException, status
+from jose import JWTError
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .database import get_async_session, get_session
+from .principal_cache import principal_cache
+from .security import oauth2_scheme
+from .tokens import ACCESS, tokens
+from ..models.user import User
+
+# Dependencies shared by the routers. Kept out of the routers themselves so
+# they don't import each other.
+
+def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)) -> User:
+    return user_from_token(token, session)
+
+async def get_async_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_async_session)) -> User:
+    """get_current_user for async handlers: the user is loaded into their get_async_session."""
+    user = await session.run_sync(lambda sync_session: user_from_token(token, sync_session))
+    # Hand back the connection a cache miss took: the session lives as long as
+    # the response, which for streamed ones is as long as the client reads
+    await session.commit()
+    return user
+
+def user_from_token(token: str, session: Session, token_type: str = ACCESS) -> User:
+    """The user a token of token_type was issued to; 401 if it isn't valid."""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        # Signature checked once per token and then remembered, see core/tokens.py
+        payload = tokens.decode(token, token_type)
+        email: str = payload.get("sub")
+        if email is None:
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+    
+    cached = principal_cache.get(email)
+    if cached is not None:
+        # Rebuild the user from the snapshot and attach it without a SELECT,
+        # so handlers can still modify and commit it as usual
+        user = User(**cached)
+        make_transient_to_detached(user)
+        return session.merge(user, load=False)
+
+    user_id = payload.get("uid")
+    if user_id is not None:
+        user = session.get(User, user_id)
+        if user is not None and user.email != email:
+            user = None
+    else:
+        # Tokens issued before the uid claim existed
+        statement = select(User).where(User.email == email)
+        user = session.exec(statement).first()
+    if user is None:
+        raise credentials_exception
+    principal_cache.put(email, user.dict(), payload.get("exp"))
+    return user
@@ -0,0 +1,291 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import List, Optional
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from .config import settings
+from ..models.notification import EmailOutbox, OutboxStatus
+
+logger = logging.getLogger("notification_service")
+
+_outbox = EmailOutbox.__table__
+
+
+def emails_enabled() -> bool:
+    if settings.EMAILS_ENABLED is None:
+        return bool(settings.SMTP_USERNAME and settings.SMTP_PASSWORD)
+    return settings.EMAILS_ENABLED
+
+
+def sender() -> str:
+    return settings.SMTP_FROM or settings.SMTP_USERNAME or "noreply@localhost"
+
+
+class SMTPConnectionPool:
+    """
+    Keeps a few logged-in SMTP connections around so workers don't pay for
+    connect + STARTTLS + LOGIN on every email.
+    """
+
+    def __init__(self, size: int, max_idle_seconds: float = 60.0):
+        self.size = size
+        self.max_idle_seconds = max_idle_seconds
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+        if settings.SMTP_USE_TLS:
+            server.starttls()
+        if settings.SMTP_AUTH and settings.SMTP_USERNAME and settings.SMTP_PASSWORD:
+            server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            # Servers drop idle connections, so check stale ones before reuse
+            if time.monotonic() - last_used < self.max_idle_seconds:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._close(server)
+
+    @contextmanager
+    def connection(self):
+        server = self._checkout()
+        try:
+            yield server
+        except Exception:
+            # Possibly broken, or mid-transaction: don't hand it back to the pool
+            self._close(server)
+            raise
+        else:
+            try:
+                self._idle.put_nowait((server, time.monotonic()))
+            except queue.Full:
+                self._close(server)
+
+    def close_all(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(server)
+
+
+class EmailDispatcher:
+    """
+    Drains the EmailOutbox table in the background.
+
+    Request handlers only insert an outbox row and call enqueue(); worker
+    threads pick up ids from a bounded in-memory queue, send them in batches
+    over pooled SMTP connections and record the outcome. A row is claimed
+    with a conditional UPDATE before it is sent, so workers in this or another
+    process that picked up the same id skip it. Failed sends are retried with
+    exponential backoff by the sweeper, which also picks up rows left over
+    from a previous run, dropped because the queue was full, or claimed by a
+    worker that never recorded the outcome.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[int]" = queue.Queue(maxsize=settings.EMAIL_QUEUE_SIZE)
+        self._pending_ids = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._engine = None
+        self.pool = SMTPConnectionPool(size=settings.EMAIL_WORKERS)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self, engine=None):
+        if self.running:
+            return
+        if engine is None:
+            from .database import engine
+        self._engine = engine
+        self._stop.clear()
+        for i in range(settings.EMAIL_WORKERS):
+            t = threading.Thread(target=self._worker, name=f"email-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        sweeper = threading.Thread(target=self._sweeper, name="email-sweeper", daemon=True)
+        sweeper.start()
+        self._threads.append(sweeper)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self.pool.close_all()
+
+    def enqueue(self, outbox_id: int) -> bool:
+        """Hand an outbox row to the workers. Never blocks the caller."""
+        with self._lock:
+            if outbox_id in self._pending_ids:
+                return True
+            try:
+                self._queue.put_nowait(outbox_id)
+            except queue.Full:
+                # Row stays pending in the outbox; the sweeper will retry it
+                logger.warning(f"Email queue full, deferring outbox #{outbox_id}")
+                return False
+            self._pending_ids.add(outbox_id)
+            return True
+
+    def _next_batch(self) -> List[int]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(batch) < settings.EMAIL_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.process(batch)
+            except Exception as e:
+                logger.error(f"Email worker failed on batch {batch}: {e}")
+            finally:
+                with self._lock:
+                    self._pending_ids.difference_update(batch)
+
+    def _sweeper(self):
+        # First pass runs immediately so mail left over from a restart goes out
+        while not self._stop.is_set():
+            try:
+                for outbox_id in self.due_ids():
+                    if not self.enqueue(outbox_id):
+                        break
+            except Exception as e:
+                logger.error(f"Email sweeper failed: {e}")
+            self._stop.wait(settings.EMAIL_SWEEP_INTERVAL_SECONDS)
+
+    def due_ids(self, limit: int = 500) -> List[int]:
+        # Pending rows whose retry is due, and claimed ones whose lease ran out
+        with Session(self._engine) as session:
+            statement = (
+                select(EmailOutbox.id)
+                .where(EmailOutbox.status.in_([OutboxStatus.PENDING.value, OutboxStatus.SENDING.value]))
+                .where(EmailOutbox.next_attempt_at <= datetime.utcnow())
+                .order_by(EmailOutbox.id)
+                .limit(limit)
+            )
+            return list(session.exec(statement).all())
+
+    def claim(self, session: Session, outbox_ids: List[int]) -> List[int]:
+        """
+        Mark the given rows as being sent by this worker, leased for
+        EMAIL_SEND_LEASE_SECONDS, and return the ids it got. Another worker
+        or process that read the same ids from the outbox loses the UPDATE.
+        """
+        now = datetime.utcnow()
+        lease = now + timedelta(seconds=settings.EMAIL_SEND_LEASE_SECONDS)
+        connection = session.connection()
+        claimed = []
+        for outbox_id in outbox_ids:
+            result = connection.execute(
+                update(_outbox)
+                .where(_outbox.c.id == outbox_id)
+                .where(_outbox.c.status.in_([OutboxStatus.PENDING.value, OutboxStatus.SENDING.value]))
+                .where(_outbox.c.next_attempt_at <= now)
+                .values(status=OutboxStatus.SENDING.value, next_attempt_at=lease)
+            )
+            if result.rowcount == 1:
+                claimed.append(outbox_id)
+        session.commit()
+        return claimed
+
+    def process(self, outbox_ids: List[int]):
+        """Send one batch of outbox rows and record the results."""
+        with Session(self._engine) as session:
+            claimed = self.claim(session, outbox_ids)
+            if not claimed:
+                return
+            rows = session.exec(select(EmailOutbox).where(EmailOutbox.id.in_(claimed))).all()
+            error: Optional[Exception] = None
+            try:
+                with self.pool.connection() as server:
+                    for row in rows:
+                        try:
+                            server.sendmail(sender(), row.recipient, self._build_message(row))
+                        except smtplib.SMTPRecipientsRefused as e:
+                            self._record_failure(row, e, permanent=True)
+                            continue
+                        except (smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                            # Refused this message only; the connection is fine for the rest
+                            self._record_failure(row, e, permanent=e.smtp_code >= 500)
+                            continue
+                        row.status = OutboxStatus.SENT
+                        row.sent_at = datetime.utcnow()
+                        row.attempts += 1
+                        logger.info(f"REAL EMAIL SENT to {row.recipient}")
+            except Exception as e:
+                error = e
+            if error is not None:
+                for row in rows:
+                    if row.status == OutboxStatus.SENDING:
+                        self._record_failure(row, error)
+            for row in rows:
+                session.add(row)
+            session.commit()
+
+    def _record_failure(self, row: EmailOutbox, error: Exception, permanent: bool = False):
+        row.attempts += 1
+        row.last_error = str(error)[:500]
+        if permanent or row.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            row.status = OutboxStatus.FAILED
+            logger.error(f"Giving up on email to {row.recipient}: {error}")
+        else:
+            delay = settings.EMAIL_RETRY_BACKOFF_SECONDS * (2 ** (row.attempts - 1))
+            row.status = OutboxStatus.PENDING
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            logger.warning(f"Failed to send email to {row.recipient}, retrying in {delay:.0f}s: {error}")
+
+    @staticmethod
+    def _build_message(row: EmailOutbox) -> str:
+        msg = MIMEMultipart()
+        msg['From'] = sender()
+        msg['To'] = row.recipient
+        msg['Subject'] = row.subject
+        msg.attach(MIMEText(row.body, 'plain'))
+        return msg.as_string()
+
+
+dispatcher = EmailDispatcher()
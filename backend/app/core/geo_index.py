@@ -0,0 +1,252 @@
+import logging
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import or_
+from sqlmodel import Session, select
+
+from .config import settings
+from .search_cache import GEO_TAG, search_cache
+from .tasks import PeriodicTask
+from ..models.trip import Trip, TripStatus
+
+logger = logging.getLogger("geo_index")
+
+Point = Tuple[float, float] # (lat, lon)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 110.57
+KM_PER_DEG_LON = 111.32 # at the equator, times cos(lat)
+
+# Trips that can still become bookable; completed/cancelled ones are dropped.
+# The search query itself still filters on status, so this only bounds memory.
+LIVE_STATUSES = (TripStatus.OPEN, TripStatus.FULL)
+
+
+def haversine_km(a: Point, b: Point) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def segment_distance_km(p: Point, a: Point, b: Point) -> Tuple[float, float]:
+    """
+    Distance from p to the straight route a -> b, and how far along the route
+    (0..1) the closest point is. Flat projection around p: good to a few
+    percent over the distances trucks drive.
+    """
+    scale = math.cos(math.radians(p[0])) * KM_PER_DEG_LON
+    ax, ay = (a[1] - p[1]) * scale, (a[0] - p[0]) * KM_PER_DEG_LAT
+    bx, by = (b[1] - p[1]) * scale, (b[0] - p[0]) * KM_PER_DEG_LAT
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length2))
+    return math.hypot(ax + t * dx, ay + t * dy), t
+
+
+class GeoIndex:
+    """
+    In-process grid index over trip coordinates.
+
+    Pickup and drop points go into fine grid buckets (radius search); each
+    route, as a straight segment, goes into every coarse bucket it crosses
+    (corridor search). Lookups only touch the buckets around the query point
+    and then check exact distances, so cost depends on how many trips are
+    nearby, not on how many exist.
+    """
+
+    def __init__(self, point_cell_deg: float, route_cell_deg: float):
+        self.point_cell = point_cell_deg
+        self.route_cell = route_cell_deg
+        self._lock = threading.Lock()
+        self._trips: Dict[int, Tuple[Optional[float], ...]] = {}
+        self._starts: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self._ends: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self._routes: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        # Largest trip id loaded by refresh(). Trips added directly by this
+        # worker don't move it, so refresh still finds lower ids from others.
+        self.high_water = 0
+
+    # --- cells ---
+
+    @staticmethod
+    def _cell(point: Point, size: float) -> Tuple[int, int]:
+        return int(math.floor(point[0] / size)), int(math.floor(point[1] / size))
+
+    @staticmethod
+    def _cells_around(point: Point, radius_km: float, size: float) -> Iterable[Tuple[int, int]]:
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / (KM_PER_DEG_LON * max(math.cos(math.radians(point[0])), 0.01))
+        lat0, lon0 = GeoIndex._cell((point[0] - dlat, point[1] - dlon), size)
+        lat1, lon1 = GeoIndex._cell((point[0] + dlat, point[1] + dlon), size)
+        for i in range(lat0, lat1 + 1):
+            for j in range(lon0, lon1 + 1):
+                yield i, j
+
+    def _route_cells(self, a: Point, b: Point) -> Set[Tuple[int, int]]:
+        # Sample the segment every half cell; every point on it is then within
+        # a quarter cell of a sample, which corridor() allows for
+        step = self.route_cell / 2
+        n = max(1, int(math.ceil(max(abs(b[0] - a[0]), abs(b[1] - a[1])) / step)))
+        return {
+            self._cell((a[0] + (b[0] - a[0]) * k / n, a[1] + (b[1] - a[1]) * k / n), self.route_cell)
+            for k in range(n + 1)
+        }
+
+    # --- maintenance ---
+
+    def add(self, trip_id: int, start: Optional[Point], end: Optional[Point]):
+        if start is None and end is None:
+            return
+        with self._lock:
+            self._discard(trip_id)
+            self._trips[trip_id] = (*(start or (None, None)), *(end or (None, None)))
+            if start is not None:
+                self._starts[self._cell(start, self.point_cell)].add(trip_id)
+            if end is not None:
+                self._ends[self._cell(end, self.point_cell)].add(trip_id)
+            if start is not None and end is not None:
+                for cell in self._route_cells(start, end):
+                    self._routes[cell].add(trip_id)
+
+    def add_trip(self, trip: Trip):
+        start = (trip.start_lat, trip.start_lon) if trip.start_lat is not None and trip.start_lon is not None else None
+        end = (trip.end_lat, trip.end_lon) if trip.end_lat is not None and trip.end_lon is not None else None
+        self.add(trip.id, start, end)
+        if start is not None or end is not None:
+            # Cached coordinate searches were computed without this trip
+            search_cache.backend.invalidate([GEO_TAG])
+
+    def remove(self, trip_id: int):
+        """Call when a trip is completed or cancelled."""
+        with self._lock:
+            self._discard(trip_id)
+        search_cache.backend.invalidate([GEO_TAG])
+
+    def _discard(self, trip_id: int):
+        coords = self._trips.pop(trip_id, None)
+        if coords is None:
+            return
+        start = coords[:2] if coords[0] is not None else None
+        end = coords[2:] if coords[2] is not None else None
+        buckets = []
+        if start is not None:
+            buckets.append((self._starts, self._cell(start, self.point_cell)))
+        if end is not None:
+            buckets.append((self._ends, self._cell(end, self.point_cell)))
+        if start is not None and end is not None:
+            buckets.extend((self._routes, cell) for cell in self._route_cells(start, end))
+        for index, cell in buckets:
+            ids = index.get(cell)
+            if ids is not None:
+                ids.discard(trip_id)
+                if not ids:
+                    del index[cell]
+
+    def clear(self):
+        with self._lock:
+            self._trips.clear()
+            self._starts.clear()
+            self._ends.clear()
+            self._routes.clear()
+            self.high_water = 0
+
+    def refresh(self, session: Session, batch_size: int = 10000) -> int:
+        """
+        Load live trips newer than anything seen so far. The first call builds
+        the whole index; later ones pick up trips other workers created.
+        """
+        loaded = 0
+        while True:
+            rows = session.exec(
+                select(Trip.id, Trip.start_lat, Trip.start_lon, Trip.end_lat, Trip.end_lon)
+                .where(Trip.id > self.high_water)
+                .where(Trip.status.in_(LIVE_STATUSES))
+                .where(or_(Trip.start_lat.is_not(None), Trip.end_lat.is_not(None)))
+                .order_by(Trip.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            for trip_id, start_lat, start_lon, end_lat, end_lon in rows:
+                start = (start_lat, start_lon) if start_lat is not None and start_lon is not None else None
+                end = (end_lat, end_lon) if end_lat is not None and end_lon is not None else None
+                self.add(trip_id, start, end)
+            with self._lock:
+                self.high_water = max(self.high_water, rows[-1][0])
+            search_cache.backend.invalidate([GEO_TAG])
+            loaded += len(rows)
+        if loaded:
+            logger.info(f"Geo index loaded {loaded} trips ({len(self._trips)} indexed)")
+        return loaded
+
+    # --- queries ---
+
+    def near(self, pickup: Point, drop: Optional[Point] = None, radius_km: float = 20.0) -> List[int]:
+        """Trips starting within radius_km of pickup (and ending near drop, if given), nearest first."""
+        matches = []
+        with self._lock:
+            candidates = set()
+            for cell in self._cells_around(pickup, radius_km, self.point_cell):
+                candidates.update(self._starts.get(cell, ()))
+            if drop is not None:
+                # Cheap set intersection before any distance maths
+                ends = set()
+                for cell in self._cells_around(drop, radius_km, self.point_cell):
+                    ends.update(self._ends.get(cell, ()))
+                candidates &= ends
+            for trip_id in candidates:
+                coords = self._trips[trip_id]
+                distance = haversine_km(pickup, coords[:2])
+                if distance > radius_km:
+                    continue
+                if drop is not None:
+                    drop_distance = haversine_km(drop, coords[2:])
+                    if drop_distance > radius_km:
+                        continue
+                    distance += drop_distance
+                matches.append((distance, trip_id))
+        matches.sort()
+        return [trip_id for _, trip_id in matches[:settings.GEO_MAX_CANDIDATES]]
+
+    def corridor(self, pickup: Point, drop: Point, radius_km: float = 20.0) -> List[int]:
+        """Trips whose route passes within radius_km of pickup and then of drop, closest first."""
+        # A route crossing a bucket has a sample in it within a quarter cell
+        slack_km = self.route_cell / 4 * KM_PER_DEG_LAT * math.sqrt(2)
+        matches = []
+        with self._lock:
+            near_pickup = set()
+            for cell in self._cells_around(pickup, radius_km + slack_km, self.route_cell):
+                near_pickup.update(self._routes.get(cell, ()))
+            candidates = set()
+            for cell in self._cells_around(drop, radius_km + slack_km, self.route_cell):
+                candidates.update(near_pickup.intersection(self._routes.get(cell, ())))
+            for trip_id in candidates:
+                coords = self._trips[trip_id]
+                a, b = coords[:2], coords[2:]
+                pickup_distance, pickup_at = segment_distance_km(pickup, a, b)
+                if pickup_distance > radius_km:
+                    continue
+                drop_distance, drop_at = segment_distance_km(drop, a, b)
+                if drop_distance > radius_km or drop_at < pickup_at:
+                    continue
+                matches.append((pickup_distance + drop_distance, trip_id))
+        matches.sort()
+        return [trip_id for _, trip_id in matches[:settings.GEO_MAX_CANDIDATES]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "trips": len(self._trips),
+                "point_buckets": len(self._starts) + len(self._ends),
+                "route_buckets": len(self._routes),
+                "high_water": self.high_water,
+            }
+
+
+geo_index = GeoIndex(settings.GEO_POINT_CELL_DEG, settings.GEO_ROUTE_CELL_DEG)
+
+# Builds the index at startup, then keeps up with trips created elsewhere
+geo_refresher = PeriodicTask("geo-index-refresh", lambda: settings.GEO_INDEX_REFRESH_SECONDS, geo_index.refresh)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlmodel import Session
+
+from .config import settings
+from .serialization import FastJSONResponse
+from .tasks import PeriodicTask
+from ..models.idempotency import IdempotencyRecord
+
+logger = logging.getLogger("idempotency")
+
+# Idempotency-Key support for POSTs that clients retry (POST /bookings/).
+# The first request with a key runs as usual, and its response is stored
+# under the key in the same transaction as whatever it created. Retries with
+# the key get that response back, marked Idempotent-Replayed, and nothing
+# runs again: no second booking, no second notification. Keys are per user
+# and last IDEMPOTENCY_TTL_HOURS. The table is fronted by an LRU, so a burst
+# of retries costs a dict lookup. Failed requests aren't stored, since they
+# created nothing and a retry may well succeed.
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# (request_hash, status_code, body, expires_at)
+Entry = Tuple[str, int, bytes, datetime]
+
+
+def request_hash(endpoint: str, payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps([endpoint, payload], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.replays = 0
+
+    def remember(self, user_id: int, key: str, entry: Entry):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[(user_id, key)] = entry
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _response(self, entry: Entry, expected_hash: str) -> FastJSONResponse:
+        stored_hash, status_code, body, _ = entry
+        if stored_hash != expected_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        with self._lock:
+            self.replays += 1
+        return FastJSONResponse(body, status_code=status_code, headers={REPLAYED_HEADER: "true"})
+
+    def replay(self, user_id: int, key: str, expected_hash: str) -> Optional[FastJSONResponse]:
+        """The stored response for the key, from memory; None if not there."""
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and entry[3] <= datetime.utcnow():
+                del self._entries[(user_id, key)]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, key))
+            self.hits += 1
+        return self._response(entry, expected_hash)
+
+    def load(self, session: Session, user_id: int, key: str, expected_hash: str) -> Optional[FastJSONResponse]:
+        """The stored response for the key, from the table (e.g. saved by another worker)."""
+        record = session.get(IdempotencyRecord, (user_id, key))
+        if record is None or record.expires_at <= datetime.utcnow():
+            return None
+        entry = (record.request_hash, record.status_code, record.body, record.expires_at)
+        self.remember(user_id, key, entry)
+        return self._response(entry, expected_hash)
+
+    def save(self, session, user_id: int, key: str, expected_hash: str, body: bytes, status_code: int = 200) -> Entry:
+        """Add the response to the caller's transaction; pass the result to remember() after commit."""
+        entry = (expected_hash, status_code, body, datetime.utcnow() + timedelta(seconds=self.ttl_seconds))
+        session.add(IdempotencyRecord(
+            user_id=user_id, key=key, request_hash=expected_hash, status_code=status_code, body=body, expires_at=entry[3],
+        ))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "replays": self.replays,
+            }
+
+
+def purge_expired(session: Session) -> int:
+    table = IdempotencyRecord.__table__
+    purged = session.connection().execute(delete(table).where(table.c.expires_at <= datetime.utcnow())).rowcount
+    session.commit()
+    if purged:
+        logger.info(f"Purged {purged} expired idempotency keys")
+    return purged
+
+
+idempotency = IdempotencyStore(settings.IDEMPOTENCY_CACHE_SIZE, settings.IDEMPOTENCY_TTL_HOURS * 3600)
+
+idempotency_purge = PeriodicTask("idempotency-purge", lambda: settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS, purge_expired)
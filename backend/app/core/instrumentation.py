@@ -0,0 +1,271 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger("instrumentation")
+
+# Request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """Where one request's time went. Shared with the worker threads it uses."""
+
+    __slots__ = ("sql_count", "sql_seconds", "phases")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.phases: Dict[str, float] = {}
+
+
+# Threadpool calls (run_in_threadpool, ThreadedSession) copy the context, so
+# queries made on worker threads still land on the request that asked for them
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block as a named part of the current request (Server-Timing, /metrics)."""
+    stats = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.phases[name] = stats.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+# --- SQL hooks ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._instrumentation_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_count += 1
+        started = getattr(context, "_instrumentation_started", None)
+        if started is not None:
+            stats.sql_seconds += time.perf_counter() - started
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- aggregation ---
+
+class RouteMetrics:
+    __slots__ = ("buckets", "count", "seconds", "sql_count", "sql_seconds", "phases", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.phases: Dict[str, float] = {}
+        self.statuses: Dict[int, int] = {}
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.buckets[bisect_left(BUCKETS, seconds)] += 1
+            metrics.count += 1
+            metrics.seconds += seconds
+            metrics.sql_count += stats.sql_count
+            metrics.sql_seconds += stats.sql_seconds
+            for name, spent in stats.phases.items():
+                metrics.phases[name] = metrics.phases.get(name, 0.0) + spent
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            routes = sorted(self._routes.items())
+            for (method, route), m in routes:
+                labels = f'method="{method}",route="{_escape(route)}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS, m.buckets):
+                    cumulative += n
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m.count}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {m.seconds:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {m.count}")
+            lines += ["# HELP http_requests_total Requests by route and status.", "# TYPE http_requests_total counter"]
+            for (method, route), m in routes:
+                for status, n in sorted(m.statuses.items()):
+                    lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {n}')
+            lines += ["# HELP db_queries_total SQL statements run while serving each route.", "# TYPE db_queries_total counter"]
+            for (method, route), m in routes:
+                lines.append(f'db_queries_total{{method="{method}",route="{_escape(route)}"}} {m.sql_count}')
+            lines += ["# HELP db_query_seconds_total Time spent in SQL while serving each route.", "# TYPE db_query_seconds_total counter"]
+            for (method, route), m in routes:
+                lines.append(f'db_query_seconds_total{{method="{method}",route="{_escape(route)}"}} {m.sql_seconds:.6f}')
+            lines += ["# HELP request_phase_seconds_total Time spent in named phases (e.g. password hashing).", "# TYPE request_phase_seconds_total counter"]
+            for (method, route), m in routes:
+                for name, spent in sorted(m.phases.items()):
+                    lines.append(f'request_phase_seconds_total{{method="{method}",route="{_escape(route)}",phase="{name}"}} {spent:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def gauges(sources: Dict[str, dict]) -> str:
+    """Numeric values of component stats() dicts as gauges, e.g. app_search_cache_hits."""
+    lines = []
+    for component, values in sources.items():
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = re.sub(r"[^a-zA-Z0-9_]", "_", f"app_{component}_{key}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# --- profiling ---
+
+class SlowRequestProfiler:
+    """
+    Profiles a sample of requests and keeps the profile only if the request
+    turned out slow. One at a time: profilers are per thread and concurrent
+    requests on the event loop would mix into the same profile anyway.
+    pyinstrument, if installed and chosen, also follows awaits.
+    """
+
+    def __init__(self):
+        self._busy = threading.Lock()
+
+    def start(self):
+        if settings.PROFILE_SAMPLE_RATE <= 0 or random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            if settings.PROFILER == "pyinstrument":
+                from pyinstrument import Profiler
+                profiler = Profiler(async_mode="enabled")
+                profiler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+            return profiler
+        except Exception as e:
+            logger.warning(f"Profiler unavailable: {e}")
+            self._busy.release()
+            return None
+
+    def finish(self, profiler, method: str, route: str, seconds: float):
+        try:
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+            else:
+                profiler.stop()
+            if seconds * 1000 < settings.PROFILE_SLOW_MS:
+                return
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{re.sub(r'[^a-zA-Z0-9]+', '_', route).strip('_') or 'root'}-{int(seconds * 1000)}ms"
+            if isinstance(profiler, cProfile.Profile):
+                path = os.path.join(settings.PROFILE_DIR, name + ".prof")
+                profiler.dump_stats(path)
+            else:
+                path = os.path.join(settings.PROFILE_DIR, name + ".html")
+                with open(path, "w") as f:
+                    f.write(profiler.output_html())
+            logger.warning(f"Slow request {method} {route} took {seconds * 1000:.0f}ms, profile saved to {path}")
+        finally:
+            self._busy.release()
+
+
+profiler = SlowRequestProfiler()
+
+
+# --- middleware ---
+
+class InstrumentationMiddleware:
+    """
+    Times every HTTP request, counts its SQL, adds a Server-Timing header and
+    feeds the per-route metrics served at /metrics. Plain ASGI so streaming
+    responses (NDJSON, SSE) pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        active_profiler = profiler.start()
+        status_code = 500
+
+        def route_path():
+            route = scope.get("route")
+            return getattr(route, "path", None) or "unmatched"
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.SERVER_TIMING:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"server-timing", server_timing(stats, time.perf_counter() - started).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - started
+            _current.reset(token)
+            route = route_path()
+            if route != "/metrics":
+                metrics.observe(scope["method"], route, status_code, seconds, stats)
+            if active_profiler is not None:
+                profiler.finish(active_profiler, scope["method"], route, seconds)
+
+
+def server_timing(stats: RequestStats, seconds: float) -> str:
+    parts = [f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} queries"']
+    parts += [f"{name};dur={spent * 1000:.1f}" for name, spent in stats.phases.items()]
+    parts.append(f"total;dur={seconds * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,321 @@
+import heapq
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import and_, event, func, literal_column, or_, select, text
+from sqlmodel import Session
+
+from .capacity import normalize_location
+from .config import settings
+from .tasks import PeriodicTask
+from ..models.trip import Trip
+
+logger = logging.getLogger("location_search")
+
+# Location search: what customers type into the from/to boxes.
+#
+# Trips are found by their normalized location keys (start_key/end_key, see
+# core/capacity.py) through ix_trip_search, so a search must name the key
+# exactly. The LocationIndex is the dictionary of keys seen on trips, kept in
+# memory: a typed location that isn't a known key ("Pnue", "Bombay", "Nagpr")
+# is widened to the known keys it most likely means (old city names, typos,
+# prefixes) before the query runs, and /trips/suggest completes prefixes from
+# a trie over it. Locations number in the thousands however many trips there
+# are, so all of this stays well under a millisecond.
+#
+# Free text (?q=) over locations and description goes to the database's own
+# full-text index instead: FTS5 on SQLite, a GIN tsvector index on Postgres.
+
+# Former and alternative names -> current key
+ALIASES = {
+    "bombay": "mumbai",
+    "poona": "pune",
+    "bangalore": "bengaluru",
+    "madras": "chennai",
+    "calcutta": "kolkata",
+    "gurgaon": "gurugram",
+    "baroda": "vadodara",
+    "trivandrum": "thiruvananthapuram",
+    "cochin": "kochi",
+    "mysore": "mysuru",
+    "mangalore": "mangaluru",
+    "belgaum": "belagavi",
+    "vizag": "visakhapatnam",
+    "pondicherry": "puducherry",
+    "benares": "varanasi",
+    "allahabad": "prayagraj",
+    "new delhi": "delhi",
+}
+
+# Candidates (by shared trigrams) checked with the edit distance per lookup
+FUZZY_CANDIDATES = 50
+
+
+def trigrams(key: str) -> Set[str]:
+    """Trigrams of each word, padded like pg_trgm: "pune" -> "  p", " pu", "pun", "une", "ne "."""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Edits (insert, delete, substitute, swap neighbours) from a to b; anything over limit is limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return min(current[-1], limit + 1)
+
+
+def max_typos(key: str) -> int:
+    return 0 if len(key) <= 3 else 1 if len(key) <= 6 else 2
+
+
+class LocationIndex:
+    """
+    Known location keys with how many trips use them, a trigram index for
+    typos and a prefix trie (over every word of a key, so "mum" finds navi
+    mumbai too) for autocomplete. Only ever grows: trips created here add
+    their locations straight away, refresh() picks up counts and other
+    workers' trips, batch by batch above a high water mark.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names: Dict[str, str] = {} # key -> how it's displayed
+        self._counts: Counter = Counter()
+        self._by_trigram: Dict[str, Set[str]] = defaultdict(set)
+        self._trie: dict = {}
+        self._resolved: Dict[str, List[str]] = {}
+        self.high_water = 0
+        self.lookups = 0
+        self.fuzzy_lookups = 0
+
+    # --- building ---
+
+    def add_location(self, location: str, trips: int = 0):
+        key = normalize_location(location)
+        if not key:
+            return
+        with self._lock:
+            self._counts[key] += trips
+            if key in self._names:
+                return
+            city = location.split(",")[0].strip()
+            self._names[key] = city.title() if city in (city.lower(), city.upper()) else city
+            for gram in trigrams(key):
+                self._by_trigram[gram].add(key)
+            words = key.split()
+            for i in range(len(words)):
+                node = self._trie
+                for char in " ".join(words[i:]):
+                    node = node.setdefault(char, {})
+                    node.setdefault("", set()).add(key)
+            # Earlier lookups may have been widened past this key
+            self._resolved.clear()
+
+    def add_trip(self, trip: Trip):
+        self.add_location(trip.start_location)
+        self.add_location(trip.end_location)
+
+    def refresh(self, session: Session, batch_size: int = 100000) -> int:
+        """Count trips above the high water mark; the first call loads everything."""
+        loaded = 0
+        while True:
+            top = session.execute(
+                select(Trip.id).where(Trip.id > self.high_water).order_by(Trip.id).offset(batch_size - 1).limit(1)
+            ).scalar()
+            if top is None:
+                top = session.execute(select(func.max(Trip.id))).scalar()
+            if top is None or top <= self.high_water:
+                break
+            # Grouped in the database: one row per location, not per trip
+            for key_column, name_column in ((Trip.start_key, Trip.start_location), (Trip.end_key, Trip.end_location)):
+                rows = session.execute(
+                    select(func.min(name_column), func.count())
+                    .where(Trip.id > self.high_water, Trip.id <= top)
+                    .group_by(key_column)
+                ).all()
+                for name, count in rows:
+                    self.add_location(name, count)
+            with self._lock:
+                loaded += top - self.high_water
+                self.high_water = top
+        if loaded:
+            logger.info(f"Location index covers trips up to {self.high_water} ({len(self._names)} locations)")
+        return loaded
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+            self._counts.clear()
+            self._by_trigram.clear()
+            self._trie = {}
+            self._resolved.clear()
+            self.high_water = 0
+
+    # --- lookups ---
+
+    def _prefixed(self, prefix: str) -> Set[str]:
+        node = self._trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return set()
+        return node.get("", set())
+
+    def _similar(self, key: str, limit: int) -> List[str]:
+        """Known keys within a typo or two of key, or similar enough by trigrams; closest first."""
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._by_trigram.get(gram, ()))
+        typos = max_typos(key)
+        scored = []
+        for candidate, common in shared.most_common(FUZZY_CANDIDATES):
+            similarity = common / (len(grams) + len(trigrams(candidate)) - common)
+            distance = edit_distance(key, candidate, typos)
+            if distance <= typos or similarity >= settings.LOCATION_FUZZY_MIN_SIMILARITY:
+                scored.append((distance, -similarity, -self._counts[candidate], candidate))
+        return [candidate for *_, candidate in sorted(scored)[:limit]]
+
+    def resolve(self, location: str) -> List[str]:
+        """
+        Keys to search for a typed location: itself if it's known (plus the
+        current name, for an old one), else itself and the known locations
+        it's closest to, then those it is a prefix of.
+        """
+        key = normalize_location(location)
+        with self._lock:
+            self.lookups += 1
+            keys = self._resolved.get(key)
+            if keys is not None:
+                return keys
+            keys = [key]
+            alias = ALIASES.get(key)
+            if alias in self._names and alias != key:
+                keys.append(alias)
+            if key not in self._names and len(keys) == 1 and key:
+                self.fuzzy_lookups += 1
+                limit = settings.LOCATION_FUZZY_MAX_MATCHES
+                keys += self._similar(key, limit)
+                if len(keys) <= limit and len(key) >= 3:
+                    prefixed = heapq.nlargest(limit, self._prefixed(key) - set(keys), key=self._counts.__getitem__)
+                    keys += prefixed[:limit + 1 - len(keys)]
+            if len(self._resolved) >= 10000:
+                self._resolved.clear()
+            self._resolved[key] = keys
+            return keys
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[dict]:
+        """Known locations starting with prefix (any word of them), most used first; typo matches if too few."""
+        key = normalize_location(prefix)
+        if not key:
+            return []
+        with self._lock:
+            ranked = heapq.nlargest(limit, self._prefixed(key), key=lambda k: (k.startswith(key), self._counts[k]))
+            if len(ranked) < limit and len(key) >= 3:
+                ranked += [k for k in self._similar(key, limit) if k not in ranked][:limit - len(ranked)]
+            return [{"location": self._names[k], "key": k, "trips": self._counts[k]} for k in ranked]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "locations": len(self._names),
+                "trigrams": len(self._by_trigram),
+                "high_water": self.high_water,
+                "lookups": self.lookups,
+                "fuzzy_lookups": self.fuzzy_lookups,
+                "resolved_cached": len(self._resolved),
+            }
+
+
+location_index = LocationIndex()
+
+# Loaded by a warm-up step at startup, then kept up with trips created elsewhere
+location_refresher = PeriodicTask("location-index-refresh", lambda: settings.LOCATION_INDEX_REFRESH_SECONDS, location_index.refresh)
+
+
+# --- full-text search over trips ---
+# SQLite: an external-content FTS5 table kept in step with trip by triggers.
+# Postgres: an expression GIN index, which the query repeats word for word.
+# Existing databases got these from migration 5, which keeps its own copy;
+# changing them means a new migration too.
+
+TEXT_DOCUMENT = "start_location || ' ' || end_location || ' ' || coalesce(description, '')"
+
+TEXT_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS trip_fts USING fts5("
+        "start_location, end_location, description, content='trip', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS trip_fts_insert AFTER INSERT ON trip BEGIN "
+        "INSERT INTO trip_fts(rowid, start_location, end_location, description) VALUES (new.id, new.start_location, new.end_location, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS trip_fts_delete AFTER DELETE ON trip BEGIN "
+        "INSERT INTO trip_fts(trip_fts, rowid, start_location, end_location, description) VALUES ('delete', old.id, old.start_location, old.end_location, old.description); END",
+        # Only the indexed columns: capacity and version updates don't touch the index
+        "CREATE TRIGGER IF NOT EXISTS trip_fts_update AFTER UPDATE OF start_location, end_location, description ON trip BEGIN "
+        "INSERT INTO trip_fts(trip_fts, rowid, start_location, end_location, description) VALUES ('delete', old.id, old.start_location, old.end_location, old.description); "
+        "INSERT INTO trip_fts(rowid, start_location, end_location, description) VALUES (new.id, new.start_location, new.end_location, new.description); END",
+    ],
+    "postgresql": [
+        f"CREATE INDEX IF NOT EXISTS ix_trip_text ON trip USING gin (to_tsvector('simple', {TEXT_DOCUMENT}))",
+    ],
+}
+
+
+def create_text_search(connection, rebuild: bool = False):
+    """The full-text index for this database, if it has one; rebuild fills it from existing trips."""
+    for ddl in TEXT_SEARCH_DDL.get(connection.dialect.name, ()):
+        connection.exec_driver_sql(ddl)
+    if rebuild and connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("INSERT INTO trip_fts(trip_fts) VALUES ('rebuild')")
+
+
+@event.listens_for(Trip.__table__, "after_create")
+def _create_trip_text_search(target, connection, **kw):
+    create_text_search(connection)
+
+
+@event.listens_for(Trip.__table__, "before_drop")
+def _drop_trip_text_search(target, connection, **kw):
+    # The Postgres index goes with the table; the FTS5 table wouldn't
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("DROP TABLE IF EXISTS trip_fts")
+
+
+def text_terms(query: Optional[str]) -> List[str]:
+    """Words of a free-text query, each matched as a word prefix."""
+    return re.findall(r"\w+", (query or "").lower())[:settings.TEXT_SEARCH_MAX_TERMS]
+
+
+def text_filter(terms: List[str]):
+    """WHERE clause for trips matching every term, in the dialect of the app's engine."""
+    from .database import engine
+
+    if engine.dialect.name == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        return Trip.id.in_(
+            select(literal_column("rowid")).select_from(text("trip_fts")).where(text("trip_fts MATCH :text_query").bindparams(text_query=match))
+        )
+    if engine.dialect.name == "postgresql":
+        match = " & ".join(f"{term}:*" for term in terms)
+        return text(f"to_tsvector('simple', {TEXT_DOCUMENT}) @@ to_tsquery('simple', :text_query)").bindparams(text_query=match)
+    # No full-text index: a scan, but a correct one
+    columns = (Trip.start_location, Trip.end_location, Trip.description)
+    return and_(*(or_(*(column.ilike(f"%{term}%") for column in columns)) for term in terms))
@@ -0,0 +1,105 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from .capacity import parse_capacity, normalize_location
+from .location_search import location_index, text_filter, text_terms
+from ..models.trip import Trip, TripStatus
+
+# How many index-ordered candidates to look at per requested result. Ranking
+# happens in Python, but only over this bounded window, never the whole table.
+CANDIDATE_FACTOR = 5
+
+
+def prepare_trip(trip: Trip) -> Trip:
+    """Fill in the derived search/capacity columns of a new trip."""
+    trip.start_key = normalize_location(trip.start_location)
+    trip.end_key = normalize_location(trip.end_location)
+    parsed = parse_capacity(trip.available_capacity)
+    if parsed:
+        trip.capacity_value, trip.capacity_unit = parsed
+        trip.remaining_capacity = trip.capacity_value
+    return trip
+
+
+def search_statement(
+    start_location: Optional[str] = None,
+    end_location: Optional[str] = None,
+    min_capacity: Optional[str] = None,
+    earliest: Optional[datetime] = None,
+    base=None,
+    text: Optional[str] = None,
+):
+    """
+    Open trips on a route, written so the database can answer it from
+    ix_trip_search: equality (or a short IN list, for a misspelled location)
+    on (status, start_key, end_key), range on start_datetime. text is matched
+    through the full-text index. base replaces select(Trip), e.g. with a
+    column projection.
+    """
+    statement = (select(Trip) if base is None else base).where(Trip.status == TripStatus.OPEN)
+    if start_location:
+        statement = statement.where(_key_filter(Trip.start_key, start_location))
+    if end_location:
+        statement = statement.where(_key_filter(Trip.end_key, end_location))
+    terms = text_terms(text)
+    if terms:
+        statement = statement.where(text_filter(terms))
+    if earliest:
+        statement = statement.where(Trip.start_datetime >= earliest)
+
+    needed = parse_capacity(min_capacity)
+    if needed:
+        value, unit = needed
+        statement = statement.where(Trip.capacity_unit == unit).where(Trip.remaining_capacity >= value)
+    return statement
+
+
+def _key_filter(column, location: str):
+    keys = location_index.resolve(location)
+    return column == keys[0] if len(keys) == 1 else column.in_(keys)
+
+
+def _score(trip: Trip, needed: Optional[Tuple[float, str]], now: datetime) -> float:
+    # Lower is better. Prefer trips the cargo fills well (less wasted space for
+    # the owner, better price for the customer), then cheaper, then sooner.
+    score = 0.0
+    if needed and trip.remaining_capacity:
+        score += 1.0 - min(needed[0] / trip.remaining_capacity, 1.0)
+    score += trip.price_per_unit / 10000.0
+    days_out = max((trip.start_datetime - now).total_seconds(), 0) / 86400.0
+    score += days_out / 30.0
+    return score
+
+
+def match_statement(
+    start_location: str,
+    end_location: str,
+    cargo_size: Optional[str] = None,
+    earliest: Optional[datetime] = None,
+    limit: int = 20,
+):
+    """Candidate window for match_trips, in index order."""
+    statement = search_statement(start_location, end_location, cargo_size, earliest or datetime.utcnow())
+    return statement.order_by(Trip.start_datetime).limit(limit * CANDIDATE_FACTOR)
+
+
+def rank_trips(candidates: List[Trip], cargo_size: Optional[str] = None, limit: int = 20) -> List[Trip]:
+    """Best of the candidates for a cargo request, ranked by fit, price and departure."""
+    now = datetime.utcnow()
+    needed = parse_capacity(cargo_size)
+    ranked = sorted(candidates, key=lambda trip: _score(trip, needed, now))
+    return ranked[:limit]
+
+
+def match_trips(
+    session: Session,
+    start_location: str,
+    end_location: str,
+    cargo_size: Optional[str] = None,
+    earliest: Optional[datetime] = None,
+    limit: int = 20,
+) -> List[Trip]:
+    candidates = session.exec(match_statement(start_location, end_location, cargo_size, earliest, limit)).all()
+    return rank_trips(candidates, cargo_size, limit)
@@ -0,0 +1,392 @@
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Enum, Float, ForeignKey, Index, Integer, LargeBinary, MetaData, String, Table,
+    func, inspect, literal, select, text, update,
+)
+from sqlmodel import SQLModel
+
+from .capacity import normalize_location, parse_capacity
+
+logger = logging.getLogger("migrations")
+
+# Versioned schema changes. Deployments apply them with migrate.py before
+# the app starts (see render.yaml), instead of the app running create_all on
+# every boot. Each migration runs in its own transaction and is recorded in
+# schema_version. A new database gets the current schema straight from the
+# models and is stamped with the latest version, so migrations only ever run
+# against databases that predate them.
+#
+# To change the schema: change the models, then append a migration that
+# takes an existing database to the same place. Never edit one that shipped.
+# Migrations don't use the models: those move on, and a migration has to do
+# the same thing however old the database it runs on. The tables they touch
+# are written out below as they were when the migration shipped.
+
+_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version", _metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _schema_v1() -> MetaData:
+    """Every table, column and index as of migrations 1-3 (before schema_version)."""
+    metadata = MetaData()
+    Table(
+        "user", metadata,
+        Column("email", String, nullable=False),
+        Column("full_name", String),
+        Column("phone", String),
+        Column("role", Enum("OWNER", "CUSTOMER", "ADMIN", name="role"), nullable=False, default="CUSTOMER"),
+        Column("is_verified", Boolean, nullable=False, default=False),
+        Column("profile_picture", String),
+        Column("id", Integer, primary_key=True),
+        Column("hashed_password", String, nullable=False),
+        Index("ix_user_email", "email", unique=True),
+    )
+    Table(
+        "vehicle", metadata,
+        Column("type", String, nullable=False),
+        Column("capacity", String, nullable=False),
+        Column("registration_number", String, nullable=False, unique=True),
+        Column("id", Integer, primary_key=True),
+        Column("owner_id", Integer, ForeignKey("user.id"), nullable=False),
+        Column("capacity_value", Float),
+        Column("capacity_unit", String),
+    )
+    trip_columns = [
+        Column("start_location", String, nullable=False),
+        Column("end_location", String, nullable=False),
+        Column("start_datetime", DateTime, nullable=False),
+        Column("available_capacity", String, nullable=False),
+        Column("price_per_unit", Float, nullable=False),
+        Column("description", String),
+        Column("status", String, nullable=False, default="open"),
+        Column("start_lat", Float),
+        Column("start_lon", Float),
+        Column("end_lat", Float),
+        Column("end_lon", Float),
+        Column("id", Integer, primary_key=True),
+        Column("vehicle_id", Integer, ForeignKey("vehicle.id"), nullable=False),
+        Column("start_key", String, nullable=False, default=""),
+        Column("end_key", String, nullable=False, default=""),
+        Column("capacity_value", Float),
+        Column("remaining_capacity", Float),
+        Column("capacity_unit", String),
+        Column("version", Integer, nullable=False, default=1),
+    ]
+    Table("trip", metadata, *trip_columns, Index("ix_trip_search", "status", "start_key", "end_key", "start_datetime"))
+    booking_columns = [
+        Column("cargo_size", String, nullable=False),
+        Column("total_price", Float, nullable=False),
+        Column("status", String, nullable=False, default="pending"),
+        Column("id", Integer, primary_key=True),
+        Column("booking_reference", String, nullable=False),
+        Column("trip_id", Integer, ForeignKey("trip.id"), nullable=False),
+        Column("customer_id", Integer, ForeignKey("user.id"), nullable=False),
+        Column("reserved_capacity", Float),
+        Column("hold_expires_at", DateTime),
+    ]
+    Table(
+        "booking", metadata, *booking_columns,
+        Index("ix_booking_booking_reference", "booking_reference", unique=True),
+        Index("ix_booking_hold_expires_at", "hold_expires_at"),
+    )
+    notification_columns = [
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, nullable=False),
+        Column("message", String, nullable=False),
+        Column("type", String, nullable=False, default="general"),
+        Column("is_read", Boolean, nullable=False, default=False),
+        Column("created_at", DateTime, nullable=False),
+    ]
+    Table(
+        "notification", metadata, *notification_columns,
+        Index("ix_notification_user_read_created", "user_id", "is_read", "created_at"),
+        Index("ix_notification_user_id", "user_id"),
+    )
+    Table(
+        "notificationcounter", metadata,
+        Column("user_id", Integer, primary_key=True),
+        Column("unread", Integer, nullable=False, default=0),
+    )
+    Table(
+        "emailoutbox", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("recipient", String, nullable=False),
+        Column("subject", String, nullable=False),
+        Column("body", String, nullable=False),
+        Column("status", String, nullable=False, default="pending"),
+        Column("attempts", Integer, nullable=False, default=0),
+        Column("next_attempt_at", DateTime, nullable=False),
+        Column("last_error", String),
+        Column("created_at", DateTime, nullable=False),
+        Column("sent_at", DateTime),
+        Index("ix_emailoutbox_status", "status"),
+    )
+    Table(
+        "statcounter", metadata,
+        Column("name", String, primary_key=True),
+        Column("value", Integer, nullable=False, default=0),
+    )
+    # Archives: the same columns, no defaults, keys or indexes
+    for name, columns in (("trip", trip_columns), ("booking", booking_columns), ("notification", notification_columns)):
+        Table(
+            f"{name}_archive", metadata,
+            *[Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False, nullable=c.nullable) for c in columns],
+            Column("archived_at", DateTime, nullable=False),
+        )
+    return metadata
+
+
+def _create_tables(connection):
+    # Tables, with their indexes, that don't exist yet. Also how a database
+    # from before schema_version gets adopted: this is what startup used to do.
+    # (A notification table made here on Postgres isn't partitioned; see
+    # core/notification_storage.py for how that case is handled.)
+    _schema_v1().create_all(connection)
+
+
+def _zero(column):
+    if column.default is not None and column.default.is_scalar:
+        return column.default.arg
+    return {str: "", bool: False}.get(column.type.python_type, 0)
+
+
+def _add_missing_columns(connection):
+    # Columns and indexes added to existing tables since the first release
+    # (search keys, parsed capacities, holds, trip versions, ...)
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in _schema_v1().sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column.type.compile(connection.dialect)}"
+            if not column.nullable:
+                default = literal(_zero(column), column.type).compile(connection, compile_kwargs={"literal_binds": True})
+                ddl += f" NOT NULL DEFAULT {default}"
+            connection.exec_driver_sql(ddl)
+            logger.info(f"Added {table.name}.{column.name}")
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _backfill_derived_columns(connection):
+    # What prepare_trip and create_vehicle fill in for new rows. Accepting a
+    # booking didn't use to touch the trip, so what accepted bookings carry
+    # comes off the capacity here, and they keep it reserved the way
+    # reservations.confirm would have (a later reject gives it back).
+    schema = _schema_v1()
+    trips, bookings, counters = (schema.tables[name] for name in ("trip", "booking", "statcounter"))
+    rows = connection.execute(
+        select(trips.c.id, trips.c.start_location, trips.c.end_location, trips.c.available_capacity, trips.c.status)
+        .where(trips.c.start_key == "")
+    ).all()
+    for trip_id, start, end, capacity, status in rows:
+        values = {"start_key": normalize_location(start), "end_key": normalize_location(end)}
+        parsed = parse_capacity(capacity)
+        if parsed:
+            remaining = parsed[0]
+            accepted = connection.execute(
+                select(bookings.c.id, bookings.c.cargo_size)
+                .where(bookings.c.trip_id == trip_id, bookings.c.status == "accepted", bookings.c.reserved_capacity.is_(None))
+            ).all()
+            for booking_id, cargo_size in accepted:
+                cargo = parse_capacity(cargo_size)
+                # Cargo we can't measure against the trip reserves nothing, as in cargo_amount()
+                if cargo is None or cargo[1] != parsed[1]:
+                    continue
+                remaining -= cargo[0]
+                connection.execute(update(bookings).where(bookings.c.id == booking_id).values(reserved_capacity=cargo[0]))
+            values.update(capacity_value=parsed[0], capacity_unit=parsed[1], remaining_capacity=remaining)
+            if remaining <= 0 and status == "open":
+                values["status"] = "full"
+                connection.execute(update(counters).where(counters.c.name == "trips.status.open").values(value=counters.c.value - 1))
+                connection.execute(update(counters).where(counters.c.name == "trips.status.full").values(value=counters.c.value + 1))
+                logger.info(f"Trip {trip_id} is full with its accepted bookings")
+        connection.execute(update(trips).where(trips.c.id == trip_id).values(**values))
+
+    vehicles = schema.tables["vehicle"]
+    rows = connection.execute(
+        select(vehicles.c.id, vehicles.c.capacity).where(vehicles.c.capacity_value.is_(None))
+    ).all()
+    for vehicle_id, capacity in rows:
+        parsed = parse_capacity(capacity)
+        if parsed:
+            connection.execute(update(vehicles).where(vehicles.c.id == vehicle_id).values(capacity_value=parsed[0], capacity_unit=parsed[1]))
+
+
+def _unique_pending_bookings(connection):
+    # Idempotency keys, and at most one pending booking per customer and trip.
+    # Later duplicates of a pending booking are rejected (giving back what they
+    # held) to make room for the unique index; the first one stays, and the
+    # customer is told which of theirs were declined and why.
+    metadata = _schema_v1()
+    Table(
+        "idempotencyrecord", metadata,
+        Column("user_id", Integer, primary_key=True, autoincrement=False),
+        Column("key", String(255), primary_key=True),
+        Column("request_hash", String, nullable=False),
+        Column("status_code", Integer, nullable=False),
+        Column("body", LargeBinary, nullable=False),
+        Column("created_at", DateTime, nullable=False),
+        Column("expires_at", DateTime, nullable=False),
+        Index("ix_idempotencyrecord_expires_at", "expires_at"),
+    ).create(connection, checkfirst=True)
+    bookings, trips, counters = (metadata.tables[name] for name in ("booking", "trip", "statcounter"))
+    notifications, unread = metadata.tables["notification"], metadata.tables["notificationcounter"]
+
+    def bump(name, delta):
+        connection.execute(update(counters).where(counters.c.name == name).values(value=counters.c.value + delta))
+
+    def notify(user_id, message):
+        connection.execute(notifications.insert().values(
+            user_id=user_id, message=message, type="general", is_read=False, created_at=datetime.utcnow(),
+        ))
+        if not connection.execute(update(unread).where(unread.c.user_id == user_id).values(unread=unread.c.unread + 1)).rowcount:
+            connection.execute(unread.insert().values(user_id=user_id, unread=1))
+
+    seen = {}
+    rows = connection.execute(
+        select(bookings.c.id, bookings.c.customer_id, bookings.c.trip_id, bookings.c.reserved_capacity)
+        .where(bookings.c.status == "pending")
+        .order_by(bookings.c.id)
+    ).all()
+    for booking_id, customer_id, trip_id, reserved in rows:
+        if (customer_id, trip_id) in seen:
+            connection.execute(
+                update(bookings).where(bookings.c.id == booking_id)
+                .values(status="rejected", reserved_capacity=None, hold_expires_at=None)
+            )
+            bump("bookings.status.pending", -1)
+            bump("bookings.status.rejected", 1)
+            if reserved is not None:
+                reopened = connection.execute(
+                    update(trips)
+                    .where(trips.c.id == trip_id, trips.c.status == "full", trips.c.remaining_capacity + reserved > 0)
+                    .values(status="open")
+                ).rowcount
+                if reopened:
+                    bump("trips.status.full", -1)
+                    bump("trips.status.open", 1)
+                connection.execute(
+                    update(trips).where(trips.c.id == trip_id, trips.c.remaining_capacity.is_not(None))
+                    .values(remaining_capacity=trips.c.remaining_capacity + reserved, version=trips.c.version + 1)
+                )
+            kept = seen[(customer_id, trip_id)]
+            notify(customer_id, f"Your booking #{booking_id} was declined: booking #{kept} for the same trip is still pending.")
+            logger.warning(f"Rejected duplicate pending booking {booking_id} of customer {customer_id} (kept #{kept})")
+            continue
+        seen[(customer_id, trip_id)] = booking_id
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_booking_pending_customer_trip "
+        "ON booking (customer_id, trip_id) WHERE status = 'pending'"
+    ))
+
+
+_TRIP_TEXT_DOCUMENT = "start_location || ' ' || end_location || ' ' || coalesce(description, '')"
+
+# core/location_search.py's TEXT_SEARCH_DDL as migration 5 shipped it
+_TRIP_TEXT_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS trip_fts USING fts5("
+        "start_location, end_location, description, content='trip', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS trip_fts_insert AFTER INSERT ON trip BEGIN "
+        "INSERT INTO trip_fts(rowid, start_location, end_location, description) VALUES (new.id, new.start_location, new.end_location, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS trip_fts_delete AFTER DELETE ON trip BEGIN "
+        "INSERT INTO trip_fts(trip_fts, rowid, start_location, end_location, description) VALUES ('delete', old.id, old.start_location, old.end_location, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS trip_fts_update AFTER UPDATE OF start_location, end_location, description ON trip BEGIN "
+        "INSERT INTO trip_fts(trip_fts, rowid, start_location, end_location, description) VALUES ('delete', old.id, old.start_location, old.end_location, old.description); "
+        "INSERT INTO trip_fts(rowid, start_location, end_location, description) VALUES (new.id, new.start_location, new.end_location, new.description); END",
+    ],
+    "postgresql": [
+        f"CREATE INDEX IF NOT EXISTS ix_trip_text ON trip USING gin (to_tsvector('simple', {_TRIP_TEXT_DOCUMENT}))",
+    ],
+}
+
+
+def _trip_text_search(connection):
+    # Full-text index over trip locations and description, filled from what's there
+    for ddl in _TRIP_TEXT_SEARCH_DDL.get(connection.dialect.name, ()):
+        connection.exec_driver_sql(ddl)
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("INSERT INTO trip_fts(trip_fts) VALUES ('rebuild')")
+
+
+def _spent_refresh_tokens(connection):
+    # Refresh tokens become single use: the ids of used ones (core/refresh_tokens.py)
+    metadata = MetaData()
+    Table(
+        "spentrefreshtoken", metadata,
+        Column("jti", String(64), primary_key=True),
+        Column("user_id", Integer, nullable=False),
+        Column("spent_at", DateTime, nullable=False),
+        Column("expires_at", DateTime, nullable=False),
+        Index("ix_spentrefreshtoken_user_id", "user_id"),
+        Index("ix_spentrefreshtoken_expires_at", "expires_at"),
+    ).create(connection, checkfirst=True)
+
+
+# (version, name, fn(connection)), in order
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "create_tables", _create_tables),
+    (2, "add_missing_columns", _add_missing_columns),
+    (3, "backfill_derived_columns", _backfill_derived_columns),
+    (4, "unique_pending_bookings", _unique_pending_bookings),
+    (5, "trip_text_search", _trip_text_search),
+    (6, "spent_refresh_tokens", _spent_refresh_tokens),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+def current_version(connection) -> int:
+    """Latest applied migration, 0 for a database from before schema_version, None for an empty one."""
+    inspector = inspect(connection)
+    if inspector.has_table(schema_version.name):
+        return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    if any(inspector.has_table(name) for name in _schema_v1().tables):
+        return 0
+    return None
+
+
+def pending(engine) -> List[Tuple[int, str, Callable]]:
+    with engine.connect() as connection:
+        version = current_version(connection)
+    if version is None:
+        return MIGRATIONS
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def migrate(engine) -> List[str]:
+    """Bring the database up to HEAD; names of the migrations applied."""
+    with engine.begin() as connection:
+        version = current_version(connection)
+        _metadata.create_all(connection)
+        if version is None:
+            # Empty database: the models are the latest schema
+            SQLModel.metadata.create_all(connection)
+            connection.execute(schema_version.insert().values(version=HEAD, name="initial", applied_at=datetime.utcnow()))
+            logger.info(f"Created schema at version {HEAD}")
+            return ["initial"]
+
+    applied = []
+    for number, name, fn in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as connection:
+            fn(connection)
+            connection.execute(schema_version.insert().values(version=number, name=name, applied_at=datetime.utcnow()))
+        logger.info(f"Applied migration {number} {name}")
+        applied.append(name)
+    return applied
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Dict, Set
+
+from .config import settings
+
+
+class Subscription:
+    """One connected client. Lives on the event loop that created it."""
+
+    def __init__(self, user_id: int, max_pending: int):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def offer(self, event: dict):
+        # Runs on self.loop. A client that can't keep up is cut off rather than
+        # buffered without limit; it reconnects with Last-Event-ID and catches
+        # up from the database.
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class NotificationHub:
+    """In-process fan-out of new notifications to connected stream clients."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.max_pending)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            # Safe to call twice: only the first call counts
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+            if subscription.overflowed:
+                self.overflows += 1
+
+    def publish(self, user_id: int, event: dict):
+        """Safe to call from any thread, including sync request handlers."""
+        with self._lock:
+            self.published += 1
+            subscribers = list(self._subscribers.get(user_id, ()))
+            self.delivered += len(subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Loop already closed (shutdown); nothing to deliver to
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connected_clients": sum(len(s) for s in self._subscribers.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+                "slow_client_disconnects": self.overflows,
+            }
+
+
+hub = NotificationHub(settings.NOTIFICATION_STREAM_MAX_PENDING)
@@ -7,46 +7,58 @@ handler = logging.StreamHandler()
 handler.setFormatter(logging.Formatter('%(asctime)s - [NOTIFICATION] - %(message)s'))
 logger.addHandler(handler)
 
+from typing import Iterable, Optional, Tuple
 from sqlmodel import Session
-from ..models.notification import Notification
+from ..models.notification import Notification, EmailOutbox
+from .email_dispatcher import dispatcher, emails_enabled
+from .notification_hub import hub
 
 def send_notification(phone: str, email: str, message: str, user_id: int, session: Session):
     """
     Simulates sending a real-time notification to SMS and Email.
-    Saves to DB for In-App Notification.
+    Saves to DB for In-App Notification, pushes it to the user's open
+    notification streams and queues the email in the outbox; actual SMTP
+    delivery happens in the background (see email_dispatcher).
     """
-    # Log to console (simulating external API call)
-    logger.info(f"SENDING SMS to {phone}: {message}")
-    logger.info(f"SENDING EMAIL to {email}: {message}")
+    send_notifications([(phone, email, message, user_id)], session)
 
-    # Save to Database for In-App display
+def send_notifications(items: Iterable[Tuple[Optional[str], Optional[str], str, int]], session: Session):
+    """send_notification for many (phone, email, message, user_id) at once, with a single commit."""
+    send_emails = emails_enabled()
+
+    # Save to Database for In-App display, plus the outbox rows in the same commit
+    pending = []
     try:
-        notification = Notification(user_id=user_id, message=message, type="in-app")
-        session.add(notification)
+        for phone, email, message, user_id in items:
+            # Log to console (simulating external API call)
+            logger.info(f"SENDING SMS to {phone}: {message}")
+            logger.info(f"SENDING EMAIL to {email}: {message}")
+            notification = Notification(user_id=user_id, message=message, type="in-app")
+            session.add(notification)
+            outbox = None
+            if send_emails and email:
+                outbox = EmailOutbox(recipient=email, subject="SmartTrans Notification", body=message)
+                session.add(outbox)
+            pending.append((notification, outbox))
+        session.flush()
+        events = [
+            {
+                "id": notification.id,
+                "user_id": notification.user_id,
+                "message": notification.message,
+                "type": notification.type,
+                "is_read": False,
+                "created_at": notification.created_at.isoformat(),
+            }
+            for notification, _ in pending
+        ]
+        outbox_ids = [outbox.id for _, outbox in pending if outbox is not None]
         session.commit()
     except Exception as e:
         logger.error(f"Failed to save notification: {e}")
+        return
 
-    # Attempt Real Email if Enabled
-    from ..core.config import settings
-    import smtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-
-    if settings.EMAILS_ENABLED and settings.SMTP_USERNAME and settings.SMTP_PASSWORD:
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = settings.SMTP_USERNAME
-            msg['To'] = email
-            msg['Subject'] = "SmartTrans Notification"
-            msg.attach(MIMEText(message, 'plain'))
-
-            server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT)
-            server.starttls()
-            server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-            text = msg.as_string()
-            server.sendmail(settings.SMTP_USERNAME, email, text)
-            server.quit()
-            logger.info(f"REAL EMAIL SENT to {email}")
-        except Exception as e:
-            logger.error(f"Failed to send real email: {e}")
+    for event in events:
+        hub.publish(event["user_id"], event)
+    for outbox_id in outbox_ids:
+        dispatcher.enqueue(outbox_id)
@@ -0,0 +1,269 @@
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import DDL, delete, event, func, insert, inspect, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.schema import CreateTable
+from sqlmodel import Session, select
+
+from .config import settings
+from .stats_service import begin_snapshot, dialect_insert
+from .tasks import PeriodicTask
+from ..models.archive import ARCHIVES
+from ..models.notification import EmailOutbox, Notification, NotificationCounter, OutboxStatus
+
+logger = logging.getLogger("notification_storage")
+
+_notifications = Notification.__table__
+_counters = NotificationCounter.__table__
+
+# --- unread counters ---
+# One row per user, so the unread badge is a primary key lookup however many
+# notifications the user has. Maintained like the admin counters in
+# stats_service: an after_flush hook for ORM writes, bump_unread() for Core
+# statements, and a periodic reconcile against COUNT(*).
+
+
+def bump_unread(connection, deltas: Dict[int, int]):
+    """Apply per-user unread deltas inside the caller's transaction."""
+    # INSERT ... ON CONFLICT DO UPDATE, so two first notifications don't race
+    upsert = dialect_insert(connection)
+    for user_id, delta in deltas.items():
+        if not delta:
+            continue
+        if upsert is not None:
+            connection.execute(upsert(_counters).values(user_id=user_id, unread=delta).on_conflict_do_update(
+                index_elements=[_counters.c.user_id], set_={"unread": _counters.c.unread + delta}
+            ))
+            continue
+        result = connection.execute(
+            update(_counters).where(_counters.c.user_id == user_id).values(unread=_counters.c.unread + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(_counters).values(user_id=user_id, unread=delta))
+
+
+def read_unread(session: Session, user_id: int) -> int:
+    unread = session.exec(select(NotificationCounter.unread).where(NotificationCounter.user_id == user_id)).first()
+    return max(unread or 0, 0)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_unread(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Notification) and not obj.is_read:
+            deltas[obj.user_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Notification) and not obj.is_read:
+            deltas[obj.user_id] -= 1
+    for obj in session.dirty:
+        if not isinstance(obj, Notification) or obj in session.new:
+            continue
+        history = inspect(obj).attrs.is_read.history
+        if history.has_changes() and history.deleted:
+            deltas[obj.user_id] += (not obj.is_read) - (not history.deleted[0])
+    if deltas:
+        bump_unread(session.connection(), deltas)
+
+
+def mark_read(session: Session, user_id: int, notification_id: Optional[int] = None, up_to_id: Optional[int] = None) -> int:
+    """Mark one, all, or all up to an id of the user's notifications read, in a single UPDATE."""
+    statement = update(_notifications).where(_notifications.c.user_id == user_id, _notifications.c.is_read == False)
+    if notification_id is not None:
+        statement = statement.where(_notifications.c.id == notification_id)
+    if up_to_id is not None:
+        statement = statement.where(_notifications.c.id <= up_to_id)
+    connection = session.connection()
+    updated = connection.execute(statement.values(is_read=True)).rowcount
+    bump_unread(connection, {user_id: -updated})
+    return updated
+
+
+def reconcile_unread(session: Session) -> Dict[int, int]:
+    """Recompute the unread counters with COUNT(*) and fix drifted ones."""
+    begin_snapshot(session)
+    actual = dict(session.exec(
+        select(Notification.user_id, func.count()).where(Notification.is_read == False).group_by(Notification.user_id)
+    ).all())
+    stored = dict(session.exec(select(NotificationCounter.user_id, NotificationCounter.unread)).all())
+    fixed = {}
+    for user_id in set(actual) | set(stored):
+        if actual.get(user_id, 0) != stored.get(user_id, 0):
+            fixed[user_id] = actual.get(user_id, 0) - stored.get(user_id, 0)
+    if fixed:
+        logger.warning(f"Unread counters drifted for {len(fixed)} users, correcting")
+    try:
+        if fixed:
+            bump_unread(session.connection(), fixed)
+        session.commit()
+    except DBAPIError as e:
+        # Written to since our snapshot; the next run recounts
+        session.rollback()
+        logger.info(f"Unread counter reconcile skipped, retrying next run: {e}")
+        return {}
+    return fixed
+
+
+# --- partitions (Postgres) ---
+# On Postgres a new notification table is partitioned by month on
+# created_at: monthly tables are created ahead of time, rows outside them
+# land in notification_default, and retention drops whole months, which
+# leaves nothing for vacuum to clean up. A table that already exists
+# unpartitioned stays as it is and is only trimmed by batched DELETEs, like
+# on SQLite.
+
+PARTITION_NAME = re.compile(r"^notification_p(\d{4})_(\d{2})$")
+
+
+@compiles(CreateTable, "postgresql")
+def _create_table(create, compiler, **kw):
+    ddl = compiler.visit_create_table(create, **kw)
+    if create.element is _notifications:
+        # Unique constraints of a partitioned table must include the partition key.
+        # Done here rather than with postgresql_partition_by on the model, which
+        # would import the Postgres dialect on every start, SQLite or not.
+        ddl = ddl.replace("PRIMARY KEY (id)", "PRIMARY KEY (id, created_at)")
+        ddl = ddl.rstrip() + " PARTITION BY RANGE (created_at)\n\n"
+    return ddl
+
+
+event.listen(_notifications, "after_create", DDL(
+    "CREATE TABLE IF NOT EXISTS notification_default PARTITION OF notification DEFAULT"
+).execute_if(dialect="postgresql"))
+
+
+def _add_months(month: datetime, n: int) -> datetime:
+    years, index = divmod(month.month - 1 + n, 12)
+    return datetime(month.year + years, index + 1, 1)
+
+
+def is_partitioned(connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    kind = connection.execute(text("SELECT relkind FROM pg_class WHERE relname = 'notification'")).scalar()
+    return kind == "p"
+
+
+def ensure_partitions(session: Session):
+    """Create this month's partition and NOTIFICATION_PARTITIONS_AHEAD more."""
+    connection = session.connection()
+    if not is_partitioned(connection):
+        return
+    this_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for n in range(settings.NOTIFICATION_PARTITIONS_AHEAD + 1):
+        start, end = _add_months(this_month, n), _add_months(this_month, n + 1)
+        name = f"notification_p{start:%Y_%m}"
+        try:
+            with session.begin_nested():
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF notification "
+                    f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+                ))
+        except DBAPIError as e:
+            # e.g. the default partition already holds rows for that month
+            logger.warning(f"Could not create partition {name}: {e}")
+    session.commit()
+
+
+def _drop_expired_partitions(session: Session, cutoff: datetime) -> int:
+    connection = session.connection()
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'notification'"
+    )).scalars().all()
+    dropped = 0
+    for name in sorted(names):
+        match = PARTITION_NAME.match(name)
+        if not match or _add_months(datetime(int(match[1]), int(match[2]), 1), 1) > cutoff:
+            continue
+        unread = connection.execute(text(f"SELECT user_id, count(*) FROM {name} WHERE NOT is_read GROUP BY user_id")).all()
+        dropped += connection.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        bump_unread(connection, {user_id: -count for user_id, count in unread})
+        connection.execute(text(f"DROP TABLE {name}"))
+        session.commit()
+        connection = session.connection()
+        logger.info(f"Dropped notification partition {name}")
+    return dropped
+
+
+# --- retention ---
+
+def purge_expired(session: Session, batch_size: int = None) -> Dict[str, int]:
+    """
+    Delete notifications older than NOTIFICATION_RETENTION_DAYS, read or not,
+    from the live and archive tables: whole partitions where there are any,
+    then batches of NOTIFICATION_DELETE_BATCH_SIZE rows, one transaction each.
+    Sent emails leave the outbox after EMAIL_OUTBOX_RETENTION_DAYS.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_DELETE_BATCH_SIZE
+    cutoff = datetime.utcnow() - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    deleted = Counter()
+    if is_partitioned(session.connection()):
+        deleted["notifications"] += _drop_expired_partitions(session, cutoff)
+
+    while True:
+        ids = session.exec(
+            select(Notification.id).where(Notification.created_at < cutoff).order_by(Notification.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        connection = session.connection()
+        unread = session.exec(
+            select(Notification.user_id, func.count())
+            .where(Notification.id.in_(ids), Notification.is_read == False)
+            .group_by(Notification.user_id)
+        ).all()
+        bump_unread(connection, {user_id: -count for user_id, count in unread})
+        deleted["notifications"] += connection.execute(delete(_notifications).where(_notifications.c.id.in_(ids))).rowcount
+        session.commit()
+
+    archive = ARCHIVES[Notification]
+    while True:
+        ids = session.exec(
+            select(archive.c.id).where(archive.c.created_at < cutoff).order_by(archive.c.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        deleted["archived"] += session.connection().execute(delete(archive).where(archive.c.id.in_(ids))).rowcount
+        session.commit()
+
+    # Only sent ones: pending rows are still to go out, failed ones are kept to look into
+    sent_cutoff = datetime.utcnow() - timedelta(days=settings.EMAIL_OUTBOX_RETENTION_DAYS)
+    while True:
+        ids = session.exec(
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status == OutboxStatus.SENT, EmailOutbox.sent_at < sent_cutoff)
+            .order_by(EmailOutbox.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        deleted["emails"] += session.connection().execute(delete(EmailOutbox.__table__).where(EmailOutbox.id.in_(ids))).rowcount
+        session.commit()
+
+    deleted = +deleted # drop zero counts
+    if deleted and session.connection().dialect.name == "sqlite":
+        # Hand the freed pages back to the filesystem (needs auto_vacuum=INCREMENTAL)
+        session.connection().exec_driver_sql("PRAGMA incremental_vacuum")
+        session.commit()
+    if deleted:
+        logger.info(f"Deleted expired notifications: {dict(deleted)}")
+    return dict(deleted)
+
+
+def maintain(session: Session):
+    ensure_partitions(session)
+    purge_expired(session)
+    reconcile_unread(session)
+
+
+notification_maintenance = PeriodicTask(
+    "notification-maintenance", lambda: settings.NOTIFICATION_MAINTENANCE_INTERVAL_SECONDS, maintain
+)
@@ -0,0 +1,129 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
+from sqlmodel import Session
+
+from .config import settings
+from .serialization import FastJSONResponse, Projection, dumps
+
+# An ordering is a list of (column, descending) pairs. The last column must be
+# unique (normally the primary key) so that every row has a stable position.
+Ordering = Sequence[Tuple[Any, bool]]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+STREAM_BATCH_SIZE = 500
+
+
+class PageParams:
+    """Query parameters shared by every list endpoint."""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = Query(default=settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+        stream: bool = False, # NDJSON export of every matching row
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.stream = stream
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, ordering: Ordering) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError("cursor does not match ordering")
+        decoded = []
+        for value, (column, _) in zip(values, ordering):
+            if value is not None and column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            decoded.append(value)
+        return decoded
+    except (ValueError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def apply_keyset(statement, ordering: Ordering, cursor: Optional[str], limit: Optional[int] = None):
+    """
+    Order the statement and, given a cursor, only keep rows after it:
+    (a, b) > (x, y)  ==>  a > x OR (a = x AND b > y), with > flipped to <
+    for descending columns. Fetches one extra row to detect a next page.
+    """
+    if cursor:
+        values = decode_cursor(cursor, ordering)
+        clauses = []
+        for i, (column, descending) in enumerate(ordering):
+            equal = [col == val for (col, _), val in zip(ordering[:i], values[:i])]
+            after = column < values[i] if descending else column > values[i]
+            clauses.append(and_(*equal, after))
+        statement = statement.where(or_(*clauses))
+    statement = statement.order_by(*[col.desc() if descending else col.asc() for col, descending in ordering])
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    return statement
+
+
+def finish_page(rows: List[Any], ordering: Ordering, limit: int, response: Response) -> List[Any]:
+    """Trim the look-ahead row and expose the next cursor as a header."""
+    rows = list(rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(last, col.key) for col, _ in ordering])
+    return rows
+
+
+def paginate(session: Session, statement, ordering: Ordering, page: PageParams, response: Response):
+    statement = apply_keyset(statement, ordering, page.cursor, page.limit)
+    return finish_page(session.exec(statement).all(), ordering, page.limit, response)
+
+
+async def paginate_async(session, statement, ordering: Ordering, page: PageParams, response: Response):
+    """paginate() for handlers using get_async_session."""
+    statement = apply_keyset(statement, ordering, page.cursor, page.limit)
+    return finish_page((await session.exec(statement)).all(), ordering, page.limit, response)
+
+
+def page_response(items: List[Any], response: Response) -> FastJSONResponse:
+    """Already-serialized page items as the response, keeping the next cursor header."""
+    headers = {}
+    if NEXT_CURSOR_HEADER in response.headers:
+        headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+    return FastJSONResponse(items, headers=headers)
+
+
+def stream_ndjson(statement, ordering: Ordering, cursor: Optional[str], read_model, engine=None) -> StreamingResponse:
+    """
+    Stream every matching row as one JSON document per line. Rows come from a
+    server-side cursor in batches, so the full result is never held in memory.
+    read_model is a model to build from ORM rows, or a Projection whose
+    select() the statement is. engine defaults to the primary's.
+    """
+    if engine is None:
+        from .database import engine
+
+    statement = apply_keyset(statement, ordering, cursor).execution_options(yield_per=STREAM_BATCH_SIZE)
+
+    def generate():
+        # Own session: the request-scoped one may be closed before streaming ends
+        with Session(engine) as session:
+            if isinstance(read_model, Projection):
+                for row in session.exec(statement):
+                    yield dumps(read_model.build(row)) + b"\n"
+            else:
+                for row in session.exec(statement):
+                    yield json.dumps(jsonable_encoder(read_model.from_orm(row))) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import event
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(*engines, expected: int = None):
+    """
+    Count SQL statements executed on the given engines (default: the app's
+    sync engines, plus the async ones that have been created) inside the block.
+    With expected=N, raises AssertionError if the block ran more than N,
+    listing the statements so an N+1 is easy to spot.
+
+        with count_queries(expected=3) as queries:
+            client.get("/bookings/", headers=headers)
+    """
+    if not engines:
+        from . import database
+        engines = [database.engine, *database.replica_engines, *database._async_replica_engines.values()]
+        if database._async_engine is not None:
+            engines.append(database._async_engine)
+    # Async engines are listened to through their sync core
+    engines = [getattr(e, "sync_engine", e) for e in engines]
+
+    counter = QueryCounter()
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", counter._record)
+    try:
+        yield counter
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", counter._record)
+    if expected is not None and counter.count > expected:
+        listing = "\n".join(f"  {s}" for s in counter.statements)
+        raise AssertionError(f"Expected at most {expected} queries, got {counter.count}:\n{listing}")
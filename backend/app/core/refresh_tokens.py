@@ -0,0 +1,56 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from .config import settings
+from .tasks import PeriodicTask
+from ..models.refresh_token import SpentRefreshToken
+
+logger = logging.getLogger("refresh_tokens")
+
+# Refresh tokens are single use. /auth/refresh swaps one for a new access
+# token and a new refresh token, and records the old one's jti here; a jti
+# that's already recorded is refused. So a refresh token that leaked is
+# worthless once its owner has used it, and if the thief got there first,
+# the owner's next refresh fails and they log in again. Two requests racing
+# with the same token both try the INSERT; the primary key lets one through.
+# Rows are only needed until the token expires on its own, then purged.
+
+_spent = SpentRefreshToken.__table__
+
+
+def spend(session: Session, claims: dict) -> bool:
+    """
+    Record the refresh token's jti as used and commit; False if it already
+    was (or has no jti), i.e. the token must be refused.
+    """
+    jti = claims.get("jti")
+    if not jti:
+        return False
+    try:
+        session.connection().execute(insert(_spent).values(
+            jti=jti, user_id=claims.get("uid"), spent_at=datetime.utcnow(),
+            expires_at=datetime.utcfromtimestamp(claims["exp"]),
+        ))
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        logger.warning(f"Refresh token {jti} of user {claims.get('uid')} was used again")
+        return False
+    return True
+
+
+def purge_expired(session: Session) -> int:
+    purged = session.connection().execute(delete(_spent).where(_spent.c.expires_at <= datetime.utcnow())).rowcount
+    session.commit()
+    if purged:
+        logger.info(f"Purged {purged} expired refresh token ids")
+    return purged
+
+
+refresh_token_purge = PeriodicTask(
+    "refresh-token-purge", lambda: settings.REFRESH_TOKEN_PURGE_INTERVAL_SECONDS, purge_expired
+)
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Optional
+
+from .admission import caller_key
+from .config import settings
+
+# Read replicas. Search, listings and dashboards read through
+# get_read_session / get_async_read_session (core/database.py), which open
+# their session on one of DATABASE_REPLICA_URLS in turn; everything else,
+# writes included, stays on DATABASE_URL.
+#
+# Replicas lag. So a caller (user, or IP when anonymous, as for rate limits)
+# who just changed something reads from the primary for the next
+# DB_READ_YOUR_WRITES_SECONDS and sees their own booking, trip or read
+# notification straight away. Other people's changes show up once the
+# replica has them. Like the rate limit buckets, who wrote when is kept per
+# worker process.
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class ReadRouter:
+    def __init__(self, replicas: int, window_seconds: float, max_callers: int = 100000):
+        self.replicas = replicas
+        self.window_seconds = window_seconds
+        self.max_callers = max_callers
+        self._writes: "OrderedDict[str, float]" = OrderedDict() # caller -> sticky until
+        self._lock = threading.Lock()
+        self._turn = count()
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    def mark_write(self, caller: str):
+        if not self.replicas or self.window_seconds <= 0:
+            return
+        with self._lock:
+            self._writes[caller] = time.monotonic() + self.window_seconds
+            self._writes.move_to_end(caller)
+            while len(self._writes) > self.max_callers:
+                self._writes.popitem(last=False)
+
+    def is_sticky(self, caller: str) -> bool:
+        with self._lock:
+            until = self._writes.get(caller)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._writes[caller]
+                return False
+            return True
+
+    def route(self, scope=None) -> Optional[int]:
+        """Replica (index into DATABASE_REPLICA_URLS) for a read, or None for the primary."""
+        if not self.replicas:
+            with self._lock:
+                self.primary_reads += 1
+            return None
+        if scope is not None and self.is_sticky(caller_key(scope)):
+            with self._lock:
+                self.sticky_reads += 1
+            return None
+        with self._lock:
+            self.replica_reads += 1
+        return next(self._turn) % self.replicas
+
+    def reset(self):
+        with self._lock:
+            self._writes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "replicas": self.replicas,
+                "replica_reads": self.replica_reads,
+                "primary_reads": self.primary_reads,
+                "sticky_reads": self.sticky_reads,
+                "sticky_callers": len(self._writes),
+            }
+
+
+read_router = ReadRouter(len(settings.DATABASE_REPLICA_URLS), settings.DB_READ_YOUR_WRITES_SECONDS)
+
+
+class ReadYourWritesMiddleware:
+    """Remembers the caller of every successful write request (see above). Plain ASGI."""
+
+    def __init__(self, app, router: ReadRouter = read_router):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or not self.router.replicas:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            # Before the response goes out, so the caller's next request already sticks
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                self.router.mark_write(caller_key(scope))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,217 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session, select
+
+from .capacity import parse_capacity
+from .config import settings
+from .stats_service import bump_counters
+from .search_cache import mark_trip_changed
+from .tasks import PeriodicTask
+from ..models.booking import Booking, BookingStatus
+from ..models.trip import Trip, TripStatus
+
+logger = logging.getLogger("reservations")
+
+# All capacity changes go through conditional UPDATEs on the trip row, so two
+# requests racing for the last few tons can't both win: the database applies
+# them one after the other and the second finds the WHERE no longer true.
+# They run in the caller's transaction, next to the booking change they belong to.
+#
+# The booking's side (reserved_capacity) is claimed the same way before any
+# capacity moves: two rejects of one booking, or a reject or accept racing the
+# hold sweeper, find it already claimed and leave the trip alone.
+
+_trips = Trip.__table__
+_bookings = Booking.__table__
+
+
+def cargo_amount(booking: Booking, trip: Trip) -> Optional[float]:
+    """Cargo size in the trip's capacity unit, or None if we can't tell."""
+    if trip.remaining_capacity is None:
+        return None
+    cargo = parse_capacity(booking.cargo_size)
+    if cargo is None or cargo[1] != trip.capacity_unit:
+        return None
+    return cargo[0]
+
+
+def _forget(session: Session, trip_id: int):
+    # The ORM copy of the trip (if this session loaded one) is now stale
+    trip = session.identity_map.get(session.identity_key(Trip, trip_id))
+    if trip is not None:
+        session.expire(trip, ["remaining_capacity", "status", "version"])
+
+
+def reserve(session: Session, trip_id: int, amount: float) -> bool:
+    """Take amount off an open trip. False if the trip isn't open or it doesn't fit."""
+    connection = session.connection()
+    taken = connection.execute(
+        update(_trips)
+        .where(_trips.c.id == trip_id)
+        .where(_trips.c.status == TripStatus.OPEN)
+        .where(_trips.c.remaining_capacity >= amount)
+        .values(remaining_capacity=_trips.c.remaining_capacity - amount, version=_trips.c.version + 1)
+    ).rowcount
+    if not taken:
+        return False
+    filled = connection.execute(
+        update(_trips)
+        .where(_trips.c.id == trip_id)
+        .where(_trips.c.status == TripStatus.OPEN)
+        .where(_trips.c.remaining_capacity <= 0)
+        .values(status=TripStatus.FULL)
+    ).rowcount
+    if filled:
+        bump_counters(connection, {"trips.status.open": -1, "trips.status.full": 1})
+    mark_trip_changed(session, trip_id)
+    _forget(session, trip_id)
+    return True
+
+
+def release(session: Session, trip_id: int, amount: float):
+    """Give amount back to the trip, reopening it if it was full and now has room."""
+    connection = session.connection()
+    connection.execute(
+        update(_trips)
+        .where(_trips.c.id == trip_id)
+        .where(_trips.c.remaining_capacity.is_not(None))
+        .values(remaining_capacity=_trips.c.remaining_capacity + amount, version=_trips.c.version + 1)
+    )
+    # Only a measured capacity says there's room again; a full trip without one stays full
+    reopened = connection.execute(
+        update(_trips)
+        .where(_trips.c.id == trip_id)
+        .where(_trips.c.status == TripStatus.FULL)
+        .where(_trips.c.remaining_capacity > 0)
+        .values(status=TripStatus.OPEN)
+    ).rowcount
+    if reopened:
+        bump_counters(connection, {"trips.status.full": -1, "trips.status.open": 1})
+    mark_trip_changed(session, trip_id)
+    _forget(session, trip_id)
+
+
+def hold(session: Session, booking: Booking, trip: Trip) -> bool:
+    """
+    Reserve a new pending booking's cargo for BOOKING_HOLD_MINUTES. Bookings
+    whose cargo can't be measured against the trip reserve nothing and only
+    need the trip to be open. False if it doesn't fit.
+    """
+    amount = cargo_amount(booking, trip)
+    if amount is None:
+        return trip.status == TripStatus.OPEN
+    if not reserve(session, trip.id, amount):
+        return False
+    booking.reserved_capacity = amount
+    booking.hold_expires_at = datetime.utcnow() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+    return True
+
+
+def _settle(booking: Booking, reserved_capacity: Optional[float]):
+    # The database already has these; keep the ORM copy from writing them again
+    set_committed_value(booking, "reserved_capacity", reserved_capacity)
+    set_committed_value(booking, "hold_expires_at", None)
+
+
+def _take_reservation(session: Session, booking_id: int, *conditions) -> Optional[float]:
+    """
+    Clear the booking's reservation with a compare-and-set on the row and
+    return what it held: None if it held nothing, or someone else got there
+    first. The caller gives it back to the trip.
+    """
+    connection = session.connection()
+    while True:
+        amount = connection.execute(
+            select(_bookings.c.reserved_capacity).where(_bookings.c.id == booking_id, *conditions)
+        ).scalar()
+        if amount is None:
+            return None
+        taken = connection.execute(
+            update(_bookings)
+            .where(_bookings.c.id == booking_id, _bookings.c.reserved_capacity == amount, *conditions)
+            .values(reserved_capacity=None, hold_expires_at=None)
+        ).rowcount
+        if taken:
+            return amount
+
+
+def confirm(session: Session, booking: Booking, trip: Trip) -> bool:
+    """Make the booking's reservation permanent, reserving now if its hold lapsed."""
+    connection = session.connection()
+    while True:
+        held = connection.execute(select(_bookings.c.reserved_capacity).where(_bookings.c.id == booking.id)).scalar()
+        if held is not None:
+            # Clearing the expiry takes it out of the sweeper's reach
+            kept = connection.execute(
+                update(_bookings)
+                .where(_bookings.c.id == booking.id, _bookings.c.reserved_capacity == held)
+                .values(hold_expires_at=None)
+            ).rowcount
+            if kept:
+                _settle(booking, held)
+                return True
+            continue # released meanwhile
+        amount = cargo_amount(booking, trip)
+        if amount is None:
+            _settle(booking, None)
+            return True
+        claimed = connection.execute(
+            update(_bookings)
+            .where(_bookings.c.id == booking.id, _bookings.c.reserved_capacity.is_(None))
+            .values(reserved_capacity=amount, hold_expires_at=None)
+        ).rowcount
+        if not claimed:
+            continue # reserved meanwhile
+        if not reserve(session, trip.id, amount):
+            return False
+        _settle(booking, amount)
+        return True
+
+
+def cancel(session: Session, booking: Booking):
+    """Hand back whatever the booking has reserved."""
+    amount = _take_reservation(session, booking.id)
+    if amount is not None:
+        release(session, booking.trip_id, amount)
+    _settle(booking, None)
+
+
+def release_expired_holds(session: Session, batch_size: int = 500) -> int:
+    """
+    Give back capacity held by pending bookings past hold_expires_at. The
+    bookings stay pending; accepting one later reserves again if it still fits.
+    """
+    released = 0
+    while True:
+        expired = [
+            _bookings.c.status == BookingStatus.PENDING.value,
+            _bookings.c.hold_expires_at <= datetime.utcnow(),
+        ]
+        rows = session.connection().execute(
+            select(_bookings.c.id, _bookings.c.trip_id)
+            .where(*expired)
+            .where(_bookings.c.reserved_capacity.is_not(None))
+            .limit(batch_size)
+        ).all()
+        swept = 0
+        for booking_id, trip_id in rows:
+            # Only if it's still pending and expired by the time we get to it
+            amount = _take_reservation(session, booking_id, *expired)
+            if amount is not None:
+                release(session, trip_id, amount)
+                swept += 1
+        session.commit()
+        released += swept
+        # A batch that was all lost to accepts and rejects ends the round too
+        if len(rows) < batch_size or not swept:
+            break
+    if released:
+        logger.info(f"Released {released} expired booking holds")
+    return released
+
+
+hold_sweeper = PeriodicTask("booking-hold-sweeper", lambda: settings.BOOKING_HOLD_SWEEP_SECONDS, release_expired_holds)
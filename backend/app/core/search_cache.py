@@ -0,0 +1,278 @@
+import hashlib
+import importlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session as OrmSession
+
+from .config import settings
+from ..models.trip import Trip
+from ..models.user import User
+from ..models.vehicle import Vehicle
+
+# Search results are tagged with the route they cover, "*" standing for an
+# end the search didn't pin down. A change to a Pune -> Mumbai trip drops
+# exactly the pages tagged pune:mumbai, pune:*, *:mumbai and *:*.
+# Coordinate searches share one "geo" tag.
+GEO_TAG = "geo"
+
+
+def route_tags(start_key: str, end_key: str) -> List[str]:
+    return [f"route:{s}:{e}" for s in (start_key, "*") for e in (end_key, "*")]
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+    next_cursor: Optional[str]
+
+
+class CacheBackend:
+    """
+    Storage for cached pages. Besides get/put, a backend keeps a version per
+    tag, bumped by invalidate(); put() is dropped if any of the entry's tags
+    moved since the caller read them, so a page computed from data that
+    changed mid-request is never stored. It also remembers when each tag was
+    last invalidated, for pages read from a replica that may lag behind.
+    A shared backend (e.g. Redis) makes invalidations reach every worker;
+    the default one is per process.
+    """
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        raise NotImplementedError
+
+    def tag_versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        raise NotImplementedError
+
+    def last_invalidated(self, tags: Iterable[str]) -> float:
+        """time.time() of the latest invalidation of any of the tags, 0 if never."""
+        raise NotImplementedError
+
+    def put(self, key: str, page: CachedPage, tags: List[str], versions: Tuple[int, ...]):
+        raise NotImplementedError
+
+    def invalidate(self, tags: Iterable[str]):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU with a TTL, plus a tag -> keys index for invalidation."""
+
+    def __init__(self, max_size: int = settings.SEARCH_CACHE_SIZE, ttl_seconds: float = settings.SEARCH_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._keys_by_tag: Dict[str, set] = defaultdict(set)
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._invalidated_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.invalidated = 0
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            page, tags, expires_at = entry
+            if expires_at <= time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return page
+
+    def tag_versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions[tag] for tag in tags)
+
+    def last_invalidated(self, tags: Iterable[str]) -> float:
+        with self._lock:
+            return max((self._invalidated_at.get(tag, 0.0) for tag in tags), default=0.0)
+
+    def put(self, key: str, page: CachedPage, tags: List[str], versions: Tuple[int, ...]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if tuple(self._versions[tag] for tag in tags) != versions:
+                return
+            self._drop(key)
+            self._entries[key] = (page, tags, time.time() + self.ttl_seconds)
+            for tag in tags:
+                self._keys_by_tag[tag].add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags: Iterable[str]):
+        now = time.time()
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] += 1
+                self._invalidated_at[tag] = now
+                for key in list(self._keys_by_tag.pop(tag, ())):
+                    self._drop(key)
+                    self.invalidated += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "evictions": self.evictions, "invalidated": self.invalidated}
+
+
+def load_backend(name: str) -> CacheBackend:
+    """ "memory", or "package.module:ClassName" for a custom backend."""
+    if name == "memory":
+        return MemoryBackend()
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)()
+
+
+class SearchCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.not_stored = 0
+
+    @staticmethod
+    def key(**params) -> str:
+        return "&".join(f"{name}={params[name]}" for name in sorted(params) if params[name] is not None)
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        page = self.backend.get(key)
+        if page is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return page
+
+    def put(
+        self, key: str, body: bytes, next_cursor: Optional[str], tags: List[str], versions: Tuple[int, ...],
+        from_replica: bool = False,
+    ) -> CachedPage:
+        page = CachedPage(body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"', next_cursor)
+        # A replica may not have a change committed less than the replica lag
+        # ago yet, and the tag versions wouldn't show it: serve the page, don't keep it
+        if from_replica and time.time() - self.backend.last_invalidated(tags) < settings.DB_READ_YOUR_WRITES_SECONDS:
+            self.not_stored += 1
+            return page
+        self.backend.put(key, page, tags, versions)
+        return page
+
+    def respond(self, request: Request, page: CachedPage) -> Response:
+        """The page as a response, or a bodiless 304 if the client already has it."""
+        headers = {"ETag": page.etag}
+        if page.next_cursor:
+            from .pagination import NEXT_CURSOR_HEADER
+            headers[NEXT_CURSOR_HEADER] = page.next_cursor
+        if_none_match = request.headers.get("if-none-match", "")
+        if page.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=page.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "not_stored": self.not_stored,
+            **self.backend.stats(),
+        }
+
+
+search_cache = SearchCache(load_backend(settings.SEARCH_CACHE_BACKEND))
+
+
+# --- invalidation ---
+# Tags are collected on the session while trips change and only dropped once
+# the transaction commits: dropping earlier would let a concurrent search
+# re-cache the old rows before our commit lands.
+
+_PENDING = "search_cache_tags"
+
+
+def mark_trip_changed(session: OrmSession, trip_id: int = None, start_key: str = None, end_key: str = None):
+    """For trip writes that bypass the ORM (bulk and conditional UPDATEs)."""
+    if start_key is None:
+        trip = session.identity_map.get(session.identity_key(Trip, trip_id))
+        if trip is not None and "start_key" in trip.__dict__:
+            start_key, end_key = trip.start_key, trip.end_key
+        else:
+            start_key, end_key = session.execute(
+                select(Trip.start_key, Trip.end_key).where(Trip.id == trip_id)
+            ).one()
+    pending = session.info.setdefault(_PENDING, set())
+    pending.update(route_tags(start_key, end_key))
+    pending.add(GEO_TAG)
+
+
+# Pages embed each trip's vehicle owner (OwnerSummary)
+_OWNER_FIELDS = ("full_name", "phone", "is_verified")
+
+
+def mark_owner_changed(session: OrmSession, owner_id: int):
+    """Drop the pages of every route the owner has trips on."""
+    routes = session.execute(
+        select(Trip.start_key, Trip.end_key).distinct()
+        .join(Vehicle, Vehicle.id == Trip.vehicle_id)
+        .where(Vehicle.owner_id == owner_id)
+    ).all()
+    if not routes:
+        return
+    pending = session.info.setdefault(_PENDING, set())
+    for start_key, end_key in routes:
+        pending.update(route_tags(start_key, end_key))
+    pending.add(GEO_TAG)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _collect_trip_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Trip):
+            mark_trip_changed(session, start_key=obj.start_key, end_key=obj.end_key)
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and (
+            obj in session.deleted or any(inspect(obj).attrs[name].history.has_changes() for name in _OWNER_FIELDS)
+        ):
+            mark_owner_changed(session, obj.id)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_committed(session):
+    tags = session.info.pop(_PENDING, None)
+    if tags:
+        search_cache.backend.invalidate(tags)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop(_PENDING, None)
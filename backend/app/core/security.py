@@ -1,19 +1,125 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Union
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import Optional, Tuple, Union
 from .config import settings
+from .instrumentation import phase
+from .tokens import tokens
 from fastapi.security import OAuth2PasswordBearer
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# min == max == default rounds: hashes made with any other cost are flagged by
+# needs_update() and transparently rehashed on the next successful login.
+# Built on first use: passlib is slow to import and most requests never hash.
+@lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["pbkdf2_sha256"],
+        deprecated="auto",
+        pbkdf2_sha256__default_rounds=settings.PASSWORD_HASH_ROUNDS,
+        pbkdf2_sha256__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+        pbkdf2_sha256__max_rounds=settings.PASSWORD_HASH_ROUNDS,
+    )
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(matches, new_hash); new_hash is set when the stored hash uses an outdated cost."""
+    return pwd_context().verify_and_update(plain_password, hashed_password)
+
+def _load_passlib():
+    pwd_context()
+
+class HashingBusyError(Exception):
+    """Raised when the hashing pool's queue is full; mapped to 503 in main.py."""
+
+class HashingPool:
+    """
+    Runs password hashing on a dedicated, bounded pool so a login burst can't
+    take every request thread. At most PASSWORD_HASH_WORKERS hashes run at
+    once and at most PASSWORD_HASH_MAX_QUEUE wait; beyond that callers get
+    HashingBusyError instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_queue: int, kind: str = "thread"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0 # submitted and not finished (running + queued)
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HashingBusyError()
+            self.in_flight += 1
+            executor = self._get_executor()
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def run(self, fn, *args):
+        with phase("hash"):
+            return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def run_sync(self, fn, *args):
+        with phase("hash"):
+            return self.submit(fn, *args).result()
+
+    def warm(self):
+        # Starts the workers (forks them, for a process pool) and loads passlib
+        # in each, so the first logins after a restart don't pay for it
+        pwd_context()
+        with self._lock:
+            executor = self._get_executor()
+        for future in [executor.submit(_load_passlib) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queue_depth": max(self.in_flight - self.workers, 0),
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+hash_pool = HashingPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_QUEUE, settings.PASSWORD_HASH_POOL)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -22,5 +128,4 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
+    return tokens.encode(to_encode)
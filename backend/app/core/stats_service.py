@@ -0,0 +1,159 @@
+import importlib
+import logging
+from collections import Counter
+from typing import Dict, Iterable
+
+from sqlalchemy import event, func, inspect, insert, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from .config import settings
+from .tasks import PeriodicTask
+from ..models.user import User
+from ..models.trip import Trip
+from ..models.booking import Booking
+from ..models.stats import StatCounter
+from ..models.archive import ARCHIVES
+
+logger = logging.getLogger("stats_service")
+
+# model -> (counter prefix, attribute broken down by)
+TRACKED = {
+    User: ("users", "role"),
+    Trip: ("trips", "status"),
+    Booking: ("bookings", "status"),
+}
+
+
+def _value(v) -> str:
+    return getattr(v, "value", v)
+
+
+def counter_keys(obj) -> Iterable[str]:
+    prefix, attr = TRACKED[type(obj)]
+    return (f"{prefix}.total", f"{prefix}.{attr}.{_value(getattr(obj, attr))}")
+
+
+# INSERT ... ON CONFLICT DO UPDATE: one statement per counter, and no race
+# between two transactions creating the same counter. Other databases UPDATE,
+# then INSERT. Looked up by dialect name so only the dialect in use gets imported.
+UPSERT_DIALECTS = ("sqlite", "postgresql")
+
+
+def dialect_insert(connection):
+    """The dialect's insert() (with on_conflict_do_update), or None if it has no upsert."""
+    name = connection.dialect.name
+    return importlib.import_module(f"sqlalchemy.dialects.{name}").insert if name in UPSERT_DIALECTS else None
+
+
+def begin_snapshot(session: Session):
+    """
+    Start the session's transaction as one snapshot of the database, for a
+    reconcile that reads counts and then corrects counters from them. On
+    Postgres that's REPEATABLE READ; SQLite transactions are serializable,
+    but pysqlite doesn't BEGIN before a SELECT, so we do. If a writer commits
+    in between, the correcting write fails rather than applying a stale delta.
+    Commits whatever the session still has open first.
+    """
+    if session.in_transaction():
+        session.commit()
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    elif dialect == "sqlite":
+        session.connection().exec_driver_sql("BEGIN")
+
+
+def bump_counters(connection, deltas: Dict[str, int]):
+    """
+    Apply counter deltas on the given connection, i.e. inside the caller's
+    transaction. Code that writes tracked tables with bulk/Core statements
+    (which skip the ORM flush hook below) must call this itself.
+    """
+    table = StatCounter.__table__
+    upsert = dialect_insert(connection)
+    # Same order in every transaction, so two of them can't deadlock on the rows
+    for name in sorted(deltas):
+        delta = deltas[name]
+        if not delta:
+            continue
+        if upsert is not None:
+            connection.execute(upsert(table).values(name=name, value=delta).on_conflict_do_update(
+                index_elements=[table.c.name], set_={"value": table.c.value + delta}
+            ))
+            continue
+        result = connection.execute(
+            update(table).where(table.c.name == name).values(value=table.c.value + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(name=name, value=delta))
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_counts(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if type(obj) in TRACKED:
+            for key in counter_keys(obj):
+                deltas[key] += 1
+    for obj in session.deleted:
+        if type(obj) in TRACKED:
+            for key in counter_keys(obj):
+                deltas[key] -= 1
+    for obj in session.dirty:
+        if type(obj) not in TRACKED or obj in session.new:
+            continue
+        prefix, attr = TRACKED[type(obj)]
+        history = inspect(obj).attrs[attr].history
+        if history.has_changes():
+            for old in history.deleted:
+                deltas[f"{prefix}.{attr}.{_value(old)}"] -= 1
+            for new in history.added:
+                deltas[f"{prefix}.{attr}.{_value(new)}"] += 1
+    if deltas:
+        bump_counters(session.connection(), deltas)
+
+
+def read_counters(session: Session) -> Dict[str, int]:
+    return {row.name: row.value for row in session.exec(select(StatCounter))}
+
+
+def reconcile(session: Session) -> Dict[str, int]:
+    """Recompute every counter with COUNT(*) and overwrite drifted values."""
+    # Counts and counters from the same snapshot: read apart, a booking
+    # committed in between would be "corrected" into the counters twice
+    begin_snapshot(session)
+    actual = Counter()
+    for model, (prefix, attr) in TRACKED.items():
+        columns = [getattr(model, attr)]
+        if model in ARCHIVES:
+            # Archived rows (core/trip_lifecycle.py) still count
+            columns.append(ARCHIVES[model].c[attr])
+        for column in columns:
+            for value, count in session.exec(select(column, func.count()).group_by(column)):
+                actual[f"{prefix}.{attr}.{_value(value)}"] += count
+                actual[f"{prefix}.total"] += count
+
+    stored = read_counters(session)
+    fixed = {}
+    for name in set(stored) | set(actual):
+        if stored.get(name, 0) != actual.get(name, 0):
+            fixed[name] = actual.get(name, 0) - stored.get(name, 0)
+    if fixed:
+        logger.warning(f"Stat counters drifted, correcting: {fixed}")
+    try:
+        if fixed:
+            bump_counters(session.connection(), fixed)
+        session.commit()
+    except DBAPIError as e:
+        # Someone wrote since our snapshot (serialization failure, or
+        # SQLITE_BUSY); the next run recounts
+        session.rollback()
+        logger.info(f"Stat counter reconcile skipped, retrying next run: {e}")
+        return {}
+    return fixed
+
+
+# Runs reconcile() shortly after startup (see main.py) and then every STATS_RECONCILE_INTERVAL_SECONDS
+reconciler = PeriodicTask("stats-reconciler", lambda: settings.STATS_RECONCILE_INTERVAL_SECONDS, reconcile)
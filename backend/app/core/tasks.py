@@ -0,0 +1,48 @@
+import logging
+import threading
+from typing import Callable
+
+from sqlmodel import Session
+
+logger = logging.getLogger("tasks")
+
+
+class PeriodicTask:
+    """
+    Runs fn(session) on a daemon thread after delay seconds (right away by
+    default) and then every interval() seconds, each run in its own Session.
+    Errors are logged and the task carries on.
+    """
+
+    def __init__(self, name: str, interval: Callable[[], float], fn: Callable[[Session], object]):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, engine=None, delay: float = 0.0):
+        if self._thread is not None:
+            return
+        if engine is None:
+            from .database import engine
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(engine, delay), name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self, engine, delay: float):
+        if self._stop.wait(delay):
+            return
+        while not self._stop.is_set():
+            try:
+                with Session(engine) as session:
+                    self.fn(session)
+            except Exception as e:
+                logger.error(f"{self.name} failed: {e}")
+            self._stop.wait(self.interval())
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from jose import JWTError
+
+from .config import settings
+
+# Signing and verification of access and refresh tokens.
+#
+# Keys live in a ring keyed by kid, and every token names its key in the
+# header. New tokens are signed with JWT_SIGNING_KID; every key in the ring
+# verifies, so rotating is: add the new key, switch JWT_SIGNING_KID, drop the
+# old key once the last tokens signed with it have expired (refresh tokens
+# included). Tokens without a kid (issued before the ring) are checked
+# against SECRET_KEY.
+#
+# Verified tokens are remembered for a short while in an LRU, so a client
+# sending the same token on every request pays for the signature check once.
+#
+# jose.jwt pulls in the cryptography backends, which is a good part of the
+# app's import time, so it's imported on first use (or by warm()) instead.
+
+ACCESS = "access"
+REFRESH = "refresh"
+STREAM = "stream" # opens the notification stream and nothing else, see routers/notifications.py
+
+LEGACY_KID = ""
+
+
+class SigningKey:
+    """One key of the ring: an HMAC secret, or an EC key for ES256 (a public key can only verify)."""
+
+    def __init__(self, kid: str, value: str, default_algorithm: str):
+        self.kid = kid
+        if not value.startswith("-----BEGIN") and value.endswith(".pem") and os.path.exists(value):
+            with open(value) as f:
+                value = f.read()
+        if value.startswith("-----BEGIN"):
+            from jose import jwk
+
+            self.algorithm = "ES256"
+            self.key = jwk.construct(value, self.algorithm)
+            self.can_sign = self.key.is_public() is False
+            self.verify_key = self.key.public_key() if self.can_sign else self.key
+        else:
+            self.algorithm = default_algorithm
+            self.key = self.verify_key = value
+            self.can_sign = True
+
+
+def load_keys(config=settings) -> Tuple[Dict[str, SigningKey], SigningKey]:
+    """The key ring from settings, and the key to sign with."""
+    ring = {LEGACY_KID: SigningKey(LEGACY_KID, config.SECRET_KEY, config.ALGORITHM)}
+    for kid, value in config.JWT_KEYS.items():
+        ring[kid] = SigningKey(kid, value, config.ALGORITHM)
+    signing_kid = config.JWT_SIGNING_KID or next(iter(config.JWT_KEYS), LEGACY_KID)
+    signer = ring.get(signing_kid)
+    if signer is None or not signer.can_sign:
+        raise ValueError(f"JWT_SIGNING_KID {signing_kid!r} is not a signing key in JWT_KEYS")
+    return ring, signer
+
+
+class VerifiedTokenCache:
+    """
+    LRU of token -> claims for tokens whose signature already checked out.
+    Entries go at the token's own expiry or after ttl_seconds, whichever
+    comes first, so a hit never accepts anything the full check wouldn't.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, claims: Dict[str, Any]):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        with self._lock:
+            self._entries[token] = (claims, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class TokenService:
+    def __init__(self, config=settings):
+        self.ring, self.signer = load_keys(config)
+        self.cache = VerifiedTokenCache(config.JWT_VERIFY_CACHE_SIZE, config.JWT_VERIFY_CACHE_TTL_SECONDS)
+
+    def warm(self):
+        # One round trip: imports jose and checks the signing key works
+        self.decode(self.encode({"exp": datetime.utcnow() + timedelta(minutes=1)}))
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        from jose import jwt
+
+        headers = {"kid": self.signer.kid} if self.signer.kid != LEGACY_KID else None
+        return jwt.encode(claims, self.signer.key, algorithm=self.signer.algorithm, headers=headers)
+
+    def decode(self, token: str, token_type: str = ACCESS) -> Dict[str, Any]:
+        """Verified claims of a token of the given type; JWTError if it isn't one."""
+        claims = self.cache.get(token)
+        if claims is None:
+            from jose import jwt
+
+            key = self.ring.get(jwt.get_unverified_header(token).get("kid", LEGACY_KID))
+            if key is None:
+                raise JWTError("Unknown signing key")
+            claims = jwt.decode(token, key.verify_key, algorithms=[key.algorithm])
+            self.cache.put(token, claims)
+        # Access tokens predate the typ claim, so no claim means access
+        if claims.get("typ", ACCESS) != token_type:
+            raise JWTError("Wrong token type")
+        return claims
+
+    def refresh_token(self, user_id: int, email: str, hashed_password: str) -> str:
+        expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        return self.encode({
+            "sub": email, "uid": user_id, "typ": REFRESH, "jti": uuid.uuid4().hex, "exp": expire,
+            "pwd": password_fingerprint(hashed_password),
+        })
+
+    def stream_token(self, user_id: int, email: str) -> str:
+        expire = datetime.utcnow() + timedelta(seconds=settings.NOTIFICATION_STREAM_TOKEN_SECONDS)
+        return self.encode({"sub": email, "uid": user_id, "typ": STREAM, "exp": expire})
+
+
+def password_fingerprint(hashed_password: str) -> str:
+    """
+    Short digest of the stored hash carried by refresh tokens: changing the
+    password changes it, which retires every refresh token issued before.
+    """
+    return hashlib.blake2b(hashed_password.encode(), digest_size=8).hexdigest()
+
+
+tokens = TokenService()
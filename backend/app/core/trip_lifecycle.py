@@ -0,0 +1,196 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import DateTime, delete, insert, literal, update
+from sqlmodel import Session, select
+
+from .config import settings
+from .geo_index import geo_index
+from .search_cache import mark_trip_changed
+from .stats_service import bump_counters
+from .tasks import PeriodicTask
+from ..models.archive import ARCHIVES
+from ..models.booking import Booking, BookingStatus
+from ..models.notification import Notification
+from ..models.trip import Trip, TripStatus
+from ..models.user import User
+
+logger = logging.getLogger("trip_lifecycle")
+
+# Trips are closed once they've departed, and closed trips (with their
+# bookings) and read notifications are eventually moved to the archive
+# tables, so the hot tables hold what's still live. Every step works in
+# batches of LIFECYCLE_BATCH_SIZE rows, one transaction each: a run that dies
+# half way leaves nothing half done, and the next run carries on from there.
+
+LIVE_STATUSES = (TripStatus.OPEN.value, TripStatus.FULL.value)
+CLOSED_STATUSES = (TripStatus.COMPLETED.value, TripStatus.CANCELLED.value)
+
+_trips = Trip.__table__
+_bookings = Booking.__table__
+
+# Last run's numbers, for /admin/metrics
+last_run: Dict[str, int] = {}
+
+
+def _rejected_message(booking_ids: List[int]) -> str:
+    if len(booking_ids) == 1:
+        return f"Your booking #{booking_ids[0]} was declined: the trip departed before it was accepted."
+    refs = ", ".join(f"#{booking_id}" for booking_id in booking_ids)
+    return f"{len(booking_ids)} of your bookings were declined: their trips departed before they were accepted ({refs})."
+
+
+def expire_past_trips(session: Session, batch_size: int = None) -> Dict[str, int]:
+    """
+    Close open and full trips TRIP_EXPIRE_GRACE_MINUTES after departure:
+    completed if they carry an accepted booking, cancelled otherwise. Their
+    pending bookings are rejected, and each customer gets one notification
+    per batch listing all of theirs.
+    """
+    from .notification_service import send_notifications
+
+    batch_size = batch_size or settings.LIFECYCLE_BATCH_SIZE
+    cutoff = datetime.utcnow() - timedelta(minutes=settings.TRIP_EXPIRE_GRACE_MINUTES)
+    done = Counter()
+    while True:
+        trips = session.execute(
+            select(Trip.id, Trip.status, Trip.start_key, Trip.end_key)
+            .where(Trip.status.in_(LIVE_STATUSES))
+            .where(Trip.start_datetime < cutoff)
+            .order_by(Trip.id)
+            .limit(batch_size)
+        ).all()
+        if not trips:
+            break
+        ids = [trip.id for trip in trips]
+        carried = set(session.exec(
+            select(Booking.trip_id).where(Booking.trip_id.in_(ids), Booking.status == BookingStatus.ACCEPTED).distinct()
+        ).all())
+
+        # Conditional on the status we read, like the capacity UPDATEs in
+        # core/reservations.py: a trip that changed meanwhile is left for the
+        # next pass to pick up with its new status
+        connection = session.connection()
+        groups = defaultdict(list)
+        for trip in trips:
+            closed = TripStatus.COMPLETED.value if trip.id in carried else TripStatus.CANCELLED.value
+            groups[(trip.status, closed)].append(trip.id)
+        deltas = Counter()
+        closed_ids = set()
+        for (old, new), group in groups.items():
+            moved = [row.id for row in connection.execute(
+                update(_trips)
+                .where(_trips.c.id.in_(group))
+                .where(_trips.c.status == old)
+                .values(status=new, version=_trips.c.version + 1)
+                .returning(_trips.c.id)
+            )]
+            closed_ids.update(moved)
+            deltas[f"trips.status.{old}"] -= len(moved)
+            deltas[f"trips.status.{new}"] += len(moved)
+            done[new] += len(moved)
+
+        # The trip has gone, so whatever these bookings held goes with it.
+        # Only for the trips closed just now: the others are still live
+        rejected = connection.execute(
+            update(_bookings)
+            .where(_bookings.c.trip_id.in_(closed_ids))
+            .where(_bookings.c.status == BookingStatus.PENDING.value)
+            .values(status=BookingStatus.REJECTED.value, reserved_capacity=None, hold_expires_at=None)
+            .returning(_bookings.c.id, _bookings.c.customer_id)
+        ).all()
+        deltas["bookings.status.pending"] -= len(rejected)
+        deltas["bookings.status.rejected"] += len(rejected)
+        done["rejected"] += len(rejected)
+        bump_counters(connection, deltas)
+        for trip in trips:
+            if trip.id in closed_ids:
+                mark_trip_changed(session, start_key=trip.start_key, end_key=trip.end_key)
+
+        session.commit()
+        for trip_id in closed_ids:
+            geo_index.remove(trip_id)
+
+        if rejected:
+            by_customer = defaultdict(list)
+            for booking_id, customer_id in rejected:
+                by_customer[customer_id].append(booking_id)
+            customers = session.execute(
+                select(User.id, User.phone, User.email).where(User.id.in_(by_customer))
+            ).all()
+            send_notifications(
+                [(phone, email, _rejected_message(sorted(by_customer[user_id])), user_id) for user_id, phone, email in customers],
+                session,
+            )
+
+    if done:
+        logger.info(f"Closed past trips: {dict(done)}")
+    return dict(done)
+
+
+def _move(connection, model, condition, archived_at: datetime) -> int:
+    """Copy the matching rows into the model's archive table, then delete them."""
+    source, archive = model.__table__, ARCHIVES[model]
+    columns = [column.name for column in source.columns]
+    connection.execute(insert(archive).from_select(
+        columns + ["archived_at"],
+        select(*source.columns, literal(archived_at, DateTime)).where(condition),
+    ))
+    return connection.execute(delete(source).where(condition)).rowcount
+
+
+def archive_old_rows(session: Session, batch_size: int = None) -> Dict[str, int]:
+    """
+    Move trips closed and departed more than ARCHIVE_AFTER_DAYS ago, with
+    their bookings, and read notifications that old to the archive tables.
+    Admin counters keep counting archived rows (see stats_service.reconcile).
+    """
+    batch_size = batch_size or settings.LIFECYCLE_BATCH_SIZE
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    moved = Counter()
+
+    while True:
+        ids = session.exec(
+            select(Trip.id)
+            .where(Trip.status.in_(CLOSED_STATUSES))
+            .where(Trip.start_datetime < cutoff)
+            .order_by(Trip.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        connection = session.connection()
+        moved["bookings"] += _move(connection, Booking, Booking.trip_id.in_(ids), now)
+        moved["trips"] += _move(connection, Trip, Trip.id.in_(ids), now)
+        session.commit()
+
+    while True:
+        ids = session.exec(
+            select(Notification.id)
+            .where(Notification.is_read == True)
+            .where(Notification.created_at < cutoff)
+            .order_by(Notification.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        moved["notifications"] += _move(session.connection(), Notification, Notification.id.in_(ids), now)
+        session.commit()
+
+    if moved:
+        logger.info(f"Archived {dict(moved)}")
+    return dict(moved)
+
+
+def run_lifecycle(session: Session):
+    expired = expire_past_trips(session)
+    archived = archive_old_rows(session)
+    last_run.clear()
+    last_run.update({"finished_at": datetime.utcnow().timestamp(), **expired, **{f"archived_{k}": v for k, v in archived.items()}})
+
+
+# Started from main.on_startup: runs right away, then every TRIP_LIFECYCLE_INTERVAL_SECONDS
+trip_lifecycle = PeriodicTask("trip-lifecycle", lambda: settings.TRIP_LIFECYCLE_INTERVAL_SECONDS, run_lifecycle)
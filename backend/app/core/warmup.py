@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger("warmup")
+
+
+class Warmup:
+    """
+    Startup work that doesn't have to hold up the server: loading the geo
+    index, spinning up the hashing pool, importing what was left out of the
+    import path. Steps run one after another on a thread once startup is done;
+    /ready answers 503 until all of them have finished, and keeps doing so
+    if one failed.
+    """
+
+    def __init__(self):
+        self._steps: List[Tuple[str, Callable[[], object]]] = []
+        self._status: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.started_at = None
+        self.finished_at = None
+
+    def add(self, name: str, fn: Callable[[], object]):
+        with self._lock:
+            self._steps = [step for step in self._steps if step[0] != name] + [(name, fn)]
+            self._status[name] = {"status": "pending"}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            self._status = {name: {"status": "pending"} for name, _ in self._steps}
+            self.started_at, self.finished_at = time.monotonic(), None
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for name, fn in list(self._steps):
+            began = time.perf_counter()
+            try:
+                fn()
+                status = {"status": "done"}
+            except Exception as e:
+                logger.error(f"Warm-up step {name} failed: {e}")
+                status = {"status": "failed", "error": str(e)}
+            status["ms"] = round((time.perf_counter() - began) * 1000, 1)
+            with self._lock:
+                self._status[name] = status
+        self.finished_at = time.monotonic()
+        logger.info(f"Warm-up finished in {self.finished_at - self.started_at:.2f}s")
+
+    def wait(self, timeout: float = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self.finished_at is not None and all(s["status"] == "done" for s in self._status.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            steps = {name: dict(status) for name, status in self._status.items()}
+        stats = {"ready": self.ready, "steps": steps}
+        if self.finished_at is not None:
+            stats["seconds"] = round(self.finished_at - self.started_at, 3)
+        return stats
+
+
+warmup = Warmup()
@@ -1,6 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth
+from fastapi.responses import JSONResponse, PlainTextResponse
+from .core.admission import AdmissionMiddleware
+from .core.replicas import ReadYourWritesMiddleware
+from .core.config import settings
+from .core.instrumentation import InstrumentationMiddleware, gauges, metrics
+from .core.security import HashingBusyError
+from .routers import auth, vehicles, trips, bookings, admin, users, notifications
 
 app = FastAPI(
     title="Smart Transport Load-Matching System",
@@ -8,6 +14,12 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Innermost: only sees requests that were let in
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Inside CORS, so preflights are free and 429/503s still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -15,13 +27,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing", "Retry-After"],
 )
 
+# Added last so it wraps everything else, CORS included
+app.add_middleware(InstrumentationMiddleware)
+
+@app.exception_handler(HashingBusyError)
+def hashing_busy_handler(request: Request, exc: HashingBusyError):
+    return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"}, headers={"Retry-After": "1"})
+
 app.include_router(auth.router)
-from .routers import vehicles, trips
 app.include_router(vehicles.router)
 app.include_router(trips.router)
-from .routers import bookings, admin, users, notifications
 app.include_router(bookings.router)
 app.include_router(admin.router)
 app.include_router(users.router)
@@ -29,20 +47,134 @@ app.include_router(notifications.router)
 
 @app.on_event("startup")
 def on_startup():
-    from .core.database import create_db_and_tables
-    create_db_and_tables()
-    
-    # Auto-create default admin on startup for deployment convenience
+    # Only what requests can't do without happens here; the rest is warm-up
+    # on a thread, reported by /ready
+    from .core.database import engine
+    from .core import migrations
+    if settings.DB_MIGRATE_ON_STARTUP:
+        # One look at schema_version when there's nothing to do
+        migrations.migrate(engine)
+        _ensure_default_admin()
+
+    from .core.email_dispatcher import dispatcher
+    dispatcher.start()
+
+    from .core.reservations import hold_sweeper
+    hold_sweeper.start()
+
+    # The first geo index load is a warm-up step below
+    from .core.geo_index import geo_index, geo_refresher
+    geo_refresher.start(delay=settings.GEO_INDEX_REFRESH_SECONDS)
+
+    # Full-table maintenance can wait until the instance has settled
+    from .core.stats_service import reconciler
+    reconciler.start(delay=settings.BACKGROUND_TASK_DELAY_SECONDS)
+
+    from .core.trip_lifecycle import trip_lifecycle
+    trip_lifecycle.start(delay=settings.BACKGROUND_TASK_DELAY_SECONDS)
+
+    from .core.notification_storage import notification_maintenance
+    notification_maintenance.start(delay=settings.BACKGROUND_TASK_DELAY_SECONDS)
+
+    from .core.idempotency import idempotency_purge
+    idempotency_purge.start(delay=settings.BACKGROUND_TASK_DELAY_SECONDS)
+
+    from .core.refresh_tokens import refresh_token_purge
+    refresh_token_purge.start(delay=settings.BACKGROUND_TASK_DELAY_SECONDS)
+
+    # Like the geo index, loaded by warm-up first
+    from .core.location_search import location_index, location_refresher
+    location_refresher.start(delay=settings.LOCATION_INDEX_REFRESH_SECONDS)
+
+    from sqlmodel import Session
+    from .core.security import hash_pool
+    from .core.tokens import tokens
+    from .core.warmup import warmup
+
+    def check_schema():
+        missing = migrations.pending(engine)
+        if missing:
+            raise RuntimeError(f"{len(missing)} migrations pending, run migrate.py")
+
+    def load_geo_index():
+        with Session(engine) as session:
+            geo_index.refresh(session)
+
+    def load_location_index():
+        with Session(engine) as session:
+            location_index.refresh(session)
+
+    warmup.add("database", check_schema)
+    warmup.add("geo_index", load_geo_index)
+    warmup.add("location_index", load_location_index)
+    warmup.add("tokens", tokens.warm)
+    warmup.add("password_hashing", hash_pool.warm)
+    warmup.start()
+
+def _ensure_default_admin():
     try:
-        from create_admin import create_admin_user
-        create_admin_user("admin@example.com", "admin123", "System Admin")
-        print("Default admin verified/created.")
+        from create_admin import DEFAULT_ADMIN, ensure_admin_user
+        if ensure_admin_user(*DEFAULT_ADMIN):
+            print("Default admin created.")
     except ImportError:
         # Fallback if the script isn't in the path (though it should be in rootDir)
         pass
     except Exception as e:
         print(f"Error creating default admin: {e}")
 
+@app.on_event("shutdown")
+def on_shutdown():
+    from .core.email_dispatcher import dispatcher
+    dispatcher.stop()
+
+    from .core.stats_service import reconciler
+    reconciler.stop()
+
+    from .core.reservations import hold_sweeper
+    hold_sweeper.stop()
+
+    from .core.geo_index import geo_refresher
+    geo_refresher.stop()
+
+    from .core.trip_lifecycle import trip_lifecycle
+    trip_lifecycle.stop()
+
+    from .core.notification_storage import notification_maintenance
+    notification_maintenance.stop()
+
+    from .core.idempotency import idempotency_purge
+    idempotency_purge.stop()
+
+    from .core.refresh_tokens import refresh_token_purge
+    refresh_token_purge.stop()
+
+    from .core.location_search import location_refresher
+    location_refresher.stop()
+
+    from .core.security import hash_pool
+    hash_pool.shutdown()
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Smart Transport Load-Matching System API"}
+
+@app.get("/health", include_in_schema=False)
+def read_health():
+    # Liveness: the process is up and serving
+    return {"status": "ok"}
+
+@app.get("/ready", include_in_schema=False)
+def read_ready():
+    # Readiness: warm-up finished, schema current; 503 (with what's missing) until then
+    from .core.warmup import warmup
+    stats = warmup.stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    # Prometheus scrape target: per-route latency histograms and SQL counts,
+    # plus the component counters also shown on /admin/metrics
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("Not Found", status_code=404)
+    from .routers.admin import component_stats
+    return PlainTextResponse(metrics.render() + gauges(component_stats()), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, DateTime, Table
+from sqlmodel import SQLModel
+
+from .booking import Booking
+from .notification import Notification
+from .trip import Trip
+
+# Old rows moved out of the hot tables by core/trip_lifecycle.py. Same columns
+# as the source plus archived_at; no foreign keys or secondary indexes, since
+# what they pointed at may be archived too and nothing searches these.
+
+def _archive_table(model) -> Table:
+    source = model.__table__
+    return Table(
+        f"{source.name}_archive", SQLModel.metadata,
+        *[Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False, nullable=c.nullable) for c in source.columns],
+        Column("archived_at", DateTime, nullable=False),
+    )
+
+ARCHIVES = {model: _archive_table(model) for model in (Trip, Booking, Notification)}
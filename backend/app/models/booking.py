@@ -1,8 +1,13 @@
-from sqlmodel import SQLModel, Field
-from typing import Optional
+from sqlalchemy import DDL, event
+from sqlmodel import SQLModel, Field, Relationship
+from typing import List, Optional
+from datetime import datetime
 
 from enum import Enum
 
+from .trip import Trip, TripSummary
+from .user import User
+
 class BookingStatus(str, Enum):
     PENDING = "pending"
     ACCEPTED = "accepted"
@@ -18,12 +23,42 @@ class Booking(BookingBase, table=True):
     booking_reference: str = Field(index=True, unique=True)
     trip_id: int = Field(foreign_key="trip.id")
     customer_id: int = Field(foreign_key="user.id")
+    # Capacity taken off the trip for this booking (in the trip's unit), see
+    # core/reservations.py. Pending bookings hold it until hold_expires_at.
+    reserved_capacity: Optional[float] = None
+    hold_expires_at: Optional[datetime] = Field(default=None, index=True)
+
+    trip: Optional[Trip] = Relationship(back_populates="bookings")
+    customer: Optional[User] = Relationship()
+
+# One pending booking per customer and trip, so a retried POST can't queue
+# the same request twice; accepted and rejected ones don't count. Plain DDL
+# because Index() only takes the WHERE clause per dialect.
+PENDING_UNIQUE_INDEX = DDL(
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_booking_pending_customer_trip "
+    "ON booking (customer_id, trip_id) WHERE status = 'pending'"
+)
+event.listen(Booking.__table__, "after_create", PENDING_UNIQUE_INDEX)
 
 class BookingCreate(BookingBase):
     trip_id: int
 
+class BookingStatusBulkUpdate(SQLModel):
+    booking_ids: List[int]
+    status: str
+
 class BookingRead(BookingBase):
     id: int
     booking_reference: str
     trip_id: int
     customer_id: int
+    hold_expires_at: Optional[datetime] = None
+
+class CustomerSummary(SQLModel):
+    id: int
+    full_name: Optional[str] = None
+    phone: Optional[str] = None
+
+class BookingReadWithTrip(BookingRead):
+    trip: Optional[TripSummary] = None
+    customer: Optional[CustomerSummary] = None
@@ -0,0 +1,13 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+class IdempotencyRecord(SQLModel, table=True):
+    # Response to a request sent with an Idempotency-Key, replayed to retries
+    # of it until expires_at (see core/idempotency.py)
+    user_id: int = Field(primary_key=True)
+    key: str = Field(primary_key=True, max_length=255)
+    request_hash: str # the request it answered; the same key with another body is an error
+    status_code: int
+    body: bytes
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
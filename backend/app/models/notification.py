@@ -1,11 +1,46 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from typing import Optional
 from datetime import datetime
 
+from enum import Enum
+
 class Notification(SQLModel, table=True):
+    __table_args__ = (
+        # Per-user listings (all or unread only) without touching other users' rows
+        Index("ix_notification_user_read_created", "user_id", "is_read", "created_at"),
+    )
+    # On Postgres the table is partitioned by month, see core/notification_storage.py
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(index=True)
     message: str
     type: str = "general" # email, sms, in-app
     is_read: bool = Field(default=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class NotificationCounter(SQLModel, table=True):
+    # Unread notifications per user, kept in step by core/notification_storage.py
+    user_id: int = Field(primary_key=True)
+    unread: int = Field(default=0)
+
+class OutboxStatus(str, Enum):
+    PENDING = "pending"
+    SENDING = "sending" # claimed by a dispatcher until next_attempt_at, then up for grabs again
+    SENT = "sent"
+    FAILED = "failed"
+
+class EmailOutbox(SQLModel, table=True):
+    # Persistent queue of outgoing emails, drained by the email dispatcher.
+    # Rows stay "pending" until delivered, so nothing is lost on restart.
+    # While a worker sends one it is "sending" and next_attempt_at is the end of its lease.
+    id: Optional[int] = Field(default=None, primary_key=True)
+    recipient: str
+    subject: str
+    body: str
+    status: str = Field(default="pending", index=True)
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
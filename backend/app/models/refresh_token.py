@@ -0,0 +1,11 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+class SpentRefreshToken(SQLModel, table=True):
+    # jti of a refresh token already swapped at /auth/refresh; refresh tokens
+    # are single use (see core/refresh_tokens.py). Kept until the token would
+    # have expired anyway.
+    jti: str = Field(primary_key=True, max_length=64)
+    user_id: int = Field(index=True)
+    spent_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
@@ -0,0 +1,7 @@
+from sqlmodel import SQLModel, Field
+
+class StatCounter(SQLModel, table=True):
+    # Incrementally maintained row counts for the admin dashboard, e.g.
+    # "users.total", "users.role.owner", "trips.status.open"
+    name: str = Field(primary_key=True)
+    value: int = Field(default=0)
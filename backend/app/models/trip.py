@@ -1,9 +1,15 @@
 from sqlmodel import SQLModel, Field, Relationship
-from typing import Optional
+from sqlalchemy import Column, Index, Integer
+from typing import List, Optional, TYPE_CHECKING
 from datetime import datetime
 
 from enum import Enum
 
+from .vehicle import Vehicle, VehicleSummary
+
+if TYPE_CHECKING:
+    from .booking import Booking
+
 class TripStatus(str, Enum):
     OPEN = "open"
     FULL = "full"
@@ -18,14 +24,53 @@ class TripBase(SQLModel):
     price_per_unit: float # e.g. per ton or fixed
     description: Optional[str] = None
     status: str = Field(default="open") # Using str for simplicity with SQLite
+    # Optional coordinates of pickup and drop, used by coordinate search
+    start_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    start_lon: Optional[float] = Field(default=None, ge=-180, le=180)
+    end_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    end_lon: Optional[float] = Field(default=None, ge=-180, le=180)
+
+# Optimistic concurrency: every ORM UPDATE of a trip checks and bumps this,
+# and so do the conditional capacity UPDATEs in core/reservations.py
+_trip_version = Column("version", Integer, nullable=False, default=1)
 
 class Trip(TripBase, table=True):
+    __table_args__ = (
+        # Serves trip search: equality on status/route, range on departure time
+        Index("ix_trip_search", "status", "start_key", "end_key", "start_datetime"),
+    )
+    __mapper_args__ = {"version_id_col": _trip_version}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     vehicle_id: int = Field(foreign_key="vehicle.id")
 
+    # Derived from the free-form fields above, see core/capacity.py
+    start_key: str = Field(default="")
+    end_key: str = Field(default="")
+    capacity_value: Optional[float] = None # total, in capacity_unit
+    remaining_capacity: Optional[float] = None
+    capacity_unit: Optional[str] = None # kg, sqft, m3, pallet
+    version: int = Field(default=1, sa_column=_trip_version)
+
+    vehicle: Optional[Vehicle] = Relationship(back_populates="trips")
+    bookings: List["Booking"] = Relationship(back_populates="trip")
+
 class TripCreate(TripBase):
     vehicle_id: int
 
 class TripRead(TripBase):
     id: int
     vehicle_id: int
+    remaining_capacity: Optional[float] = None
+    capacity_unit: Optional[str] = None
+
+class TripReadWithVehicle(TripRead):
+    vehicle: Optional[VehicleSummary] = None
+
+class TripSummary(SQLModel):
+    id: int
+    start_location: str
+    end_location: str
+    start_datetime: datetime
+    status: str
+    vehicle: Optional[VehicleSummary] = None
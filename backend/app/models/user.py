@@ -22,6 +22,9 @@ class User(UserBase, table=True):
 class UserCreate(UserBase):
     password: str
 
+class TokenRefresh(SQLModel):
+    refresh_token: str
+
 class UserUpdate(SQLModel):
     full_name: Optional[str] = None
     phone: Optional[str] = None
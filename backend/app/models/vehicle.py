@@ -1,8 +1,9 @@
 from sqlmodel import SQLModel, Field, Relationship
-from typing import Optional, TYPE_CHECKING
+from typing import List, Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .user import User
+    from .trip import Trip
 
 class VehicleBase(SQLModel):
     type: str # e.g. Truck, Van
@@ -12,6 +13,11 @@ class VehicleBase(SQLModel):
 class Vehicle(VehicleBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     owner_id: int = Field(foreign_key="user.id")
+    capacity_value: Optional[float] = None # parsed from capacity, see core/capacity.py
+    capacity_unit: Optional[str] = None
+
+    owner: Optional["User"] = Relationship()
+    trips: List["Trip"] = Relationship(back_populates="vehicle")
 
 class VehicleCreate(VehicleBase):
     pass
@@ -19,3 +25,17 @@ class VehicleCreate(VehicleBase):
 class VehicleRead(VehicleBase):
     id: int
     owner_id: int
+    capacity_value: Optional[float] = None
+    capacity_unit: Optional[str] = None
+
+class OwnerSummary(SQLModel):
+    id: int
+    full_name: Optional[str] = None
+    phone: Optional[str] = None
+    is_verified: bool = False
+
+class VehicleSummary(SQLModel):
+    id: int
+    type: str
+    registration_number: str
+    owner: Optional[OwnerSummary] = None
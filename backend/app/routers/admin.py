@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlmodel import Session, select
 from typing import List
-from ..core.database import get_session
+from ..core.database import get_read_session, get_session
 from ..models.user import User, Role, UserRead
-from ..models.trip import Trip
-from ..models.booking import Booking
-from .vehicles import get_current_user
+from ..core.deps import get_current_user
+from ..core.pagination import PageParams, paginate, stream_ndjson
+from ..core.principal_cache import principal_cache
+from ..core.stats_service import read_counters
+from ..core.security import hash_pool
+from ..core.notification_hub import hub
+from ..core.geo_index import geo_index
+from ..core.search_cache import search_cache
+from ..core import trip_lifecycle
+from ..core.tokens import tokens
+from ..core.warmup import warmup
+from ..core.idempotency import idempotency
+from ..core.admission import admission
+from ..core.location_search import location_index
+from ..core.replicas import read_router
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -15,9 +27,11 @@ def get_current_admin(current_user: User = Depends(get_current_user)):
     return current_user
 
 @router.get("/users", response_model=List[UserRead])
-def get_all_users(session: Session = Depends(get_session), admin: User = Depends(get_current_admin)):
-    users = session.exec(select(User)).all()
-    return users
+def get_all_users(response: Response, page: PageParams = Depends(), session: Session = Depends(get_session), admin: User = Depends(get_current_admin)):
+    ordering = [(User.id, False)]
+    if page.stream:
+        return stream_ndjson(select(User), ordering, page.cursor, UserRead)
+    return paginate(session, select(User), ordering, page, response)
 
 @router.put("/users/{user_id}/verify", response_model=UserRead)
 def verify_user(user_id: int, session: Session = Depends(get_session), admin: User = Depends(get_current_admin)):
@@ -27,18 +41,26 @@ def verify_user(user_id: int, session: Session = Depends(get_session), admin: Us
     user.is_verified = True
     session.add(user)
     session.commit()
+    principal_cache.invalidate(user.email)
     session.refresh(user)
     return user
 
 @router.get("/stats")
-def get_system_stats(session: Session = Depends(get_session), admin: User = Depends(get_current_admin)):
-    user_count = len(session.exec(select(User)).all())
-    trip_count = len(session.exec(select(Trip)).all())
-    booking_count = len(session.exec(select(Booking)).all())
+def get_system_stats(session: Session = Depends(get_read_session), admin: User = Depends(get_current_admin)):
+    # Served from the counters table (a handful of rows) instead of counting
+    # the tables themselves; see core/stats_service.py
+    counters = read_counters(session)
+
+    def breakdown(prefix):
+        return {name[len(prefix):]: value for name, value in counters.items() if name.startswith(prefix)}
+
     return {
-        "total_users": user_count,
-        "total_trips": trip_count,
-        "total_bookings": booking_count
+        "total_users": counters.get("users.total", 0),
+        "total_trips": counters.get("trips.total", 0),
+        "total_bookings": counters.get("bookings.total", 0),
+        "users_by_role": breakdown("users.role."),
+        "trips_by_status": breakdown("trips.status."),
+        "bookings_by_status": breakdown("bookings.status."),
     }
 
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -51,6 +73,28 @@ def delete_user(user_id: int, session: Session = Depends(get_session), admin: Us
     if user.id == admin.id:
          raise HTTPException(status_code=400, detail="Cannot delete yourself")
 
+    email = user.email
     session.delete(user)
     session.commit()
+    principal_cache.invalidate(email)
     return None
+
+def component_stats() -> dict:
+    return {
+        "principal_cache": principal_cache.stats(),
+        "password_hashing": hash_pool.stats(),
+        "notification_stream": hub.stats(),
+        "geo_index": geo_index.stats(),
+        "location_index": location_index.stats(),
+        "read_routing": read_router.stats(),
+        "search_cache": search_cache.stats(),
+        "trip_lifecycle": dict(trip_lifecycle.last_run),
+        "token_cache": tokens.cache.stats(),
+        "warmup": warmup.stats(),
+        "idempotency": idempotency.stats(),
+        "admission": admission.stats(),
+    }
+
+@router.get("/metrics")
+def get_metrics(admin: User = Depends(get_current_admin)):
+    return component_stats()
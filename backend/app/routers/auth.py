@@ -1,18 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlmodel import Session, select
-from ..core.database import get_session
-from ..core.security import verify_password, create_access_token, get_password_hash, oauth2_scheme
-from ..models.user import User, UserCreate, UserRead, Role
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..core.database import get_async_session
+from ..core.security import verify_and_update_password, create_access_token, get_password_hash, oauth2_scheme, hash_pool
+from ..models.user import User, UserCreate, UserRead, Role, TokenRefresh
 from datetime import timedelta
 from ..core.config import settings
+from ..core.tokens import REFRESH, password_fingerprint, tokens
+from ..core import refresh_tokens
+from jose import JWTError
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 @router.post("/signup", response_model=UserRead)
-def signup(user: UserCreate, session: Session = Depends(get_session)):
+async def signup(user: UserCreate, session: AsyncSession = Depends(get_async_session)):
     statement = select(User).where(User.email == user.email)
-    results = session.exec(statement)
+    results = await session.exec(statement)
     existing_user = results.first()
     if existing_user:
         raise HTTPException(
@@ -20,15 +24,17 @@ def signup(user: UserCreate, session: Session = Depends(get_session)):
             detail="Email already registered"
         )
     
+    # pbkdf2 is CPU bound, keep it off the event loop and request threads.
+    # Outside the try: a full pool is a 503 (see main.py), not a 500
+    hashed_pass = await hash_pool.run(get_password_hash, user.password)
     try:
-        hashed_pass = get_password_hash(user.password)
         user_data = user.dict()
         if "password" in user_data:
             del user_data["password"]
         db_user = User(**user_data, hashed_password=hashed_pass)
         session.add(db_user)
-        session.commit()
-        session.refresh(db_user)
+        await session.commit()
+        await session.refresh(db_user)
         return db_user
     except Exception as e:
         import traceback
@@ -39,25 +45,69 @@ def signup(user: UserCreate, session: Session = Depends(get_session)):
     from ..core.notification_service import send_notification
     # Note: user_id might be None before commit/refresh, but here it is refreshed
     if db_user.id:
-        send_notification(db_user.phone, db_user.email, f"Welcome {db_user.full_name} to SmartTrans! Your account is created.", db_user.id, session)
+        await session.run_sync(lambda sync_session: send_notification(db_user.phone, db_user.email, f"Welcome {db_user.full_name} to SmartTrans! Your account is created.", db_user.id, sync_session))
     
     return db_user
 
 @router.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_async_session)):
     statement = select(User).where(User.email == form_data.username)
-    results = session.exec(statement) # returns an iterator
+    results = await session.exec(statement)
     user = results.first()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await hash_pool.run(verify_and_update_password, form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    if new_hash:
+        # Hash was made with an old PASSWORD_HASH_ROUNDS, upgrade it now we know the password
+        user.hashed_password = new_hash
+        session.add(user)
+        await session.commit()
     
+    return _issue_tokens(user)
+
+@router.post("/refresh")
+async def refresh(body: TokenRefresh, session: AsyncSession = Depends(get_async_session)):
+    """
+    Swap a refresh token for a new access token and a new refresh token
+    without the password, so expiring access tokens don't mean logging in
+    again and another round of pbkdf2. Each refresh token works once.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        claims = tokens.decode(body.refresh_token, REFRESH)
+    except JWTError:
+        raise invalid
+    user = await session.get(User, claims.get("uid"))
+    # Gone, renamed, or password changed since the token was issued
+    if user is None or user.email != claims.get("sub") or password_fingerprint(user.hashed_password) != claims.get("pwd"):
+        raise invalid
+    # Already swapped once: a replay, see core/refresh_tokens.py
+    if not await session.run_sync(lambda sync_session: refresh_tokens.spend(sync_session, claims)):
+        raise invalid
+    return _issue_tokens(user)
+
+def _issue_tokens(user: User) -> dict:
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email, "role": user.role}, expires_delta=access_token_expires
+        data={"sub": user.email, "role": user.role, "uid": user.id}, expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer", "role": user.role, "user_id": user.id}
+    return {
+        "access_token": access_token,
+        "refresh_token": tokens.refresh_token(user.id, user.email, user.hashed_password),
+        "token_type": "bearer",
+        "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "role": user.role,
+        "user_id": user.id,
+    }
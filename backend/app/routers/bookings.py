@@ -1,105 +1,207 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
-from typing import List
-from ..core.database import get_session
-from ..models.booking import Booking, BookingCreate, BookingRead, BookingStatus
-from ..models.trip import Trip, TripStatus
-from ..models.vehicle import Vehicle
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Dict, List, Optional
+from ..core.database import get_async_read_session, get_async_session, read_engine
+from sqlalchemy.orm import aliased, joinedload
+from ..models.booking import Booking, BookingCreate, BookingRead, BookingReadWithTrip, BookingStatus, BookingStatusBulkUpdate, CustomerSummary
+from ..models.trip import Trip, TripStatus, TripSummary
+from ..models.vehicle import OwnerSummary, Vehicle, VehicleSummary
 from ..models.user import User, Role
-from .vehicles import get_current_user # importing dependency
+from ..core.deps import get_async_current_user
+from ..core import reservations
+from ..core.pagination import PageParams, page_response, paginate_async, stream_ndjson
+from ..core.idempotency import idempotency, request_hash
+from ..core.serialization import FastJSONResponse, Projection, dumps
 
 router = APIRouter(prefix="/bookings", tags=["bookings"])
 
+# Newest bookings first
+BOOKING_ORDERING = [(Booking.id, True)]
+
+MAX_BULK_BOOKINGS = 500
+
+# The list endpoint reads Booking -> Trip -> Vehicle -> owner plus the
+# customer, all many-to-one, as flat columns of one JOINed query (see
+# core/serialization.py). Owner and customer are both users, hence the aliases.
+Owner = aliased(User)
+Customer = aliased(User)
+BOOKING_ROWS = Projection(
+    BookingReadWithTrip, Booking,
+    trip=Projection(TripSummary, Trip, vehicle=Projection(VehicleSummary, Vehicle, owner=Projection(OwnerSummary, Owner))),
+    customer=Projection(CustomerSummary, Customer),
+)
+
+def _apply_status(sync_session, booking: Booking, trip: Trip, status_update: str):
+    # Capacity moves with the booking: accepting keeps (or takes) its share of
+    # the trip, rejecting hands it back. See core/reservations.py
+    if status_update == BookingStatus.ACCEPTED and booking.status != BookingStatus.ACCEPTED:
+        if not reservations.confirm(sync_session, booking, trip):
+            raise HTTPException(status_code=400, detail=f"Not enough capacity left on this trip for booking #{booking.id}")
+    elif status_update == BookingStatus.REJECTED:
+        reservations.cancel(sync_session, booking)
+    booking.status = status_update
+
 @router.post("/", response_model=BookingRead)
-def create_booking(booking: BookingCreate, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+async def create_booking(
+    booking: BookingCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    current_user: User = Depends(get_async_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
     if current_user.role != Role.CUSTOMER:
         raise HTTPException(status_code=403, detail="Only customers can book trips")
+
+    # A retry of a request that already went through gets the same response
+    # back, without touching the trip or notifying anyone again
+    if idempotency_key:
+        fingerprint = request_hash("POST /bookings/", booking.dict())
+        replay = idempotency.replay(current_user.id, idempotency_key, fingerprint) or await session.run_sync(
+            lambda sync_session: idempotency.load(sync_session, current_user.id, idempotency_key, fingerprint)
+        )
+        if replay is not None:
+            return replay
     
-    trip = session.get(Trip, booking.trip_id)
+    trip = await session.get(Trip, booking.trip_id, options=[joinedload(Trip.vehicle).joinedload(Vehicle.owner)])
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     if trip.status != TripStatus.OPEN:
         raise HTTPException(status_code=400, detail="Trip is not available")
     
-    # Check if user already booked this trip? (Optional)
-    
     # Generate Unique Reference
     import uuid
     reference = f"BK-{str(uuid.uuid4())[:8].upper()}"
     
     db_booking = Booking.from_orm(booking, update={"customer_id": current_user.id, "booking_reference": reference})
+    # Reserve the cargo's capacity in the same transaction as the insert
+    if not await session.run_sync(lambda sync_session: reservations.hold(sync_session, db_booking, trip)):
+        raise HTTPException(status_code=409, detail="Not enough capacity left on this trip")
     session.add(db_booking)
-    session.commit()
-    session.refresh(db_booking)
+    try:
+        await session.flush()
+        body = dumps(jsonable_encoder(BookingRead.from_orm(db_booking)))
+        if idempotency_key:
+            stored = idempotency.save(session, current_user.id, idempotency_key, fingerprint, body)
+        await session.commit()
+    except IntegrityError:
+        # Either a concurrent retry with the same key got there first (then
+        # answer with its response), or there's already a pending booking of
+        # this trip by this customer (ux_booking_pending_customer_trip)
+        await session.rollback()
+        if idempotency_key:
+            replay = await session.run_sync(
+                lambda sync_session: idempotency.load(sync_session, current_user.id, idempotency_key, fingerprint)
+            )
+            if replay is not None:
+                return replay
+        raise HTTPException(status_code=409, detail="You already have a pending booking for this trip")
+    if idempotency_key:
+        idempotency.remember(current_user.id, idempotency_key, stored)
     
-    # Notify Truck Owner of new booking
+    # Notify Truck Owner of new booking (loaded along with the trip)
     from ..core.notification_service import send_notification
-    # Trip -> Vehicle -> Owner
-    # We already fetched 'trip', now need owner
-    db_trip = session.get(Trip, booking.trip_id)
-    if db_trip:
-        vehicle = session.get(Vehicle, db_trip.vehicle_id)
-        if vehicle:
-             owner = session.get(User, vehicle.owner_id)
-             if owner:
-                 send_notification(
-                     owner.phone, 
-                     owner.email, 
-                     f"New Booking Request #{db_booking.id} for your trip from {db_trip.start_location} to {db_trip.end_location}",
-                     owner.id,
-                     session
-                 )
+    owner = trip.vehicle.owner if trip.vehicle else None
+    if owner:
+        await session.run_sync(lambda sync_session: send_notification(
+            owner.phone, 
+            owner.email, 
+            f"New Booking Request #{db_booking.id} for your trip from {trip.start_location} to {trip.end_location}",
+            owner.id,
+            sync_session
+        ))
     
-    return db_booking
+    return FastJSONResponse(body)
 
-@router.get("/", response_model=List[BookingRead])
-def read_my_bookings(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+@router.get("/", response_model=List[BookingReadWithTrip])
+async def read_my_bookings(request: Request, response: Response, page: PageParams = Depends(), current_user: User = Depends(get_async_current_user), session: AsyncSession = Depends(get_async_read_session)):
+    statement = BOOKING_ROWS.select()
     if current_user.role == Role.CUSTOMER:
-        statement = select(Booking).where(Booking.customer_id == current_user.id)
+        statement = statement.where(Booking.customer_id == current_user.id)
     elif current_user.role == Role.OWNER:
-        # Get bookings for trips owned by this user
-        # Join Booking -> Trip -> Vehicle -> User
-        statement = select(Booking).join(Trip).join(Vehicle).where(Vehicle.owner_id == current_user.id)
-    else: # Admin
-        statement = select(Booking)
+        # Get bookings for trips owned by this user (Booking -> Trip -> Vehicle is already joined)
+        statement = statement.where(Vehicle.owner_id == current_user.id)
+    # Admin sees everything
         
-    results = session.exec(statement)
-    return results.all()
+    if page.stream:
+        return stream_ndjson(statement, BOOKING_ORDERING, page.cursor, BOOKING_ROWS, read_engine(request))
+    rows = await paginate_async(session, statement, BOOKING_ORDERING, page, response)
+    return page_response([BOOKING_ROWS.build(row) for row in rows], response)
 
 @router.put("/{booking_id}/status", response_model=BookingRead)
-def update_booking_status(booking_id: int, status_update: str, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+async def update_booking_status(booking_id: int, status_update: str, current_user: User = Depends(get_async_current_user), session: AsyncSession = Depends(get_async_session)):
     # BookingStatus Enum: accepted, rejected
-    booking = session.get(Booking, booking_id)
+    booking = await session.get(Booking, booking_id, options=[joinedload(Booking.trip).joinedload(Trip.vehicle), joinedload(Booking.customer)])
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    trip = session.get(Trip, booking.trip_id)
-    vehicle = session.get(Vehicle, trip.vehicle_id)
+    trip = booking.trip
     
     # Only owner of the trip can update status
-    if vehicle.owner_id != current_user.id:
+    if trip.vehicle.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to manage this booking")
 
     if status_update not in [BookingStatus.ACCEPTED, BookingStatus.REJECTED]:
          raise HTTPException(status_code=400, detail="Invalid status")
     
-    booking.status = status_update
+    await session.run_sync(lambda sync_session: _apply_status(sync_session, booking, trip, status_update))
     session.add(booking)
-    
-    if status_update == BookingStatus.ACCEPTED:
-        # Start "Simulation" or update capacity?
-        # For MVP, maybe just update status.
-        # If trip is full, update trip status.
-        # trip.status = TripStatus.FULL (Logic dependent on capacity math)
-        pass
-        
-    session.commit()
-    session.refresh(booking)
+    await session.commit()
     
     # Send Notification to Customer
     from ..core.notification_service import send_notification
-    customer = session.get(User, booking.customer_id)
+    customer = booking.customer
     if customer:
-        send_notification(customer.phone, customer.email, f"Your booking #{booking.id} status is now: {status_update}", customer.id, session)
+        await session.run_sync(lambda sync_session: send_notification(customer.phone, customer.email, f"Your booking #{booking.id} status is now: {status_update}", customer.id, sync_session))
         
     return booking
+
+@router.put("/status", response_model=List[BookingRead])
+async def update_booking_status_bulk(update: BookingStatusBulkUpdate, current_user: User = Depends(get_async_current_user), session: AsyncSession = Depends(get_async_session)):
+    """Accept or reject many bookings in one transaction; all or nothing."""
+    if update.status not in [BookingStatus.ACCEPTED, BookingStatus.REJECTED]:
+         raise HTTPException(status_code=400, detail="Invalid status")
+    booking_ids = list(dict.fromkeys(update.booking_ids))
+    if not booking_ids:
+        return []
+    if len(booking_ids) > MAX_BULK_BOOKINGS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_BOOKINGS} bookings per request")
+
+    # One query for bookings, their trips and the vehicles that prove ownership
+    statement = (
+        select(Booking, Trip, Vehicle)
+        .join(Trip, Booking.trip_id == Trip.id)
+        .join(Vehicle, Trip.vehicle_id == Vehicle.id)
+        .where(Booking.id.in_(booking_ids))
+        .options(joinedload(Booking.customer))
+        .order_by(Booking.id)
+    )
+    rows = (await session.exec(statement)).all()
+    if len(rows) != len(booking_ids):
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if any(vehicle.owner_id != current_user.id for _, _, vehicle in rows):
+        raise HTTPException(status_code=403, detail="Not authorized to manage this booking")
+
+    def apply_all(sync_session):
+        for booking, trip, _ in rows:
+            _apply_status(sync_session, booking, trip, update.status)
+            sync_session.add(booking)
+    await session.run_sync(apply_all)
+    await session.commit()
+
+    # One notification per customer, however many of their bookings changed
+    by_customer: Dict[int, List[int]] = {}
+    customers: Dict[int, User] = {}
+    for booking, _, _ in rows:
+        by_customer.setdefault(booking.customer_id, []).append(booking.id)
+        customers[booking.customer_id] = booking.customer
+    items = []
+    for customer in customers.values():
+        ids = ", ".join(f"#{booking_id}" for booking_id in by_customer[customer.id])
+        label = "booking" if len(by_customer[customer.id]) == 1 else "bookings"
+        items.append((customer.phone, customer.email, f"Your {label} {ids} status is now: {update.status}", customer.id))
+    from ..core.notification_service import send_notifications
+    await session.run_sync(lambda sync_session: send_notifications(items, sync_session))
+
+    return [booking for booking, _, _ in rows]
@@ -1,30 +1,179 @@
-from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
-from typing import List
-from ..core.database import get_session
+import asyncio
+import json
+from fastapi import APIRouter, Depends, Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
+from ..core.config import settings
+from ..core.database import async_session, get_async_read_session, get_async_session, read_engine
+from ..core.security import oauth2_scheme_optional
+from ..core.notification_hub import hub
 from ..models.notification import Notification
-from ..routers.vehicles import get_current_user
+from ..core.deps import get_async_current_user, user_from_token
+from ..core.tokens import STREAM, tokens
 from ..models.user import User
+from ..core.pagination import PageParams, paginate_async, stream_ndjson
+from ..core.notification_storage import mark_read, read_unread
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
+# Newest first; id breaks ties between notifications created in the same instant
+NOTIFICATION_ORDERING = [(Notification.created_at, True), (Notification.id, True)]
+
 @router.get("/", response_model=List[Notification])
-def get_my_notifications(
-    current_user: User = Depends(get_current_user), 
-    session: Session = Depends(get_session)
+async def get_my_notifications(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    unread: bool = False, # only notifications not read yet
+    current_user: User = Depends(get_async_current_user), 
+    session: AsyncSession = Depends(get_async_read_session)
 ):
-    statement = select(Notification).where(Notification.user_id == current_user.id).order_by(Notification.created_at.desc())
-    return session.exec(statement).all()
+    statement = select(Notification).where(Notification.user_id == current_user.id)
+    if unread:
+        statement = statement.where(Notification.is_read == False)
+    if page.stream:
+        return stream_ndjson(statement, NOTIFICATION_ORDERING, page.cursor, Notification, read_engine(request))
+    return await paginate_async(session, statement, NOTIFICATION_ORDERING, page, response)
 
 @router.put("/{notification_id}/read")
-def mark_notification_read(
+async def mark_notification_read(
     notification_id: int,
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    current_user: User = Depends(get_async_current_user),
+    session: AsyncSession = Depends(get_async_session)
 ):
-    notification = session.get(Notification, notification_id)
-    if notification and notification.user_id == current_user.id:
-        notification.is_read = True
-        session.add(notification)
-        session.commit()
+    # One conditional UPDATE, no read first; see core/notification_storage.py
+    await session.run_sync(lambda sync_session: mark_read(sync_session, current_user.id, notification_id=notification_id))
+    await session.commit()
     return {"status": "success"}
+
+@router.put("/read-all")
+async def mark_all_read(
+    up_to_id: Optional[int] = None, # only notifications up to this id, e.g. the newest one the client has shown
+    current_user: User = Depends(get_async_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    updated = await session.run_sync(lambda sync_session: mark_read(sync_session, current_user.id, up_to_id=up_to_id))
+    await session.commit()
+    return {"status": "success", "updated": updated}
+
+@router.get("/unread-count")
+async def get_unread_count(
+    current_user: User = Depends(get_async_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    # Per-user counter row, however many notifications there are
+    return {"unread": await session.run_sync(lambda sync_session: read_unread(sync_session, current_user.id))}
+
+@router.post("/stream-token")
+async def create_stream_token(current_user: User = Depends(get_async_current_user)):
+    # For EventSource, which can't send an Authorization header: a token that
+    # only opens the stream and expires in a minute is what goes in the URL
+    # (and so in access logs), never the bearer token
+    return {
+        "stream_token": tokens.stream_token(current_user.id, current_user.email),
+        "expires_in": settings.NOTIFICATION_STREAM_TOKEN_SECONDS,
+    }
+
+async def get_stream_user(
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    stream_token: Optional[str] = Query(default=None),
+) -> User:
+    # Checked when the stream opens only, so it outlives its token. Its own
+    # session, closed right away: a session dependency would only be cleaned
+    # up when the response ends, i.e. hold a pooled connection per open stream
+    async with async_session() as session:
+        if token:
+            return await session.run_sync(lambda sync_session: user_from_token(token, sync_session))
+        return await session.run_sync(lambda sync_session: user_from_token(stream_token or "", sync_session, STREAM))
+
+def _sse(notification: dict) -> str:
+    return f"id: {notification['id']}\nevent: notification\ndata: {json.dumps(notification)}\n\n"
+
+def _missed(user_id: int, after_id: int):
+    return (
+        select(Notification)
+        .where(Notification.user_id == user_id, Notification.id > after_id)
+        .order_by(Notification.id)
+        .limit(settings.NOTIFICATION_STREAM_BACKFILL)
+    )
+
+class NotificationStream(StreamingResponse):
+    """Drops the hub subscription once the response is over, even if the body never started."""
+
+    def __init__(self, content, subscription, **kwargs):
+        super().__init__(content, **kwargs)
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            hub.unsubscribe(self.subscription)
+
+@router.get("/stream")
+async def stream_notifications(
+    request: Request,
+    last_event_id: Optional[int] = Header(default=None),
+    last_id: Optional[int] = Query(default=None),
+    current_user: User = Depends(get_stream_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Server-Sent Events stream of the user's new notifications. Reconnecting
+    clients send Last-Event-ID (browsers do this automatically) or ?last_id=
+    and first get everything they missed, NOTIFICATION_STREAM_BACKFILL per query.
+    """
+    user_id = current_user.id
+    # Subscribe before reading the backlog so nothing falls in between
+    subscription = hub.subscribe(user_id)
+    resume_from = last_event_id if last_event_id is not None else last_id
+    backlog = []
+    try:
+        if resume_from is not None:
+            backlog = [jsonable_encoder(n) for n in (await session.exec(_missed(user_id, resume_from))).all()]
+    except BaseException:
+        hub.unsubscribe(subscription)
+        raise
+    finally:
+        # Don't hold a pooled connection for the lifetime of the stream
+        await session.close()
+
+    async def events():
+        sent_up_to = resume_from or 0
+        try:
+            page = backlog
+            while page:
+                for notification in page:
+                    sent_up_to = notification["id"]
+                    yield _sse(notification)
+                if len(page) < settings.NOTIFICATION_STREAM_BACKFILL:
+                    break
+                # Missed more than a page: carry on from the last one sent
+                async with async_session() as page_session:
+                    page = [jsonable_encoder(n) for n in (await page_session.exec(_missed(user_id, sent_up_to))).all()]
+            while not subscription.overflowed:
+                try:
+                    notification = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.NOTIFICATION_STREAM_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if notification["id"] <= sent_up_to:
+                    continue
+                sent_up_to = notification["id"]
+                yield _sse(notification)
+        finally:
+            hub.unsubscribe(subscription)
+
+    return NotificationStream(
+        events(),
+        subscription,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,62 +1,198 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
-from typing import List
-from ..core.database import get_session
-from ..models.trip import Trip, TripCreate, TripRead, TripStatus
-from ..models.vehicle import Vehicle
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from collections import Counter
+from sqlalchemy import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
+from datetime import datetime
+from ..core.database import get_async_read_session, get_async_session, read_engine, read_replica, reading_own_writes
+from sqlalchemy.orm import joinedload
+from ..models.trip import Trip, TripCreate, TripRead, TripReadWithVehicle, TripStatus
+from ..models.vehicle import OwnerSummary, Vehicle, VehicleSummary
 from ..models.user import User, Role
-from .vehicles import get_current_user # importing dependency
+from ..core.deps import get_async_current_user
+from ..core.matching import prepare_trip, search_statement, match_statement, rank_trips
+from ..core.pagination import NEXT_CURSOR_HEADER, PageParams, paginate_async, stream_ndjson
+from ..core.serialization import FastJSONResponse, Projection, dumps
+from ..core.stats_service import bump_counters
+from ..core.geo_index import geo_index
+from ..core.search_cache import GEO_TAG, mark_trip_changed, search_cache
+from ..core.capacity import parse_capacity
+from ..core.location_search import location_index, text_terms
+from ..core.config import settings
 
 router = APIRouter(prefix="/trips", tags=["trips"])
 
+# Soonest departures first; id breaks ties so the order is stable for cursors
+TRIP_ORDERING = [(Trip.start_datetime, False), (Trip.id, False)]
+
+MAX_BULK_TRIPS = 500
+
+# List responses embed the vehicle and its owner; many-to-one, so one JOINed query
+WITH_VEHICLE = joinedload(Trip.vehicle).joinedload(Vehicle.owner)
+
+# The same shape as flat columns, for list endpoints that skip the ORM and
+# response_model validation (see core/serialization.py)
+TRIP_ROWS = Projection(TripReadWithVehicle, Trip, vehicle=Projection(VehicleSummary, Vehicle, owner=Projection(OwnerSummary, User)))
+
 @router.post("/", response_model=TripRead)
-def create_trip(trip: TripCreate, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+async def create_trip(trip: TripCreate, current_user: User = Depends(get_async_current_user), session: AsyncSession = Depends(get_async_session)):
     if current_user.role != Role.OWNER:
         raise HTTPException(status_code=403, detail="Only vehicle owners can create trips")
     
     # Verify vehicle belongs to user
-    vehicle = session.get(Vehicle, trip.vehicle_id)
+    vehicle = await session.get(Vehicle, trip.vehicle_id)
     if not vehicle or vehicle.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Vehicle not found or does not belong to you")
         
-    db_trip = Trip.from_orm(trip)
+    db_trip = prepare_trip(Trip.from_orm(trip))
     session.add(db_trip)
-    session.commit()
-    session.refresh(db_trip)
+    await session.commit()
+    await session.refresh(db_trip)
+    geo_index.add_trip(db_trip)
+    location_index.add_trip(db_trip)
     return db_trip
 
-@router.get("/", response_model=List[TripRead])
-def read_trips(
+@router.post("/bulk", response_model=List[TripRead])
+async def create_trips_bulk(trips: List[TripCreate], current_user: User = Depends(get_async_current_user), session: AsyncSession = Depends(get_async_session)):
+    """Create many trips in one transaction with a single multi-row INSERT."""
+    if current_user.role != Role.OWNER:
+        raise HTTPException(status_code=403, detail="Only vehicle owners can create trips")
+    if not trips:
+        return []
+    if len(trips) > MAX_BULK_TRIPS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_TRIPS} trips per request")
+
+    vehicle_ids = {trip.vehicle_id for trip in trips}
+    owned = (await session.exec(
+        select(Vehicle.id).where(Vehicle.id.in_(vehicle_ids), Vehicle.owner_id == current_user.id)
+    )).all()
+    if len(owned) != len(vehicle_ids):
+        raise HTTPException(status_code=404, detail="Vehicle not found or does not belong to you")
+
+    rows = [prepare_trip(Trip.from_orm(trip)).dict(exclude={"id"}) for trip in trips]
+    db_trips = (await session.scalars(insert(Trip).returning(Trip), rows)).all()
+    # Bulk INSERT skips the ORM flush hook that maintains the admin counters
+    deltas = Counter({"trips.total": len(rows)})
+    deltas.update(f"trips.status.{row['status']}" for row in rows)
+    def mark_written(sync_session):
+        bump_counters(sync_session.connection(), deltas)
+        for row in rows:
+            mark_trip_changed(sync_session, start_key=row["start_key"], end_key=row["end_key"])
+    await session.run_sync(mark_written)
+    await session.commit()
+    for db_trip in db_trips:
+        geo_index.add_trip(db_trip)
+        location_index.add_trip(db_trip)
+    return db_trips
+
+@router.get("/", response_model=List[TripReadWithVehicle])
+async def read_trips(
+    request: Request,
+    response: Response,
     start_location: str = None, 
     end_location: str = None, 
-    min_capacity: str = None, # Simple string match or complex logic?
-    current_user: User = Depends(get_current_user), 
-    session: Session = Depends(get_session)
+    min_capacity: str = None, # e.g. "5 tons"; only trips with that much left
+    q: Optional[str] = Query(default=None, max_length=200), # words in the locations or description
+    pickup_lat: Optional[float] = Query(default=None, ge=-90, le=90),
+    pickup_lon: Optional[float] = Query(default=None, ge=-180, le=180),
+    drop_lat: Optional[float] = Query(default=None, ge=-90, le=90),
+    drop_lon: Optional[float] = Query(default=None, ge=-180, le=180),
+    radius_km: float = Query(default=settings.GEO_DEFAULT_RADIUS_KM, gt=0, le=500),
+    corridor: bool = False, # route passes near pickup and drop, rather than starting/ending there
+    page: PageParams = Depends(),
+    current_user: User = Depends(get_async_current_user), 
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     # If owner, show my trips? Or all trips for customer?
     # Spec says: Customer Search return trips based on From, To, Date
     
-    statement = select(Trip).where(Trip.status == TripStatus.OPEN)
-    
-    if start_location:
-         statement = statement.where(Trip.start_location.contains(start_location))
-    if end_location:
-         statement = statement.where(Trip.end_location.contains(end_location))
+    if (pickup_lat is None) != (pickup_lon is None) or (drop_lat is None) != (drop_lon is None):
+        raise HTTPException(status_code=400, detail="Give both latitude and longitude")
+    pickup = (pickup_lat, pickup_lon) if pickup_lat is not None else None
+    drop = (drop_lat, drop_lon) if drop_lat is not None else None
+
+    if pickup is None and drop is None:
+        statement = search_statement(start_location, end_location, min_capacity, base=TRIP_ROWS.select(), text=q)
+    else:
+        # Coordinates replace the name match for that end of the route; the
+        # index picks nearby trips and the database does the rest
+        if corridor:
+            if pickup is None or drop is None:
+                raise HTTPException(status_code=400, detail="Corridor search needs both pickup and drop")
+            trip_ids = geo_index.corridor(pickup, drop, radius_km)
+        elif pickup is not None:
+            trip_ids = geo_index.near(pickup, drop, radius_km)
+        else:
+            raise HTTPException(status_code=400, detail="Radius search needs a pickup point")
+        statement = search_statement(
+            None if pickup else start_location, None if drop else end_location, min_capacity, base=TRIP_ROWS.select(), text=q
+        ).where(Trip.id.in_(trip_ids))
     
     if current_user.role == Role.OWNER:
          # Owner might want to see THEIR trips regardless of status or search
          # For now letting them search globally or we can add /my-trips endpoint
          pass
 
-    results = session.exec(statement)
-    return results.all()
+    if page.stream:
+        return stream_ndjson(statement, TRIP_ORDERING, page.cursor, TRIP_ROWS, read_engine(request))
+
+    # Results don't depend on who is asking, so pages are cached per query.
+    # Coordinates are rounded to ~1 m so the same spot makes the same key.
+    # Locations by the keys they resolve to, so "Pune" and "pune " share pages.
+    start_keys = location_index.resolve(start_location) if start_location and not pickup else ["*"]
+    end_keys = location_index.resolve(end_location) if end_location and not drop else ["*"]
+    key = search_cache.key(
+        start="|".join(start_keys), end="|".join(end_keys), text=" ".join(text_terms(q)) or None,
+        capacity=parse_capacity(min_capacity),
+        pickup=pickup and (round(pickup[0], 5), round(pickup[1], 5)),
+        drop=drop and (round(drop[0], 5), round(drop[1], 5)),
+        radius=radius_km if pickup or drop else None, corridor=corridor or None,
+        cursor=page.cursor, limit=page.limit,
+    )
+    # Pages may come from a lagging replica, so a caller who just wrote skips
+    # the lookup and reads the primary (still filling the cache for others),
+    # and replica reads aren't cached while a tag's last change may not have reached them
+    cached = None if reading_own_writes(request) else search_cache.get(key)
+    if cached is None:
+        tags = [GEO_TAG] if pickup or drop else [f"route:{start}:{end}" for start in start_keys for end in end_keys]
+        versions = search_cache.backend.tag_versions(tags)
+        rows = await paginate_async(session, statement, TRIP_ORDERING, page, response)
+        body = dumps([TRIP_ROWS.build(row) for row in rows])
+        cached = search_cache.put(
+            key, body, response.headers.get(NEXT_CURSOR_HEADER), tags, versions,
+            from_replica=read_replica(request) is not None,
+        )
+    return search_cache.respond(request, cached)
+
+@router.get("/suggest")
+async def suggest_locations(
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(default=10, ge=1, le=settings.LOCATION_SUGGEST_MAX),
+    current_user: User = Depends(get_async_current_user),
+):
+    # Autocomplete for the from/to boxes, from memory (see core/location_search.py)
+    return FastJSONResponse(location_index.suggest(q, limit))
+
+@router.get("/match", response_model=List[TripReadWithVehicle])
+async def match_cargo(
+    start_location: str,
+    end_location: str,
+    cargo_size: Optional[str] = None,
+    earliest: Optional[datetime] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    current_user: User = Depends(get_async_current_user),
+    session: AsyncSession = Depends(get_async_read_session)
+):
+    # Ranked best matches for a cargo request (fit, price, departure)
+    statement = match_statement(start_location, end_location, cargo_size, earliest, limit).options(WITH_VEHICLE)
+    candidates = (await session.exec(statement)).all()
+    return rank_trips(candidates, cargo_size, limit)
 
-@router.get("/my-trips", response_model=List[TripRead])
-def read_my_trips(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+@router.get("/my-trips", response_model=List[TripReadWithVehicle])
+async def read_my_trips(current_user: User = Depends(get_async_current_user), session: AsyncSession = Depends(get_async_session)):
     if current_user.role != Role.OWNER:
         raise HTTPException(status_code=403, detail="Not authorized")
-    statement = select(Trip).where(Trip.vehicle_id.in_(
-        select(Vehicle.id).where(Vehicle.owner_id == current_user.id)
-    ))
-    results = session.exec(statement)
-    return results.all()
+    statement = TRIP_ROWS.select().where(Vehicle.owner_id == current_user.id)
+    rows = (await session.execute(statement)).all()
+    return FastJSONResponse([TRIP_ROWS.build(row) for row in rows])
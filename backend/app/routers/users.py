@@ -1,34 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
-from ..core.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..core.database import get_async_session
 from ..models.user import User, UserRead, UserUpdate
-from ..routers.vehicles import get_current_user
-from ..core.security import get_password_hash
+from ..core.deps import get_async_current_user
+from ..core.security import get_password_hash, hash_pool
+from ..core.principal_cache import principal_cache
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.put("/me", response_model=UserRead)
-def update_my_profile(
+async def update_my_profile(
     user_update: UserUpdate, 
-    current_user: User = Depends(get_current_user), 
-    session: Session = Depends(get_session)
+    current_user: User = Depends(get_async_current_user), 
+    session: AsyncSession = Depends(get_async_session)
 ):
     user_data = user_update.dict(exclude_unset=True)
     if "password" in user_data:
         password = user_data["password"]
         if password:
-             hashed_password = get_password_hash(password)
+             # Off the event loop, like signup and login
+             hashed_password = await hash_pool.run(get_password_hash, password)
              user_data["hashed_password"] = hashed_password
         del user_data["password"]
-        
+
     for key, value in user_data.items():
         setattr(current_user, key, value)
         
     session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    await session.commit()
+    principal_cache.invalidate(current_user.email)
     return current_user
 
 @router.get("/me", response_model=UserRead)
-def get_my_profile(current_user: User = Depends(get_current_user)):
+async def get_my_profile(current_user: User = Depends(get_async_current_user)):
     return current_user
@@ -0,0 +1,120 @@
+"""
+Coordinate trip search: the grid index against a full scan, up to 1M trips.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_geo
+    python -m benchmarks.bench_geo --trips 100000 --queries 500
+
+Trips run between random points clustered around a few dozen cities (India's
+bounding box), like the real data would. Reports index build time and memory,
+then radius and corridor query latency from the index, and from a linear scan
+over the same trips for a handful of queries.
+"""
+import argparse
+import random
+import resource
+import statistics
+import sys
+import time
+
+from app.core.config import settings
+from app.core.geo_index import GeoIndex, haversine_km, segment_distance_km
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def random_point(rng, cities):
+    lat, lon = rng.choice(cities)
+    return lat + rng.gauss(0, 0.15), lon + rng.gauss(0, 0.15)
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(fn, queries):
+    latencies, found = [], 0
+    for query in queries:
+        started = time.perf_counter()
+        found += len(fn(*query))
+        latencies.append(time.perf_counter() - started)
+    return latencies, found / len(queries)
+
+
+def report(label, latencies, found):
+    print(f"  {label:<22} p50 {statistics.median(latencies) * 1000:8.2f}ms  "
+          f"p95 {percentile(latencies, 95) * 1000:8.2f}ms  ~{found:.0f} trips/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trips", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scan-queries", type=int, default=5, help="Queries answered by linear scan, for comparison")
+    parser.add_argument("--radius-km", type=float, default=settings.GEO_DEFAULT_RADIUS_KM)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cities = [(rng.uniform(8, 32), rng.uniform(68, 90)) for _ in range(40)]
+    trips = [(random_point(rng, cities), random_point(rng, cities)) for _ in range(args.trips)]
+
+    # Unlimited candidates, so the index and the scan return the same sets
+    settings.GEO_MAX_CANDIDATES = args.trips
+    index = GeoIndex(settings.GEO_POINT_CELL_DEG, settings.GEO_ROUTE_CELL_DEG)
+    before = rss_mb()
+    started = time.perf_counter()
+    for trip_id, (start, end) in enumerate(trips, 1):
+        index.add(trip_id, start, end)
+    elapsed = time.perf_counter() - started
+    print(f"{args.trips} trips indexed in {elapsed:.1f}s ({args.trips / elapsed:,.0f}/s), "
+          f"~{rss_mb() - before:.0f} MB, {index.stats()}")
+
+    r = args.radius_km
+    radius_queries = [(random_point(rng, cities), random_point(rng, cities), r) for _ in range(args.queries)]
+    corridor_queries = []
+    for _ in range(args.queries):
+        # Pickup and drop along a real trip's route, so corridors have hits
+        a, b = rng.choice(trips)
+        t1, t2 = sorted((rng.random(), rng.random()))
+        along = lambda t: (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+        corridor_queries.append((along(t1), along(t2), r))
+
+    def scan_near(pickup, drop, radius):
+        return [i for i, (s, e) in enumerate(trips, 1)
+                if haversine_km(pickup, s) <= radius and haversine_km(drop, e) <= radius]
+
+    def scan_corridor(pickup, drop, radius):
+        found = []
+        for i, (s, e) in enumerate(trips, 1):
+            dp, tp = segment_distance_km(pickup, s, e)
+            if dp <= radius:
+                dd, td = segment_distance_km(drop, s, e)
+                if dd <= radius and td >= tp:
+                    found.append(i)
+        return found
+
+    print(f"radius {r:g} km:")
+    report("index, near", *timed(index.near, radius_queries))
+    report("index, corridor", *timed(index.corridor, corridor_queries))
+    if args.scan_queries:
+        report("scan, near", *timed(scan_near, radius_queries[:args.scan_queries]))
+        report("scan, corridor", *timed(scan_corridor, corridor_queries[:args.scan_queries]))
+        for query in corridor_queries[:args.scan_queries]:
+            assert sorted(index.corridor(*query)) == scan_corridor(*query), "index and scan disagree"
+        for query in radius_queries[:args.scan_queries]:
+            assert sorted(index.near(*query)) == scan_near(*query), "index and scan disagree"
+
+    started = time.perf_counter()
+    for trip_id in range(1, min(args.trips, 100_000) + 1):
+        index.remove(trip_id)
+    removed = min(args.trips, 100_000)
+    print(f"{removed} trips removed in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Location search latency: typo lookups and autocomplete over the in-memory
+location index, and misspelled / free-text trip searches in the database.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_location_search
+    python -m benchmarks.bench_location_search --locations 50000 --scale medium
+
+First fills a LocationIndex with --locations made-up place names (plus the
+seed's cities) and times resolve() on misspelled names and suggest() on short
+prefixes, each lookup cold (nothing memoized). Then seeds a temporary SQLite
+database (benchmarks/seed.py), loads the index from it and times the first
+page of a trip search by misspelled location and by free text.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+SYLLABLES = ["ba", "bad", "pur", "na", "ga", "ra", "ma", "li", "kot", "gar", "ha", "sa", "dra", "van", "tal", "ki", "ner", "ja", "ula", "pet"]
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    return f"median {statistics.median(latencies) * 1000:.3f} ms, p99 {p99 * 1000:.3f} ms"
+
+
+def typo(rng, word):
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def main():
+    from benchmarks.seed import CITIES, add_scale_arguments, scale_from_args
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "locations.db")
+
+    from sqlmodel import Session
+    from app.core import database
+    from app.core.location_search import LocationIndex, location_index
+    from app.core.matching import search_statement
+    from app.models.trip import Trip
+    from benchmarks.seed import seed
+
+    rng = random.Random(1)
+    index = LocationIndex()
+    names = [city for city, _, _ in CITIES]
+    while len(names) < args.locations:
+        names.append("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title())
+    started = time.perf_counter()
+    for name in names:
+        index.add_location(name, rng.randint(1, 100))
+    print(f"Indexed {len(names)} locations in {time.perf_counter() - started:.2f}s: {index.stats()}")
+
+    def timed(fn, inputs):
+        latencies = []
+        for value in inputs:
+            index._resolved.clear()
+            began = time.perf_counter()
+            fn(value)
+            latencies.append(time.perf_counter() - began)
+        return latencies
+
+    misspelled = [typo(rng, rng.choice(names).lower()) for _ in range(args.lookups)]
+    prefixes = [rng.choice(names)[:rng.randint(1, 3)] for _ in range(args.lookups)]
+    print(f"resolve (misspelled) {summary(timed(index.resolve, misspelled))}")
+    print(f"resolve (known)      {summary(timed(index.resolve, names[:args.lookups]))}")
+    print(f"suggest (1-3 chars)  {summary(timed(index.suggest, prefixes))}")
+
+    scale = scale_from_args(args)
+    started = time.perf_counter()
+    seed(database.engine, **scale)
+    with Session(database.engine) as session:
+        location_index.refresh(session)
+        print(f"Seeded {scale} and loaded the index in {time.perf_counter() - started:.1f}s")
+        searches = {
+            "exact (Pune)": dict(start_location="Pune"),
+            "misspelled (Pnue -> Mumbay)": dict(start_location="Pnue", end_location="Mumbay"),
+            "old name (Bombay)": dict(start_location="Bombay"),
+            "free text (nag)": dict(text="nag"),
+        }
+        for label, params in searches.items():
+            latencies = []
+            for _ in range(50):
+                # Resolving the locations included
+                location_index._resolved.clear()
+                began = time.perf_counter()
+                rows = session.exec(search_statement(**params).order_by(Trip.start_datetime, Trip.id).limit(20)).all()
+                latencies.append(time.perf_counter() - began)
+            print(f"{label:<28} {len(rows):>3} rows, {summary(latencies)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
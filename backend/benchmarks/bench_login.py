@@ -0,0 +1,91 @@
+"""
+Login throughput under concurrency, and what a login burst does to everything else.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_login
+    python -m benchmarks.bench_login --hash-workers 1 2 4 --logins 200
+
+For each hashing pool size, client threads hammer POST /auth/token while a
+second group keeps searching trips. Reports logins/s, 503s shed by the pool,
+and trip search latency during the burst.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hash-workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--searchers", type=int, default=4)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "bench.db")
+    # Every simulated user shares the test client's address
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+    from app.core import database
+    from app.core.security import create_access_token, hash_pool
+    from app.main import app
+    from benchmarks.bench_db_engine import seed
+
+    email, user_id = seed(database.engine, 50)
+    token = create_access_token({"sub": email, "uid": user_id}, timedelta(hours=1))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with TestClient(app) as client:
+        for workers in args.hash_workers:
+            hash_pool.shutdown()
+            hash_pool.workers = workers
+            search_latencies = []
+            done = threading.Event()
+
+            def search():
+                while not done.is_set():
+                    started = time.perf_counter()
+                    client.get("/trips/", params={"start_location": "Pune", "limit": 20}, headers=headers)
+                    search_latencies.append(time.perf_counter() - started)
+
+            def login(_):
+                return client.post("/auth/token", data={"username": email, "password": "bench"}).status_code
+
+            searchers = [threading.Thread(target=search) for _ in range(args.searchers)]
+            for t in searchers:
+                t.start()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                codes = list(pool.map(login, range(args.logins)))
+            elapsed = time.perf_counter() - started
+            done.set()
+            for t in searchers:
+                t.join()
+
+            succeeded = codes.count(200)
+            print(
+                f"hash workers {workers:>2}: {succeeded / elapsed:>7.1f} logins/s  "
+                f"{codes.count(503)} shed  "
+                f"search p50 {statistics.median(search_latencies) * 1000:.1f}ms "
+                f"p95 {percentile(search_latencies, 95) * 1000:.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
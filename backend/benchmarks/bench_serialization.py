@@ -0,0 +1,112 @@
+"""
+List response serialization: the ORM + response_model path against the
+column projection + orjson path, for the bodies of GET /trips/ and
+GET /bookings/.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --scale medium --sizes 100,1000,5000 --repeat 20
+
+Seeds a temporary SQLite database (benchmarks/seed.py), then for each page
+size times both paths end to end (query, object building, validation and
+encoding), and the query/load step on its own. Checks that both produce the
+same JSON.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies) * 1000
+
+
+def main():
+    from benchmarks.seed import add_scale_arguments, scale_from_args
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_scale_arguments(parser)
+    parser.add_argument("--sizes", default="20,100,1000,5000", help="Rows per response")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "serialization.db")
+    # Every simulated user shares the test client's address
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy.orm import joinedload
+    from sqlmodel import Session, select
+
+    from app.core import database
+    from app.core.serialization import dumps, orjson
+    from app.models.booking import Booking, BookingReadWithTrip
+    from app.models.trip import Trip, TripReadWithVehicle
+    from app.models.vehicle import Vehicle
+    from app.routers.bookings import BOOKING_ROWS
+    from app.routers.trips import TRIP_ROWS
+    from benchmarks.seed import seed
+
+    scale = scale_from_args(args)
+    if args.scale == "small" and args.trips_per_vehicle is None:
+        scale["trips_per_vehicle"] = 250 # enough rows for the biggest default size
+    seed(database.engine, **scale)
+
+    cases = [
+        ("GET /trips/", Trip, TripReadWithVehicle, [joinedload(Trip.vehicle).joinedload(Vehicle.owner)], TRIP_ROWS),
+        ("GET /bookings/", Booking, BookingReadWithTrip,
+         [joinedload(Booking.trip).joinedload(Trip.vehicle).joinedload(Vehicle.owner), joinedload(Booking.customer)], BOOKING_ROWS),
+    ]
+    print(f"encoder: {'orjson' if orjson else 'json (orjson not installed)'}, median of {args.repeat} runs")
+    header = f"{'endpoint':<16} {'rows':>6} {'old load':>9} {'old total':>10} {'new load':>9} {'new total':>10} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+
+    with Session(database.engine) as session:
+        for label, model, read_model, options, projection in cases:
+            # What FastAPI does with response_model=List[...]: validate every
+            # object into the read model, dump it to JSON-able data, encode
+            adapter = TypeAdapter(List[read_model])
+            for size in sizes:
+                orm_statement = select(model).options(*options).order_by(model.id).limit(size)
+                row_statement = projection.select().order_by(model.id).limit(size)
+
+                def old_load():
+                    session.expunge_all() # a fresh session per request, as in the app
+                    return session.exec(orm_statement).unique().all()
+
+                def old_path():
+                    objects = old_load()
+                    return json.dumps(adapter.dump_python(adapter.validate_python(objects, from_attributes=True), mode="json")).encode()
+
+                def new_load():
+                    return session.execute(row_statement).all()
+
+                def new_path():
+                    return dumps([projection.build(row) for row in new_load()])
+
+                old, new = old_path(), new_path()
+                if json.loads(old) != json.loads(new):
+                    raise SystemExit(f"{label}: old and new paths disagree")
+                rows = len(json.loads(new))
+                old_total, new_total = timed(old_path, args.repeat), timed(new_path, args.repeat)
+                print(f"{label:<16} {rows:>6} {timed(old_load, args.repeat):>8.2f}ms {old_total:>9.2f}ms "
+                      f"{timed(new_load, args.repeat):>8.2f}ms {new_total:>9.2f}ms {old_total / new_total:>7.1f}x")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Email outbox check against a local stub SMTP server.
+
+Run from the backend folder:
+
+    python -m benchmarks.check_email_outbox
+    python -m benchmarks.check_email_outbox --emails 200 --fail-every 7 --dispatchers 3
+
+Starts a minimal SMTP server on localhost (no TLS, no AUTH), points the app at
+it with EMAILS_ENABLED=true, SMTP_USE_TLS=false and SMTP_AUTH=false, queues
+--emails notifications on a scratch SQLite database and lets the dispatcher
+drain the outbox. With --fail-every N the server refuses every Nth message
+once, so those go through the retry path. With --dispatchers N, N dispatchers
+drain the same outbox, as N app processes would. One extra row is left claimed
+by a dispatcher that "crashed" with its lease already run out. Exits non-zero
+unless every email arrives at the stub, once, and its outbox row ends up sent.
+"""
+import argparse
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from email import message_from_string
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """Just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fail_every: int = 0):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.fail_every = fail_every
+        self.messages = [] # (mail from, [rcpt to], parsed message)
+        self.attempts = 0
+        self.refused = set() # recipients refused once already
+        self.lock = threading.Lock()
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 stub ESMTP")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self.reply("250-stub")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 stub")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip().strip("<>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode()
+                    if data in (".\r\n", ".\n", ""):
+                        break
+                    lines.append(data[1:] if data.startswith("..") else data)
+                server = self.server
+                message = message_from_string("".join(lines))
+                with server.lock:
+                    server.attempts += 1
+                    refuse = bool(server.fail_every) and server.attempts % server.fail_every == 0 and message["To"] not in server.refused
+                    if refuse:
+                        server.refused.add(message["To"])
+                    else:
+                        server.messages.append((sender, recipients, message))
+                self.reply("451 Try again later" if refuse else "250 OK")
+                sender, recipients = None, []
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=50)
+    parser.add_argument("--fail-every", type=int, default=0, help="Refuse every Nth message once (0: never)")
+    parser.add_argument("--dispatchers", type=int, default=2, help="Dispatchers sharing the outbox")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    stub = StubSMTPServer(args.fail_every)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "outbox.db")
+    os.environ.update(
+        EMAILS_ENABLED="true", SMTP_SERVER="127.0.0.1", SMTP_PORT=str(stub.server_address[1]),
+        SMTP_USE_TLS="false", SMTP_AUTH="false", SMTP_FROM="noreply@check.local",
+        # Retries come round quickly rather than after the production backoff
+        EMAIL_RETRY_BACKOFF_SECONDS="0.1", EMAIL_SWEEP_INTERVAL_SECONDS="0.2",
+    )
+
+    from sqlmodel import Session, func, select
+    from app.core import database
+    from app.core.email_dispatcher import EmailDispatcher, dispatcher
+    from app.core.migrations import migrate
+    from app.core.notification_service import send_notifications
+    from app.models.notification import EmailOutbox, OutboxStatus
+
+    migrate(database.engine)
+    with Session(database.engine) as session:
+        session.add(EmailOutbox(
+            recipient="crashed@check.local", subject="Check", body="Claimed, never sent",
+            status=OutboxStatus.SENDING, next_attempt_at=datetime.utcnow() - timedelta(seconds=1),
+        ))
+        session.commit()
+    dispatchers = [dispatcher] + [EmailDispatcher() for _ in range(args.dispatchers - 1)]
+    for each in dispatchers:
+        each.start()
+    started = time.perf_counter()
+    with Session(database.engine) as session:
+        send_notifications(
+            [(None, f"user{i}@check.local", f"Check message {i}", i + 1) for i in range(args.emails)], session
+        )
+
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        with Session(database.engine) as session:
+            left = session.exec(select(func.count()).select_from(EmailOutbox).where(EmailOutbox.status != OutboxStatus.SENT)).one()
+        if not left:
+            break
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    for each in dispatchers:
+        each.stop()
+    stub.shutdown()
+
+    with Session(database.engine) as session:
+        rows = session.exec(select(EmailOutbox)).all()
+    received = sorted(recipient for _, recipients, _ in stub.messages for recipient in recipients)
+    expected = sorted([f"user{i}@check.local" for i in range(args.emails)] + ["crashed@check.local"])
+    retried = sum(row.attempts > 1 for row in rows)
+    print(f"{len(stub.messages)} of {args.emails + 1} emails delivered by {len(dispatchers)} dispatchers in {elapsed:.2f}s "
+          f"({stub.attempts} attempts, {retried} rows retried)")
+
+    problems = []
+    if len(rows) != args.emails + 1:
+        problems.append(f"{len(rows)} outbox rows for {args.emails} notifications and the crashed claim")
+    if any(row.status != OutboxStatus.SENT for row in rows):
+        problems.append(f"{sum(row.status != OutboxStatus.SENT for row in rows)} outbox rows not sent")
+    if received != expected:
+        problems.append("stub received a different set of recipients (missing or duplicate emails)")
+    if any(message["From"] != "noreply@check.local" or sender != "<noreply@check.local>" for sender, _, message in stub.messages):
+        problems.append("sender isn't SMTP_FROM")
+    for problem in problems:
+        print("FAIL:", problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
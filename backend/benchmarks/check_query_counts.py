@@ -0,0 +1,153 @@
+"""
+Query-count regression check for the main read and write paths.
+
+Run from the backend folder (add DB_ASYNC=true to check the async engine):
+
+    python -m benchmarks.check_query_counts
+
+Seeds two databases, one small and one ten times bigger, with trips and
+bookings spread over many owners and vehicles, then counts the SQL each
+endpoint runs on both. A path whose count grows with the data (an N+1) or
+goes over its budget fails the check and the script exits non-zero.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# endpoint -> most statements it may run once the principal cache is warm
+BUDGETS = {
+    "GET /trips/": 1,
+    "GET /trips/ (misspelled)": 1, # widened to known locations in memory
+    "GET /trips/ (text)": 1, # full-text index
+    "GET /trips/suggest": 0,
+    "GET /trips/match": 1,
+    "GET /trips/my-trips": 1,
+    "GET /bookings/ (customer)": 1,
+    "GET /bookings/ (owner)": 1,
+    "GET /bookings/ (admin)": 1,
+    "POST /bookings/": 8, # includes the owner's unread counter
+    "POST /bookings/ (keyed)": 10, # with an Idempotency-Key: plus its lookup and insert
+    "POST /bookings/ (retry)": 0, # replayed from memory
+    "PUT /bookings/{id}/status": 10, # includes the customer's unread counter and claiming the booking's hold
+}
+
+
+def seed(engine, owners: int, trips_per_owner: int):
+    from sqlmodel import SQLModel, Session
+    from app.core.matching import prepare_trip
+    from app.core.security import get_password_hash
+    from app.models.booking import Booking, BookingStatus
+    from app.models.trip import Trip
+    from app.models.user import User, Role
+    from app.models.vehicle import Vehicle
+
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    password = get_password_hash("bench")
+    with Session(engine) as session:
+        customer = User(email="customer@bench.local", role=Role.CUSTOMER, hashed_password=password)
+        admin = User(email="admin@bench.local", role=Role.ADMIN, hashed_password=password)
+        session.add(customer)
+        session.add(admin)
+        start = datetime.utcnow() + timedelta(days=1)
+        for i in range(owners):
+            owner = User(email=f"owner{i}@bench.local", full_name=f"Owner {i}", role=Role.OWNER, hashed_password=password)
+            vehicle = Vehicle(type="Truck", capacity="10 tons", registration_number=f"BENCH-{i}", owner=owner)
+            for j in range(trips_per_owner):
+                trip = prepare_trip(Trip(
+                    start_location="Pune", end_location="Mumbai",
+                    start_datetime=start + timedelta(hours=i * trips_per_owner + j), available_capacity="1000 tons",
+                    price_per_unit=100, vehicle=vehicle,
+                ))
+                session.add(trip)
+                # Each owner's last trip is left without a pending booking by
+                # the customer, so it can book it again
+                status = BookingStatus.ACCEPTED if j == trips_per_owner - 1 else BookingStatus.PENDING
+                session.add(Booking(cargo_size="1 tons", total_price=100, status=status, booking_reference=f"BK-{i}-{j}", trip=trip, customer=customer))
+        session.commit()
+
+
+def measure(client, owners: int) -> dict:
+    from sqlmodel import Session, select
+    from app.core import database
+    from app.core.location_search import location_index
+    from app.core.principal_cache import principal_cache
+    from app.core.query_counter import count_queries
+    from app.core.security import create_access_token
+    from app.models.booking import Booking, BookingStatus
+    from app.models.trip import Trip
+    from app.models.user import User
+
+    seed(database.engine, owners, 3)
+    principal_cache.clear()
+    with Session(database.engine) as session:
+        users = {u.email: u for u in session.exec(select(User))}
+        trip_id = session.exec(select(Trip.id)).first()
+        booking_id = session.exec(select(Booking.id).where(Booking.trip_id == trip_id)).first()
+        free_trips = session.exec(select(Booking.trip_id).where(Booking.status == BookingStatus.ACCEPTED).order_by(Booking.id).limit(2)).all()
+        location_index.clear()
+        location_index.refresh(session)
+
+    def headers(email):
+        token = create_access_token({"sub": email, "uid": users[email].id}, timedelta(hours=1))
+        return {"Authorization": f"Bearer {token}"}
+
+    customer, owner, admin = headers("customer@bench.local"), headers("owner0@bench.local"), headers("admin@bench.local")
+    keyed = {**customer, "Idempotency-Key": f"bench-{owners}"}
+    keyed_booking = {"cargo_size": "1 tons", "total_price": 100, "trip_id": free_trips[1]}
+    calls = {
+        "GET /trips/": lambda c: c.get("/trips/", params={"start_location": "Pune"}, headers=customer),
+        "GET /trips/ (misspelled)": lambda c: c.get("/trips/", params={"start_location": "Pnue", "end_location": "Bombay"}, headers=customer),
+        "GET /trips/ (text)": lambda c: c.get("/trips/", params={"q": "mumb"}, headers=customer),
+        "GET /trips/suggest": lambda c: c.get("/trips/suggest", params={"q": "Pu"}, headers=customer),
+        "GET /trips/match": lambda c: c.get("/trips/match", params={"start_location": "Pune", "end_location": "Mumbai"}, headers=customer),
+        "GET /trips/my-trips": lambda c: c.get("/trips/my-trips", headers=owner),
+        "GET /bookings/ (customer)": lambda c: c.get("/bookings/", headers=customer),
+        "GET /bookings/ (owner)": lambda c: c.get("/bookings/", headers=owner),
+        "GET /bookings/ (admin)": lambda c: c.get("/bookings/", headers=admin),
+        "POST /bookings/": lambda c: c.post("/bookings/", json={"cargo_size": "1 tons", "total_price": 100, "trip_id": free_trips[0]}, headers=customer),
+        "POST /bookings/ (keyed)": lambda c: c.post("/bookings/", json=keyed_booking, headers=keyed),
+        "POST /bookings/ (retry)": lambda c: c.post("/bookings/", json=keyed_booking, headers=keyed),
+        "PUT /bookings/{id}/status": lambda c: c.put(f"/bookings/{booking_id}/status", params={"status_update": "accepted"}, headers=owner),
+    }
+
+    counts = {}
+    # Warm the principal cache (and create the async engine, if used)
+    for h in (customer, owner, admin):
+        client.get("/notifications/unread-count", headers=h)
+    for name, call in calls.items():
+        with count_queries() as queries:
+            response = call(client)
+        assert response.status_code == 200, (name, response.status_code, response.text)
+        counts[name] = queries.count
+    return counts
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "queries.db")
+    # Every simulated user shares the test client's address
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    # One client throughout, so the async engine stays on one event loop
+    with TestClient(app) as client:
+        small, large = measure(client, 5), measure(client, 50)
+    failures = 0
+    print(f"{'endpoint':<28} {'small':>5} {'large':>5} {'budget':>6}")
+    for name, budget in BUDGETS.items():
+        problem = ""
+        if large[name] > small[name]:
+            problem = "grows with data (N+1?)"
+        elif large[name] > budget:
+            problem = "over budget"
+        failures += bool(problem)
+        print(f"{name:<28} {small[name]:>5} {large[name]:>5} {budget:>6}  {problem}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Read replica routing check, on two local SQLite files.
+
+Run from the backend folder (add DB_ASYNC=true to check the async engine):
+
+    python -m benchmarks.check_read_routing
+
+Points DATABASE_URL at one scratch file and DATABASE_REPLICA_URLS at another
+that is only brought up to date when the script says so, i.e. a replica that
+lags. Then checks that searches, listings and the admin dashboard read the
+replica, that a caller who just wrote reads their own writes from the primary
+for DB_READ_YOUR_WRITES_SECONDS, and that they go back to the replica after
+that. Exits non-zero on a failure.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+WINDOW_SECONDS = 1.0
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    primary, replica = os.path.join(tmp, "primary.db"), os.path.join(tmp, "replica.db")
+    os.environ["DATABASE_URL"] = "sqlite:///" + primary
+    os.environ["DATABASE_REPLICA_URLS"] = f'["sqlite:///{replica}"]'
+    os.environ["DB_READ_YOUR_WRITES_SECONDS"] = str(WINDOW_SECONDS)
+    # Every simulated user shares the test client's address
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session
+    from app.core import database
+    from app.core.location_search import location_index
+    from app.core.matching import prepare_trip
+    from app.core.migrations import migrate
+    from app.core.replicas import read_router
+    from app.core.security import create_access_token, get_password_hash
+    from app.main import app
+    from app.models.trip import Trip
+    from app.models.user import User, Role
+    from app.models.vehicle import Vehicle
+
+    def catch_up():
+        # What replication would do, all at once
+        for replica_engine in database.replica_engines:
+            replica_engine.dispose()
+        source, target = sqlite3.connect(primary), sqlite3.connect(replica)
+        source.backup(target)
+        source.close()
+        target.close()
+
+    failures = []
+
+    def check(label, ok, detail=""):
+        print(f"{'ok  ' if ok else 'FAIL'} {label} {detail}")
+        if not ok:
+            failures.append(label)
+
+    with TestClient(app) as client:
+        migrate(database.replica_engines[0])
+        password = get_password_hash("check")
+        with Session(database.engine) as session:
+            owner = User(email="owner@check.local", role=Role.OWNER, hashed_password=password)
+            vehicle = Vehicle(type="Truck", capacity="10 tons", registration_number="CHECK-1", owner=owner)
+            users = [
+                owner,
+                User(email="customer@check.local", role=Role.CUSTOMER, hashed_password=password),
+                User(email="admin@check.local", role=Role.ADMIN, hashed_password=password),
+            ]
+            session.add_all(users)
+            session.add(prepare_trip(Trip(
+                start_location="Pune", end_location="Mumbai", start_datetime=datetime.utcnow() + timedelta(days=1),
+                available_capacity="10 tons", price_per_unit=100, vehicle=vehicle,
+            )))
+            session.commit()
+            tokens = {
+                user.email.split("@")[0]: create_access_token({"sub": user.email, "uid": user.id}, timedelta(hours=1))
+                for user in users
+            }
+            location_index.refresh(session)
+        customer, owner_headers, admin = ({"Authorization": f"Bearer {tokens[name]}"} for name in ("customer", "owner", "admin"))
+
+        # Accounts, the trip: all on the primary only, for now
+        trips = client.get("/trips/", params={"start_location": "Pune"}, headers=customer).json()
+        check("search reads the replica", trips == [], f"({len(trips)} trips)")
+        catch_up()
+        trips = client.get("/trips/", params={"end_location": "Mumbai"}, headers=customer).json()
+        check("search sees the replica once it catches up", len(trips) == 1, f"({len(trips)} trips)")
+
+        response = client.post("/bookings/", json={"cargo_size": "1 tons", "total_price": 100, "trip_id": trips[0]["id"]}, headers=customer)
+        check("booking goes to the primary", response.status_code == 200, f"({response.status_code})")
+        bookings = client.get("/bookings/", headers=customer).json()
+        check("the booker reads their own booking", len(bookings) == 1, f"({len(bookings)} bookings)")
+        stream = client.get("/bookings/", params={"stream": True}, headers=customer).text.splitlines()
+        check("... streamed too", len(stream) == 1, f"({len(stream)} lines)")
+        bookings = client.get("/bookings/", headers=admin).json()
+        check("others list from the replica", bookings == [], f"({len(bookings)} bookings)")
+        stats = client.get("/admin/stats", headers=admin).json()
+        check("admin stats read the replica", stats["total_bookings"] == 0, f"({stats['total_bookings']} bookings)")
+        notifications = client.get("/notifications/", headers=owner_headers).json()
+        check("notifications read the replica", notifications == [], f"({len(notifications)} notifications)")
+
+        time.sleep(WINDOW_SECONDS + 0.1)
+        bookings = client.get("/bookings/", headers=customer).json()
+        check("back on the replica after the window", bookings == [], f"({len(bookings)} bookings)")
+        catch_up()
+        bookings = client.get("/bookings/", headers=customer).json()
+        check("... which has the booking once it catches up", len(bookings) == 1, f"({len(bookings)} bookings)")
+        stats = client.get("/admin/stats", headers=admin).json()
+        check("... and so do the admin stats", stats["total_bookings"] == 1, f"({stats['total_bookings']} bookings)")
+        notifications = client.get("/notifications/", headers=owner_headers).json()
+        check("... and the owner's notifications", len(notifications) == 1, f"({len(notifications)} notifications)")
+        print(read_router.stats())
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Cold start budget check.
+
+Run from the backend folder:
+
+    python -m benchmarks.check_startup
+
+Imports the app in fresh interpreters under `python -X importtime` and
+checks the total against IMPORT_BUDGET_MS, and that the modules deferred to
+first use or warm-up (DEFERRED) really stay off the import path. Then starts
+the app twice on a scratch SQLite database, once empty and once as a
+restart, and times startup and warm-up. Exits non-zero on a failure.
+"""
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+IMPORT_RUNS = 5
+IMPORT_BUDGET_MS = 1500 # best of IMPORT_RUNS, `import app.main`
+RESTART_BUDGET_MS = 150 # startup hook on an existing, current database
+
+# Loaded lazily by the app; importing any of these at startup is a regression
+DEFERRED = {
+    "jose.jwt": "core/tokens.py (warm-up step tokens)",
+    "passlib.context": "core/security.py (warm-up step password_hashing)",
+    "sqlalchemy.dialects.postgresql": "core/notification_storage.py, on SQLite",
+}
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$")
+
+
+def import_profile(env: dict) -> dict:
+    """module -> cumulative microseconds, for one fresh `import app.main`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            modules[match[4]] = int(match[2])
+    return modules
+
+
+def time_startup(database_url: str) -> dict:
+    """Startup and warm-up of the app in this process, in ms."""
+    os.environ["DATABASE_URL"] = database_url
+    from fastapi.testclient import TestClient
+    from app.core.warmup import warmup
+    from app.main import app
+
+    timings = {}
+    for run in ("empty database", "restart"):
+        began = time.perf_counter()
+        with TestClient(app) as client:
+            started = time.perf_counter()
+            warmup.wait()
+            warmed = time.perf_counter()
+            ready = client.get("/ready")
+        timings[run] = {
+            "startup_ms": (started - began) * 1000,
+            "warmup_ms": (warmed - started) * 1000,
+            "ready": ready.status_code,
+            "steps": {name: step.get("ms") for name, step in ready.json()["steps"].items()},
+        }
+    return timings
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    database_url = "sqlite:///" + os.path.join(tmp, "startup.db")
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=os.getcwd())
+
+    profiles = [import_profile(env) for _ in range(IMPORT_RUNS)]
+    best = min(profiles, key=lambda modules: modules["app.main"])
+    failures = 0
+
+    total_ms = best["app.main"] / 1000
+    problem = "over budget" if total_ms > IMPORT_BUDGET_MS else ""
+    failures += bool(problem)
+    print(f"import app.main: {total_ms:.0f} ms (budget {IMPORT_BUDGET_MS} ms)  {problem}")
+    print("slowest app modules (cumulative):")
+    own = sorted(((us, name) for name, us in best.items() if name.startswith("app.")), reverse=True)
+    for us, name in own[:8]:
+        print(f"  {name:<40} {us / 1000:>7.1f} ms")
+    for module, where in DEFERRED.items():
+        if module in best:
+            failures += 1
+            print(f"{module} is imported at startup; it should load lazily in {where}")
+
+    for run, timing in time_startup(database_url).items():
+        problem = ""
+        if timing["ready"] != 200:
+            problem = f"/ready answered {timing['ready']}"
+        elif run == "restart" and timing["startup_ms"] > RESTART_BUDGET_MS:
+            problem = f"over budget ({RESTART_BUDGET_MS} ms)"
+        failures += bool(problem)
+        steps = ", ".join(f"{name} {ms:.0f}" for name, ms in timing["steps"].items())
+        print(f"{run:<15} startup {timing['startup_ms']:>6.0f} ms, warm-up {timing['warmup_ms']:>6.0f} ms ({steps})  {problem}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Load test: drives the app in-process through the main user flows and reports
+latency percentiles, throughput and SQL query counts per endpoint.
+
+Run from the backend folder:
+
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --scale medium --flows 5000 --concurrency 32 --output after.json --compare before.json
+    python -m benchmarks.load_test --mix search=80,booking=20
+    DB_ASYNC=true SEARCH_CACHE_SIZE=0 python -m benchmarks.load_test
+
+Seeds a fresh database (benchmarks/seed.py), then:
+  1. a serial pass runs every flow a few times and counts the queries each
+     endpoint issues (serial, so counts aren't mixed between requests);
+  2. a concurrent pass runs --flows flows picked by --mix weights from a pool
+     of --concurrency client threads, timing every request.
+Results go to --output as JSON; --compare prints the change against an
+earlier result file.
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+DEFAULT_MIX = "search=40,geo_search=8,match=8,my_bookings=10,notifications=12,booking=10,accept=6,login=4,signup=2"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.queries = {}
+
+    def add(self, endpoint: str, seconds: float, status: int, queries: int = None):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            codes = self.statuses.setdefault(endpoint, {})
+            codes[status] = codes.get(status, 0) + 1
+            if queries is not None:
+                self.queries.setdefault(endpoint, []).append(queries)
+
+
+class Flows:
+    """Each flow is one user action, made of one or more requests."""
+
+    def __init__(self, client, data, recorder: Recorder, seed: int):
+        from app.core.security import create_access_token
+
+        self.client = client
+        self.data = data
+        self.recorder = recorder
+        self.count_queries = False
+        self.rng = random.Random(seed)
+        self.pending = queue.Queue()
+        for item in data["pending_bookings"]:
+            self.pending.put(item)
+        self.tons_trips = [trip for trip in data["trips"] if trip[4] == "tons"]
+        self.cities = sorted({trip[2] for trip in data["trips"]})
+        self._signups = 0
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+        def token(user_id, email):
+            return {"Authorization": "Bearer " + create_access_token({"sub": email, "uid": user_id}, timedelta(hours=4))}
+        for role in ("owners", "customers"):
+            for user_id, email in data[role]:
+                self._tokens[user_id] = token(user_id, email)
+
+    def _call(self, endpoint: str, method: str, url: str, **kwargs):
+        from app.core.query_counter import count_queries
+
+        started = time.perf_counter()
+        if self.count_queries:
+            with count_queries() as queries:
+                response = self.client.request(method, url, **kwargs)
+            count = queries.count
+        else:
+            response = self.client.request(method, url, **kwargs)
+            count = None
+        self.recorder.add(endpoint, time.perf_counter() - started, response.status_code, count)
+        return response
+
+    def _customer(self):
+        user_id, email = self.rng.choice(self.data["customers"])
+        return user_id, email, self._tokens[user_id]
+
+    # --- flows ---
+
+    def search(self):
+        start, end = self.rng.sample(self.cities, 2)
+        _, _, headers = self._customer()
+        self._call("GET /trips/", "GET", "/trips/", params={"start_location": start, "end_location": end, "limit": 20}, headers=headers)
+
+    def geo_search(self):
+        from benchmarks.seed import CITIES
+        (_, slat, slon), (_, elat, elon) = self.rng.sample(CITIES, 2)
+        _, _, headers = self._customer()
+        params = {"pickup_lat": slat, "pickup_lon": slon, "drop_lat": elat, "drop_lon": elon, "radius_km": 30, "limit": 20}
+        self._call("GET /trips/ (geo)", "GET", "/trips/", params=params, headers=headers)
+
+    def match(self):
+        start, end = self.rng.sample(self.cities, 2)
+        _, _, headers = self._customer()
+        self._call("GET /trips/match", "GET", "/trips/match", params={"start_location": start, "end_location": end, "cargo_size": "1 tons"}, headers=headers)
+
+    def my_bookings(self):
+        _, _, headers = self._customer()
+        self._call("GET /bookings/", "GET", "/bookings/", params={"limit": 20}, headers=headers)
+
+    def notifications(self):
+        _, _, headers = self._customer()
+        self._call("GET /notifications/unread-count", "GET", "/notifications/unread-count", headers=headers)
+        self._call("GET /notifications/", "GET", "/notifications/", params={"limit": 20}, headers=headers)
+
+    def booking(self):
+        trip_id, owner_id, *_ = self.rng.choice(self.tons_trips)
+        _, _, headers = self._customer()
+        response = self._call("POST /bookings/", "POST", "/bookings/", json={"cargo_size": "1 tons", "total_price": 1000, "trip_id": trip_id}, headers=headers)
+        if response.status_code == 200:
+            self.pending.put((response.json()["id"], owner_id))
+
+    def accept(self):
+        try:
+            booking_id, owner_id = self.pending.get_nowait()
+        except queue.Empty:
+            return self.booking()
+        decision = "accepted" if self.rng.random() < 0.8 else "rejected"
+        self._call("PUT /bookings/{id}/status", "PUT", f"/bookings/{booking_id}/status", params={"status_update": decision}, headers=self._tokens[owner_id])
+
+    def login(self):
+        from benchmarks.seed import PASSWORD
+        _, email, _ = self._customer()
+        self._call("POST /auth/token", "POST", "/auth/token", data={"username": email, "password": PASSWORD})
+
+    def signup(self):
+        with self._lock:
+            self._signups += 1
+            email = f"load{self._signups}-{os.getpid()}@bench.local"
+        self._call("POST /auth/signup", "POST", "/auth/signup", json={"email": email, "password": "load", "role": "customer"})
+        self._call("POST /auth/token", "POST", "/auth/token", data={"username": email, "password": "load"})
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if not hasattr(Flows, name.strip()):
+            raise SystemExit(f"Unknown flow {name!r}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        statuses = recorder.statuses[endpoint]
+        queries = recorder.queries.get(endpoint)
+        endpoints[endpoint] = {
+            "requests": len(latencies),
+            "errors": sum(n for code, n in statuses.items() if code >= 500),
+            "statuses": {str(code): n for code, n in sorted(statuses.items())},
+            "throughput_rps": len(latencies) / elapsed,
+            "mean_ms": sum(latencies) / len(latencies) * 1000,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies) * 1000,
+            "queries_per_request": sum(queries) / len(queries) if queries else None,
+        }
+    return endpoints
+
+
+def print_table(endpoints: dict, baseline: dict = None):
+    header = f"{'endpoint':<34} {'reqs':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, row in endpoints.items():
+        queries = "" if row["queries_per_request"] is None else f"{row['queries_per_request']:.1f}"
+        line = (f"{endpoint:<34} {row['requests']:>6} {row['throughput_rps']:>8.1f} {row['p50_ms']:>8.2f} "
+                f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {queries:>7}")
+        old = (baseline or {}).get(endpoint)
+        if old:
+            change = lambda key: (row[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            line += f"   p50 {change('p50_ms'):+.0f}%  p95 {change('p95_ms'):+.0f}%  rps {change('throughput_rps'):+.0f}%"
+            if row["queries_per_request"] is not None and old.get("queries_per_request") is not None \
+                    and row["queries_per_request"] != old["queries_per_request"]:
+                line += f"  queries {old['queries_per_request']:.1f} -> {row['queries_per_request']:.1f}"
+        print(line)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    from benchmarks.seed import add_scale_arguments, scale_from_args
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Run against a server database instead of a temporary SQLite file")
+    add_scale_arguments(parser)
+    parser.add_argument("--flows", type=int, default=2000, help="Flows in the concurrent pass")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Flow weights, e.g. search=80,booking=20")
+    parser.add_argument("--query-samples", type=int, default=5, help="Runs per flow in the serial query-count pass")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--compare", help="Earlier JSON result to compare against")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(tmp, "load.db")
+    # Every simulated user shares the test client's address
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    import logging
+    from fastapi.testclient import TestClient
+    from app.core import database
+    from app.core.config import settings
+    from app.main import app
+    from benchmarks.seed import seed
+
+    from app.core import notification_service
+
+    # Per-request notification logging would dominate the output
+    notification_service.logger.setLevel(logging.WARNING)
+
+    scale = scale_from_args(args)
+    started = time.perf_counter()
+    data = seed(database.engine, **scale, seed=args.seed)
+    print(f"Seeded {scale} in {time.perf_counter() - started:.1f}s")
+
+    recorder = Recorder()
+    # One client for the whole run, so the async engine (if used) stays on one event loop
+    with TestClient(app) as client:
+        flows = Flows(client, data, recorder, args.seed)
+
+        flows.count_queries = True
+        for name in mix:
+            for _ in range(args.query_samples):
+                getattr(flows, name)()
+        flows.count_queries = False
+        queries = recorder.queries
+        recorder = flows.recorder = Recorder()
+        recorder.queries = queries
+
+        names, weights = list(mix), list(mix.values())
+        picks = random.Random(args.seed).choices(names, weights, k=args.flows)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda name: getattr(flows, name)(), picks))
+        elapsed = time.perf_counter() - started
+
+    endpoints = summarize(recorder, elapsed)
+    total = sum(row["requests"] for row in endpoints.values())
+    result = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_revision": git_revision(),
+            "database": database.engine.url.get_backend_name(),
+            "db_async": settings.DB_ASYNC,
+            "scale": scale,
+            "flows": args.flows,
+            "concurrency": args.concurrency,
+            "mix": mix,
+        },
+        "total": {"requests": total, "elapsed_s": elapsed, "throughput_rps": total / elapsed},
+        "endpoints": endpoints,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["endpoints"]
+    print()
+    print_table(endpoints, baseline)
+    print(f"\n{total} requests in {elapsed:.2f}s: {total / elapsed:.1f} req/s overall")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
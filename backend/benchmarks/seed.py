@@ -0,0 +1,194 @@
+"""
+Synthetic data at configurable scale: owners, vehicles, trips, customers,
+bookings and notifications, spread over real Indian cities with coordinates.
+
+Run from the backend folder:
+
+    python -m benchmarks.seed --scale medium --database-url sqlite:///./bench.db
+    python -m benchmarks.seed --owners 500 --customers 5000 --trips-per-vehicle 40
+
+Everyone's password is "bench". Rows go in with multi-row INSERTs, and the
+admin counters are filled in to match. The target database is wiped first.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert
+from sqlmodel import SQLModel, Session
+
+from app.core.matching import prepare_trip
+from app.core.security import get_password_hash
+from app.core.stats_service import bump_counters, _value
+from app.models.booking import Booking, BookingStatus
+from app.models.notification import Notification, NotificationCounter
+from app.models.trip import Trip
+from app.models.user import User, Role
+from app.models.vehicle import Vehicle
+
+PASSWORD = "bench"
+BATCH_SIZE = 1000
+
+SCALES = {
+    "small": dict(owners=10, vehicles_per_owner=2, trips_per_vehicle=10, customers=50, bookings_per_trip=1.0, notifications_per_user=5),
+    "medium": dict(owners=100, vehicles_per_owner=2, trips_per_vehicle=20, customers=1000, bookings_per_trip=1.5, notifications_per_user=20),
+    "large": dict(owners=1000, vehicles_per_owner=3, trips_per_vehicle=30, customers=20000, bookings_per_trip=2.0, notifications_per_user=50),
+}
+
+CITIES = [
+    ("Mumbai, Maharashtra", 19.076, 72.878), ("Pune, Maharashtra", 18.520, 73.857),
+    ("Delhi", 28.614, 77.209), ("Bengaluru, Karnataka", 12.972, 77.595),
+    ("Hyderabad, Telangana", 17.385, 78.487), ("Chennai, Tamil Nadu", 13.083, 80.271),
+    ("Ahmedabad, Gujarat", 23.023, 72.571), ("Kolkata, West Bengal", 22.573, 88.364),
+    ("Jaipur, Rajasthan", 26.912, 75.787), ("Nagpur, Maharashtra", 21.146, 79.088),
+    ("Nashik, Maharashtra", 19.998, 73.790), ("Surat, Gujarat", 21.170, 72.831),
+    ("Indore, Madhya Pradesh", 22.720, 75.858), ("Lucknow, Uttar Pradesh", 26.847, 80.947),
+]
+VEHICLES = [("Truck", "10 tons"), ("Truck", "20 tons"), ("Mini Truck", "2 tons"), ("Van", "500 sq ft"), ("Container", "30 m3")]
+CARGO = {"tons": ["1 tons", "2 tons", "5 tons"], "sq ft": ["50 sq ft", "100 sq ft"], "m3": ["2 m3", "5 m3"]}
+
+
+def _insert(session: Session, model, rows: List[dict]) -> List[int]:
+    ids = []
+    for i in range(0, len(rows), BATCH_SIZE):
+        ids.extend(session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True), rows[i:i + BATCH_SIZE]
+        ).all())
+    return ids
+
+
+def seed(engine, owners: int, vehicles_per_owner: int, trips_per_vehicle: int, customers: int,
+         bookings_per_trip: float, notifications_per_user: int, seed: int = 1) -> Dict[str, list]:
+    """
+    Wipe and fill the database. Returns what a load test needs to address the
+    data: (id, email) per user by role, (id, owner id, start, end, unit) per
+    trip, and (booking id, owner id) per pending booking.
+    """
+    rng = random.Random(seed)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    hashed = get_password_hash(PASSWORD)
+    now = datetime.utcnow()
+
+    with Session(engine) as session:
+        users = [dict(email="admin@bench.local", full_name="Bench Admin", role=Role.ADMIN, is_verified=True, hashed_password=hashed)]
+        users += [dict(email=f"owner{i}@bench.local", full_name=f"Owner {i}", phone=f"90000{i:05d}", role=Role.OWNER,
+                       is_verified=rng.random() < 0.8, hashed_password=hashed) for i in range(owners)]
+        users += [dict(email=f"customer{i}@bench.local", full_name=f"Customer {i}", phone=f"80000{i:05d}", role=Role.CUSTOMER,
+                       is_verified=True, hashed_password=hashed) for i in range(customers)]
+        user_ids = _insert(session, User, users)
+        admin_id, owner_ids, customer_ids = user_ids[0], user_ids[1:owners + 1], user_ids[owners + 1:]
+
+        vehicles, vehicle_owner = [], []
+        for n, owner_id in enumerate(owner_ids):
+            for k in range(vehicles_per_owner):
+                kind, capacity = rng.choice(VEHICLES)
+                vehicles.append(dict(type=kind, capacity=capacity, registration_number=f"BN-{n:05d}-{k}", owner_id=owner_id))
+                vehicle_owner.append(owner_id)
+        vehicle_ids = _insert(session, Vehicle, vehicles)
+
+        trips, trip_meta = [], []
+        for vehicle, vehicle_id, owner_id in zip(vehicles, vehicle_ids, vehicle_owner):
+            for _ in range(trips_per_vehicle):
+                (start, slat, slon), (end, elat, elon) = rng.sample(CITIES, 2)
+                trip = prepare_trip(Trip(
+                    start_location=start, end_location=end,
+                    start_datetime=now + timedelta(hours=rng.randint(1, 24 * 60)),
+                    available_capacity=vehicle["capacity"], price_per_unit=rng.choice([500, 800, 1000, 1500, 2500]),
+                    start_lat=slat + rng.gauss(0, 0.05), start_lon=slon + rng.gauss(0, 0.05),
+                    end_lat=elat + rng.gauss(0, 0.05), end_lon=elon + rng.gauss(0, 0.05),
+                    vehicle_id=vehicle_id,
+                ))
+                trips.append(trip.dict(exclude={"id"}))
+                trip_meta.append((owner_id, start, end, vehicle["capacity"].split(" ", 1)[1]))
+        trip_ids = _insert(session, Trip, trips)
+
+        # Bookings are recorded as accepted/rejected history or pending
+        # requests; capacity isn't reserved for them, so trips stay bookable
+        bookings, booking_owner, pending = [], [], []
+        for trip_id, (owner_id, _, _, unit) in zip(trip_ids, trip_meta):
+            count = int(bookings_per_trip) + (rng.random() < bookings_per_trip % 1)
+            waiting = set() # customers with a pending booking of this trip; there can only be one
+            for _ in range(count):
+                status = rng.choice([BookingStatus.PENDING, BookingStatus.ACCEPTED, BookingStatus.REJECTED])
+                customer_id = rng.choice(customer_ids)
+                if status == BookingStatus.PENDING and customer_id in waiting:
+                    status = BookingStatus.REJECTED
+                elif status == BookingStatus.PENDING:
+                    waiting.add(customer_id)
+                bookings.append(dict(
+                    cargo_size=rng.choice(CARGO.get(unit, ["1 tons"])), total_price=rng.randint(500, 20000), status=status,
+                    booking_reference=f"BK-S{len(bookings):09d}", trip_id=trip_id, customer_id=customer_id,
+                ))
+                booking_owner.append(owner_id)
+        booking_ids = _insert(session, Booking, bookings)
+        for booking_id, booking, owner_id in zip(booking_ids, bookings, booking_owner):
+            if booking["status"] == BookingStatus.PENDING:
+                pending.append((booking_id, owner_id))
+
+        notifications = []
+        for user_id in owner_ids + customer_ids:
+            for k in range(notifications_per_user):
+                notifications.append(dict(
+                    user_id=user_id, message=f"Synthetic notification {k}", is_read=rng.random() < 0.7,
+                    created_at=now - timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+                ))
+        _insert(session, Notification, notifications)
+        unread = Counter(n["user_id"] for n in notifications if not n["is_read"])
+        if unread:
+            session.execute(insert(NotificationCounter), [dict(user_id=u, unread=n) for u, n in unread.items()])
+
+        # Multi-row INSERTs skip the flush hooks that keep the admin (and above, unread) counters
+        counters = Counter({"users.total": len(users), "trips.total": len(trips), "bookings.total": len(bookings)})
+        counters.update(f"users.role.{_value(user['role'])}" for user in users)
+        counters.update(f"trips.status.{trip['status']}" for trip in trips)
+        counters.update(f"bookings.status.{_value(booking['status'])}" for booking in bookings)
+        bump_counters(session.connection(), counters)
+        session.commit()
+
+    return {
+        "admin": [(admin_id, "admin@bench.local")],
+        "owners": [(user_id, users[i + 1]["email"]) for i, user_id in enumerate(owner_ids)],
+        "customers": [(user_id, users[i + owners + 1]["email"]) for i, user_id in enumerate(customer_ids)],
+        "trips": [(trip_id, *meta) for trip_id, meta in zip(trip_ids, trip_meta)],
+        "pending_bookings": pending,
+    }
+
+
+def add_scale_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    for name in SCALES["small"]:
+        parser.add_argument("--" + name.replace("_", "-"), type=float if name == "bookings_per_trip" else int,
+                            help=f"Override the scale preset's {name}")
+
+
+def scale_from_args(args) -> dict:
+    scale = dict(SCALES[args.scale])
+    for name in scale:
+        if getattr(args, name) is not None:
+            scale[name] = getattr(args, name)
+    return scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    from app.core.config import Settings
+    from app.core.database import create_db_engine
+
+    scale = scale_from_args(args)
+    started = time.perf_counter()
+    info = seed(create_db_engine(Settings(DATABASE_URL=args.database_url)), **scale)
+    print(f"Seeded {len(info['owners'])} owners, {len(info['customers'])} customers, {len(info['trips'])} trips, "
+          f"{len(info['pending_bookings'])} pending bookings in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,6 +30,20 @@ def create_admin_user(email, password, full_name="Admin User"):
         session.refresh(user)
         print(f"Admin user {user.email} successfully created/updated.")
 
+def ensure_admin_user(email, password, full_name="Admin User"):
+    """
+    Create the admin if no user has that email yet. Unlike create_admin_user,
+    an existing user is left alone: no rehash, no password reset on every boot.
+    """
+    with Session(engine) as session:
+        if session.exec(select(User.id).where(User.email == email)).first() is not None:
+            return False
+    create_admin_user(email, password, full_name)
+    return True
+
+# Created on first start for deployment convenience (see migrate.py)
+DEFAULT_ADMIN = ("admin@example.com", "admin123", "System Admin")
+
 if __name__ == "__main__":
     if len(sys.argv) < 3:
         print("Usage: python create_admin.py <email> <password> [full_name]")
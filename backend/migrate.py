@@ -0,0 +1,19 @@
+"""
+Apply pending schema migrations (see app/core/migrations.py) and create the
+default admin if it doesn't exist yet. Run before starting the app, as
+render.yaml does:
+
+    python migrate.py
+"""
+import logging
+
+from app.core.database import engine
+from app.core.migrations import HEAD, migrate
+from create_admin import DEFAULT_ADMIN, ensure_admin_user
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    applied = migrate(engine)
+    print(f"Schema at version {HEAD}; applied: {', '.join(applied) or 'nothing'}.")
+    if ensure_admin_user(*DEFAULT_ADMIN):
+        print("Default admin created.")
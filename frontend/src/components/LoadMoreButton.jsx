@@ -0,0 +1,29 @@
+import React, { useState } from 'react';
+
+// Shown under a paged list while the server says there is more (X-Next-Cursor)
+export default function LoadMoreButton({ cursor, onLoadMore }) {
+    const [loading, setLoading] = useState(false);
+
+    if (!cursor) return null;
+
+    const handleClick = async () => {
+        setLoading(true);
+        try {
+            await onLoadMore(cursor);
+        } finally {
+            setLoading(false);
+        }
+    };
+
+    return (
+        <div className="flex justify-center mt-6">
+            <button
+                onClick={handleClick}
+                disabled={loading}
+                className="px-6 py-2 border border-gray-300 shadow-sm text-sm font-medium rounded-lg text-gray-700 bg-white hover:bg-gray-50 disabled:opacity-50 transition-colors"
+            >
+                {loading ? 'Loading...' : 'Load more'}
+            </button>
+        </div>
+    );
+}
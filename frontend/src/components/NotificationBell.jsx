@@ -13,27 +13,68 @@ export default function NotificationBell() {
     useEffect(() => {
         if (!user) return;
 
+        let source = null;
+        let retry = null;
+        let lastId = null;
+        let closed = false;
+
         const fetchNotifications = async () => {
             try {
-                const res = await api.get('/notifications/');
-                const unread = res.data.filter(n => !n.is_read);
+                const res = await api.get('/notifications/', { params: { limit: 50 } });
                 setNotifications(res.data);
-                setHasNew(unread.length > 0);
-
-                // Show toast for new unread messages if just loaded
-                if (unread.length > 0) {
-                    // In a real polling, we'd track 'last processed' to avoid repetitive toasts, 
-                    // but for this demo instant toast is fine
-                }
+                // Newest first; the stream resumes after it
+                if (res.data.length && (lastId === null || res.data[0].id > lastId)) lastId = res.data[0].id;
+                setHasNew(res.data.some(n => !n.is_read));
             } catch (error) {
-                console.error("Poll failed", error);
+                console.error("Fetch notifications failed", error);
             }
         };
 
         fetchNotifications();
-        // Poll every 5 seconds
-        const interval = setInterval(fetchNotifications, 5000);
-        return () => clearInterval(interval);
+
+        // New notifications are pushed by the server (Server-Sent Events).
+        // EventSource can't send the Authorization header, so the stream is
+        // opened with a short-lived stream token instead. That token is only
+        // good for a minute, so on any error we reconnect ourselves with a
+        // fresh one and ?last_id= for whatever we missed meanwhile.
+        const connect = async () => {
+            try {
+                const res = await api.post('/notifications/stream-token');
+                if (closed) return;
+                const params = new URLSearchParams({ stream_token: res.data.stream_token });
+                if (lastId !== null) params.set('last_id', lastId);
+                source = new EventSource(`${api.defaults.baseURL}/notifications/stream?${params}`);
+                source.addEventListener('notification', (event) => {
+                    const notification = JSON.parse(event.data);
+                    lastId = notification.id;
+                    setNotifications(prev => prev.some(n => n.id === notification.id) ? prev : [notification, ...prev]);
+                    setHasNew(true);
+                    toast(notification.message);
+                });
+                source.onerror = (error) => {
+                    console.error("Notification stream error", error);
+                    reconnect();
+                };
+            } catch (error) {
+                console.error("Notification stream token failed", error);
+                reconnect();
+            }
+        };
+
+        const reconnect = () => {
+            if (source) source.close();
+            source = null;
+            if (!closed && retry === null) {
+                retry = setTimeout(() => { retry = null; connect(); }, 3000);
+            }
+        };
+
+        connect();
+        return () => {
+            closed = true;
+            clearTimeout(retry);
+            if (source) source.close();
+        };
     }, [user]);
 
     const markAsRead = async (id) => {
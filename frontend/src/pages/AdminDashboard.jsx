@@ -1,11 +1,13 @@
 import React, { useState, useEffect } from 'react';
-import api from '../services/api';
+import api, { getPage } from '../services/api';
+import LoadMoreButton from '../components/LoadMoreButton';
 import toast from 'react-hot-toast';
 import { motion } from 'framer-motion';
 
 export default function AdminDashboard() {
     const [stats, setStats] = useState({ total_users: 0, total_trips: 0, total_bookings: 0 });
     const [users, setUsers] = useState([]);
+    const [usersCursor, setUsersCursor] = useState(null); // Next page of users, if any
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
@@ -16,8 +18,9 @@ export default function AdminDashboard() {
         try {
             const sRes = await api.get('/admin/stats');
             setStats(sRes.data);
-            const uRes = await api.get('/admin/users');
-            setUsers(uRes.data);
+            const uPage = await getPage('/admin/users');
+            setUsers(uPage.items);
+            setUsersCursor(uPage.nextCursor);
             setLoading(false);
         } catch (error) {
             console.error(error);
@@ -26,6 +29,16 @@ export default function AdminDashboard() {
         }
     };
 
+    const loadMoreUsers = async (cursor) => {
+        try {
+            const page = await getPage('/admin/users', {}, cursor);
+            setUsers(prev => [...prev, ...page.items]);
+            setUsersCursor(page.nextCursor);
+        } catch (error) {
+            toast.error('Failed to load more users');
+        }
+    };
+
     const verifyUser = async (userId) => {
         try {
             await api.put(`/admin/users/${userId}/verify`);
@@ -160,6 +173,11 @@ export default function AdminDashboard() {
                             </tbody>
                         </table>
                     </div>
+                    {usersCursor && (
+                        <div className="pb-6">
+                            <LoadMoreButton cursor={usersCursor} onLoadMore={loadMoreUsers} />
+                        </div>
+                    )}
                 </motion.div>
             </div>
         </div>
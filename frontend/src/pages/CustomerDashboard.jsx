@@ -1,12 +1,16 @@
 import React, { useState, useEffect } from 'react';
-import api from '../services/api';
+import api, { getPage } from '../services/api';
+import LoadMoreButton from '../components/LoadMoreButton';
 import toast from 'react-hot-toast';
 
 export default function CustomerDashboard() {
     const [activeTab, setActiveTab] = useState('search');
     const [searchParams, setSearchParams] = useState({ start_location: '', end_location: '' });
     const [searchResults, setSearchResults] = useState([]);
+    const [searchCursor, setSearchCursor] = useState(null); // Next page of results, if any
+    const [lastSearch, setLastSearch] = useState({}); // What those results are for
     const [myBookings, setMyBookings] = useState([]);
+    const [bookingsCursor, setBookingsCursor] = useState(null);
     const [bookingFormData, setBookingFormData] = useState({ cargo_size: '', total_price: '' });
     const [selectedTrip, setSelectedTrip] = useState(null); // For booking modal
     const [loading, setLoading] = useState(true);
@@ -17,8 +21,9 @@ export default function CustomerDashboard() {
 
     const fetchBookings = async () => {
         try {
-            const res = await api.get('/bookings');
-            setMyBookings(res.data);
+            const page = await getPage('/bookings');
+            setMyBookings(page.items);
+            setBookingsCursor(page.nextCursor);
             setLoading(false);
         } catch (error) {
             console.error(error);
@@ -31,15 +36,38 @@ export default function CustomerDashboard() {
         e.preventDefault();
         try {
             const { start_location, end_location } = searchParams;
-            const res = await api.get('/trips', { params: { start_location, end_location } });
-            setSearchResults(res.data);
-            if (res.data.length === 0) toast.error('No trips found');
-            else toast.success(`Found ${res.data.length} trips`);
+            const page = await getPage('/trips', { start_location, end_location });
+            setLastSearch({ start_location, end_location });
+            setSearchResults(page.items);
+            setSearchCursor(page.nextCursor);
+            if (page.items.length === 0) toast.error('No trips found');
+            else toast.success(page.nextCursor ? `Found ${page.items.length}+ trips` : `Found ${page.items.length} trips`);
         } catch (error) {
             toast.error('Search failed');
         }
     };
 
+    const loadMoreTrips = async (cursor) => {
+        try {
+            // The search that was run, not what's in the form now
+            const page = await getPage('/trips', lastSearch, cursor);
+            setSearchResults(prev => [...prev, ...page.items]);
+            setSearchCursor(page.nextCursor);
+        } catch (error) {
+            toast.error('Failed to load more trips');
+        }
+    };
+
+    const loadMoreBookings = async (cursor) => {
+        try {
+            const page = await getPage('/bookings', {}, cursor);
+            setMyBookings(prev => [...prev, ...page.items]);
+            setBookingsCursor(page.nextCursor);
+        } catch (error) {
+            toast.error('Failed to load more bookings');
+        }
+    };
+
     const initBooking = (trip) => {
         setSelectedTrip(trip);
         // Auto-calculate suggested price? For now manual.
@@ -165,6 +193,7 @@ export default function CustomerDashboard() {
                                             ))}
                                         </div>
                                     )}
+                                    <LoadMoreButton cursor={searchCursor} onLoadMore={loadMoreTrips} />
                                 </section>
                             </div>
                         )}
@@ -202,6 +231,7 @@ export default function CustomerDashboard() {
                                         </li>
                                     ))}
                                 </ul>
+                                <LoadMoreButton cursor={bookingsCursor} onLoadMore={loadMoreBookings} />
                             </div>
                         )}
                     </div>
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
-import api from '../services/api';
+import api, { getAllPages, getPage } from '../services/api';
+import LoadMoreButton from '../components/LoadMoreButton';
 import toast from 'react-hot-toast';
 
 export default function OwnerDashboard() {
@@ -7,6 +8,7 @@ export default function OwnerDashboard() {
     const [vehicles, setVehicles] = useState([]);
     const [trips, setTrips] = useState([]);
     const [bookings, setBookings] = useState([]); // Bookings on MY trips
+    const [bookingsCursor, setBookingsCursor] = useState(null); // Next page of them, if any
     const [loading, setLoading] = useState(true);
 
     // Forms state
@@ -19,12 +21,13 @@ export default function OwnerDashboard() {
 
     const fetchData = async () => {
         try {
-            const vRes = await api.get('/vehicles');
-            setVehicles(vRes.data);
+            // The trip form picks from all of them, so every page
+            setVehicles(await getAllPages('/vehicles'));
             const tRes = await api.get('/trips/my-trips');
             setTrips(tRes.data);
-            const bRes = await api.get('/bookings'); // As owner, returns bookings for my trips
-            setBookings(bRes.data);
+            const bPage = await getPage('/bookings'); // As owner, returns bookings for my trips
+            setBookings(bPage.items);
+            setBookingsCursor(bPage.nextCursor);
             setLoading(false);
         } catch (error) {
             console.error(error);
@@ -32,6 +35,16 @@ export default function OwnerDashboard() {
         }
     };
 
+    const loadMoreBookings = async (cursor) => {
+        try {
+            const page = await getPage('/bookings', {}, cursor);
+            setBookings(prev => [...prev, ...page.items]);
+            setBookingsCursor(page.nextCursor);
+        } catch (error) {
+            toast.error('Failed to load more bookings');
+        }
+    };
+
     const handleAddVehicle = async (e) => {
         e.preventDefault();
         try {
@@ -226,6 +239,7 @@ export default function OwnerDashboard() {
                                         </li>
                                     ))}
                                 </ul>
+                                <LoadMoreButton cursor={bookingsCursor} onLoadMore={loadMoreBookings} />
                             </div>
                         )}
                     </div>
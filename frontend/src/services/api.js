@@ -19,4 +19,24 @@ api.interceptors.request.use(
     (error) => Promise.reject(error)
 );
 
+// List endpoints return one page at a time (PAGE_SIZE_DEFAULT rows unless
+// ?limit= says otherwise); the cursor for the next page comes back in the
+// X-Next-Cursor header, which is absent on the last page.
+export const getPage = async (url, params = {}, cursor = null) => {
+    const res = await api.get(url, { params: cursor ? { ...params, cursor } : params });
+    return { items: res.data, nextCursor: res.headers['x-next-cursor'] || null };
+};
+
+// Every page, for short lists a form needs in full (e.g. an owner's vehicles)
+export const getAllPages = async (url, params = {}) => {
+    let items = [];
+    let cursor = null;
+    do {
+        const page = await getPage(url, params, cursor);
+        items = items.concat(page.items);
+        cursor = page.nextCursor;
+    } while (cursor);
+    return items;
+};
+
 export default api;